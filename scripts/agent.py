@@ -0,0 +1,416 @@
+#!/usr/bin/env python3
+"""
+Warm local provisioning agent reachable over a Unix socket.
+
+Each lab step normally pays interpreter start, imports, config parsing,
+CSP sign-in/account switch, TLS handshakes and boto3 client creation
+before its first real API call. The agent is one long-running process
+that keeps all of that warm and runs the existing scripts in-process
+when they are invoked through their normal names (see agent_client.py):
+
+  - requests / boto3 / botocore / yaml and the shared modules stay imported
+  - every ApiSession shares one connection pool, so TLS connections to
+    CSP and the broker are reused across steps
+  - sign-in and account-switch responses are reused until the JWT nears
+    expiry (keyed by the exact credentials / token and target account)
+  - realm / block / pool lookups by name are cached and invalidated by
+    any write to the same collection or to one of its objects
+  - boto3 clients are cached per service, region and AWS credential env
+  - config.yaml parses are cached by content
+
+Steps run one at a time (they chdir, read files and set environment), so
+a step's latency is roughly its remote API time alone.
+
+Usage:
+  python3 agent.py start [--idle-timeout 3600]   # foreground; use nohup/& to background
+  python3 agent.py status
+  python3 agent.py stop
+
+  # Then run the scripts exactly as before:
+  python3 deploy_ipam.py
+  python3 create_federated_pool.py
+
+Environment Variables:
+  AGENT_SOCKET  - Unix socket path (default: /tmp/ipam-uddi-agent-<uid>.sock)
+"""
+
+import os
+import re
+import sys
+import copy
+import glob
+import json
+import time
+import runpy
+import socket
+import argparse
+import threading
+from urllib.parse import urlparse
+
+import yaml
+import boto3
+import requests
+from requests.adapters import HTTPAdapter
+
+import agent_client
+import cassette
+import http_session
+import rate_governor
+from http_session import ApiSession
+
+SCRIPTS_DIR = os.path.dirname(os.path.abspath(__file__))
+AUTH_TTL = 45 * 60
+LOOKUP_TTL = 300
+LOOKUP_KINDS = ("federated_realm", "federated_block", "federated_pool")
+# A collection or one object in it: .../federation/<kind>[/<id>]
+_LOOKUP_PATH = re.compile(r"/federation/(%s)(?:/[^/]+)?$" % "|".join(LOOKUP_KINDS))
+AWS_CREDENTIAL_ENV = ("AWS_ACCESS_KEY_ID", "AWS_SECRET_ACCESS_KEY", "AWS_SESSION_TOKEN", "AWS_PROFILE")
+
+
+class WarmState:
+    """Caches shared by every script run in the agent."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.adapter = HTTPAdapter(pool_connections=16, pool_maxsize=32)
+        self.auth = {}          # (url, auth header, body) -> (response, stored_at)
+        self.lookups = {}       # (kind, url, params, auth header) -> (response, stored_at)
+        self.configs = {}       # yaml text -> parsed
+        self.clients = {}       # (service, region, endpoint, credential env) -> boto3 client
+        self.hits = {"auth": 0, "lookup": 0, "config": 0, "boto3": 0}
+
+    # --- HTTP ---
+
+    def _auth_key(self, method, url, kwargs):
+        path = urlparse(url).path
+        if method.upper() != "POST" or path not in ("/v2/session/users/sign_in", "/v2/session/account_switch"):
+            return None
+        headers = kwargs.get("headers") or {}
+        return (url, headers.get("Authorization"), json.dumps(kwargs.get("json"), sort_keys=True))
+
+    def _lookup_kind(self, url):
+        """Kind of a federation collection or object URL, else None."""
+        m = _LOOKUP_PATH.search(urlparse(url).path.rstrip("/"))
+        return m.group(1) if m else None
+
+    def request(self, send, session, method, url, *args, **kwargs):
+        now = time.monotonic()
+        auth_key = self._auth_key(method, url, kwargs)
+        if auth_key:
+            with self.lock:
+                cached = self.auth.get(auth_key)
+                if cached and now - cached[1] < AUTH_TTL:
+                    self.hits["auth"] += 1
+                    return cached[0]
+            response = send(session, method, url, *args, **kwargs)
+            if response.ok:
+                response.content  # read now so the cached response can be replayed
+                with self.lock:
+                    self.auth[auth_key] = (response, now)
+            return response
+
+        kind = self._lookup_kind(url)
+        if kind is None:
+            return send(session, method, url, *args, **kwargs)
+        if method.upper() != "GET":
+            with self.lock:
+                self.lookups = {k: v for k, v in self.lookups.items() if k[0] != kind}
+            return send(session, method, url, *args, **kwargs)
+
+        params = kwargs.get("params") or {}
+        if "_filter" not in params or "name==" not in str(params.get("_filter")):
+            return send(session, method, url, *args, **kwargs)
+        key = (kind, url, json.dumps(params, sort_keys=True), (kwargs.get("headers") or {}).get("Authorization"))
+        with self.lock:
+            cached = self.lookups.get(key)
+            if cached and now - cached[1] < LOOKUP_TTL:
+                self.hits["lookup"] += 1
+                return cached[0]
+        response = send(session, method, url, *args, **kwargs)
+        if response.ok and response.json().get("results"):
+            with self.lock:
+                self.lookups[key] = (response, now)
+        return response
+
+    # --- Config / boto3 ---
+
+    def safe_load(self, load, stream):
+        if not isinstance(stream, str):
+            return load(stream)
+        with self.lock:
+            if stream in self.configs:
+                self.hits["config"] += 1
+                return copy.deepcopy(self.configs[stream])
+        parsed = load(stream)
+        with self.lock:
+            self.configs[stream] = parsed
+        return copy.deepcopy(parsed)
+
+    def client(self, create, service, *args, **kwargs):
+        # Only share clients built from the default credential chain
+        if args or any(k.startswith("aws_") for k in kwargs):
+            return create(service, *args, **kwargs)
+        # Scripts run with each participant's environment: never hand one
+        # participant's credentials to another
+        credentials = tuple(os.environ.get(k) for k in AWS_CREDENTIAL_ENV)
+        key = (service, kwargs.get("region_name") or os.environ.get("AWS_DEFAULT_REGION"), kwargs.get("endpoint_url"),
+               credentials)
+        with self.lock:
+            if key in self.clients:
+                self.hits["boto3"] += 1
+                return self.clients[key]
+        client = create(service, **kwargs)
+        with self.lock:
+            return self.clients.setdefault(key, client)
+
+
+def install(state):
+    """Route the shared HTTP layer, yaml and boto3 through the warm caches."""
+    agent_client.IN_AGENT = True
+
+    original_init = ApiSession.__init__
+    original_request = ApiSession.request
+
+    def init(session, *args, **kwargs):
+        original_init(session, *args, **kwargs)
+        session.mount("https://", state.adapter)
+        session.mount("http://", state.adapter)
+
+    def request(session, method, url, *args, **kwargs):
+        return state.request(original_request, session, method, url, *args, **kwargs)
+
+    ApiSession.__init__ = init
+    ApiSession.request = request
+
+    load = yaml.safe_load
+    yaml.safe_load = lambda stream: state.safe_load(load, stream)
+    create = boto3.client
+    boto3.client = lambda service, *args, **kwargs: state.client(create, service, *args, **kwargs)
+
+
+def source_mtime():
+    return max(os.path.getmtime(p) for p in glob.glob(os.path.join(SCRIPTS_DIR, "*.py")))
+
+
+class _Stream:
+    """File-like object that forwards writes to the client as frames."""
+
+    def __init__(self, sock_file, key):
+        self.sock_file = sock_file
+        self.key = key
+        self.closed = False
+
+    def write(self, text):
+        if text and not self.closed:
+            try:
+                self.sock_file.write(json.dumps({self.key: text}) + "\n")
+                self.sock_file.flush()
+            except OSError:
+                self.closed = True  # client went away; let the step finish
+        return len(text)
+
+    def flush(self):
+        pass
+
+    def isatty(self):
+        return False
+
+
+class Agent:
+    def __init__(self, path, idle_timeout=3600):
+        self.path = path
+        self.idle_timeout = idle_timeout
+        self.state = WarmState()
+        self.started_at = time.time()
+        self.loaded_mtime = source_mtime()
+        self.runs = 0
+        self.run_lock = threading.Lock()
+        self.last_used = time.monotonic()
+        self.stopping = threading.Event()
+
+    def warm_up(self):
+        """Pay the one-off costs up front: imports, config, boto3, TLS, sign-in."""
+        start = time.monotonic()
+        import csp_auth, idempotency, rate_governor, sandbox_api  # noqa: F401
+        region = os.environ.get("AWS_DEFAULT_REGION", "eu-west-1")
+        try:
+            boto3.client("ec2", region_name=region)
+        except Exception as e:
+            print(f"⚠️ boto3 warm-up skipped: {e}", flush=True)
+
+        config_file = os.path.join(os.getcwd(), "config.yaml")
+        if os.path.exists(config_file):
+            from deploy_ipam import load_config_with_env
+            config = load_config_with_env(config_file)
+            if "<MISSING" not in f"{config.get('email')}{config.get('password')}":
+                try:
+                    session = ApiSession()
+                    r = session.post(f"{config['base_url']}/v2/session/users/sign_in",
+                                     json={"email": config["email"], "password": config["password"]})
+                    print(f"🔐 Pre-warmed CSP sign-in ({r.status_code})", flush=True)
+                except requests.RequestException as e:
+                    print(f"⚠️ Sign-in warm-up failed: {e}", flush=True)
+        print(f"🔥 Warm-up finished in {time.monotonic() - start:.1f}s", flush=True)
+
+    # --- Requests ---
+
+    def _run_script(self, request, out):
+        script = request["script"]
+        if os.path.dirname(script) != SCRIPTS_DIR:
+            out.write(json.dumps({"err": f"❌ Agent only runs scripts from {SCRIPTS_DIR}\n"}) + "\n")
+            out.write(json.dumps({"exit": 2}) + "\n")
+            return
+
+        with self.run_lock:
+            if source_mtime() > self.loaded_mtime:
+                out.write(json.dumps({"stale": True}) + "\n")
+                out.flush()
+                print("♻️ Scripts changed on disk, agent is stale — shutting down", flush=True)
+                self.stopping.set()
+                return
+
+            saved = (sys.argv, os.getcwd(), dict(os.environ), sys.stdout, sys.stderr)
+            code = 0
+            start = time.monotonic()
+            try:
+                sys.argv = [script] + request["argv"]
+                os.chdir(request["cwd"])
+                os.environ.clear()
+                os.environ.update(request["env"])
+                # Env-driven singletons are re-read with this run's environment
+                cassette.reset()
+                rate_governor.reset()
+                sys.stdout = _Stream(out, "out")
+                sys.stderr = _Stream(out, "err")
+                runpy.run_path(script, run_name="__main__")
+            except SystemExit as e:
+                code = e.code if isinstance(e.code, int) else (0 if e.code is None else 1)
+                if not isinstance(e.code, (int, type(None))):
+                    sys.stderr.write(f"{e.code}\n")
+            except BaseException as e:
+                import traceback
+                traceback.print_exc(file=sys.stderr)
+                code = 1
+            finally:
+                # What atexit would do for a standalone run, with this run's HTTP_STATS_FILE
+                try:
+                    http_session.dump_stats()
+                except OSError as e:
+                    sys.stderr.write(f"⚠️ Could not write HTTP stats: {e}\n")
+                sys.argv, cwd, env, sys.stdout, sys.stderr = saved
+                os.chdir(cwd)
+                os.environ.clear()
+                os.environ.update(env)
+                # Sessions are per run; do not keep them (and their stats) alive
+                del http_session._sessions[:]
+                cassette.reset()
+                rate_governor.reset()
+                self.runs += 1
+                self.last_used = time.monotonic()
+
+            print(f"▶️  {os.path.basename(script)} {' '.join(request['argv'])} → exit {code} "
+                  f"({time.monotonic() - start:.2f}s)", flush=True)
+        try:
+            out.write(json.dumps({"exit": code}) + "\n")
+            out.flush()
+        except OSError:
+            pass
+
+    def _status(self):
+        return {
+            "pid": os.getpid(),
+            "uptime_s": round(time.time() - self.started_at, 1),
+            "runs": self.runs,
+            "cache_hits": dict(self.state.hits),
+            "cached": {"auth": len(self.state.auth), "lookups": len(self.state.lookups),
+                       "boto3_clients": len(self.state.clients)},
+        }
+
+    def handle(self, conn):
+        with conn:
+            reader = conn.makefile("r", encoding="utf-8")
+            out = conn.makefile("w", encoding="utf-8")
+            line = reader.readline()
+            if not line:
+                return
+            request = json.loads(line)
+            command = request.get("command")
+            if command == "run":
+                self._run_script(request, out)
+            elif command == "status":
+                out.write(json.dumps(self._status()) + "\n")
+            elif command == "stop":
+                out.write(json.dumps({"stopping": True}) + "\n")
+                self.stopping.set()
+            out.flush()
+
+    # --- Lifecycle ---
+
+    def serve(self):
+        if os.path.exists(self.path):
+            if agent_client.send({"command": "status"}, timeout=2):
+                print(f"❌ An agent is already listening on {self.path}")
+                sys.exit(1)
+            os.remove(self.path)  # stale socket from a crashed agent
+
+        server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        old_umask = os.umask(0o077)  # socket is owner-only: requests carry credentials
+        try:
+            server.bind(self.path)
+        finally:
+            os.umask(old_umask)
+        server.listen(64)
+        server.settimeout(1.0)
+        print(f"🟢 Agent listening on {self.path} (pid {os.getpid()})", flush=True)
+
+        try:
+            while not self.stopping.is_set():
+                if time.monotonic() - self.last_used > self.idle_timeout:
+                    print(f"💤 Idle for {self.idle_timeout}s, shutting down", flush=True)
+                    break
+                try:
+                    conn, _ = server.accept()
+                except socket.timeout:
+                    continue
+                threading.Thread(target=self.handle, args=(conn,), daemon=True).start()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.close()
+            if os.path.exists(self.path):
+                os.remove(self.path)
+            print(f"🔴 Agent stopped after {self.runs} runs", flush=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Warm local provisioning agent")
+    sub = parser.add_subparsers(dest="command", required=True)
+    start = sub.add_parser("start", help="Run the agent in the foreground")
+    start.add_argument("--idle-timeout", type=int, default=3600, help="Exit after this many idle seconds (default: 3600)")
+    start.add_argument("--no-warm-up", action="store_true", help="Skip pre-warming imports, boto3 and sign-in")
+    sub.add_parser("status", help="Show agent status and cache hits")
+    sub.add_parser("stop", help="Stop the agent")
+    args = parser.parse_args()
+
+    path = agent_client.socket_path()
+    if args.command == "start":
+        agent = Agent(path, idle_timeout=args.idle_timeout)
+        install(agent.state)
+        if not args.no_warm_up:
+            agent.warm_up()
+        agent.serve()
+        return
+
+    reader = agent_client.send({"command": args.command}, timeout=10)
+    if reader is None:
+        print(f"⚪ No agent listening on {path}")
+        sys.exit(1)
+    reply = json.loads(reader.readline())
+    if args.command == "status":
+        print(json.dumps(reply, indent=2))
+    else:
+        print("🛑 Agent stopping")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""
+Thin client side of the warm provisioning agent (see agent.py).
+
+Every lab script calls agent_client.forward() before its other imports.
+When an agent is listening on AGENT_SOCKET, the script's name, arguments,
+working directory and environment are sent to it and its output is
+streamed back, so `python3 deploy_ipam.py` keeps its name, flags, output
+files and exit code but runs on warm state. Without an agent (or when it
+is stale after a code change) the script simply runs locally.
+
+Environment Variables:
+  AGENT_SOCKET  - Unix socket path (default: /tmp/ipam-uddi-agent-<uid>.sock)
+  IPAM_AGENT=0  - Never forward to the agent
+"""
+
+import os
+import sys
+import json
+import socket
+
+# Set by agent.py so scripts it runs do not forward to themselves
+IN_AGENT = False
+_forwarded = False
+
+
+def socket_path():
+    return os.environ.get("AGENT_SOCKET", f"/tmp/ipam-uddi-agent-{os.getuid()}.sock")
+
+
+def send(message, timeout=None):
+    """Connect, send one JSON message and return the socket's line reader, or None."""
+    path = socket_path()
+    if not os.path.exists(path):
+        return None
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.settimeout(0.5)
+    try:
+        sock.connect(path)
+    except OSError:
+        sock.close()
+        return None
+    sock.settimeout(timeout)
+    sock.sendall(json.dumps(message).encode() + b"\n")
+    return sock.makefile("r", encoding="utf-8")
+
+
+def forward():
+    """Run this script in the agent and exit with its exit code, if an agent is up."""
+    global _forwarded
+    if IN_AGENT or _forwarded or os.environ.get("IPAM_AGENT") == "0":
+        return
+    _forwarded = True  # scripts importing other scripts only try once
+    # Profiling measures this process, so never hand a profiled run away
+    if "--profile" in sys.argv or os.environ.get("PROFILE") == "1":
+        return
+
+    reader = send({
+        "command": "run",
+        "script": os.path.abspath(sys.argv[0]),
+        "argv": sys.argv[1:],
+        "cwd": os.getcwd(),
+        "env": dict(os.environ),
+    })
+    if reader is None:
+        return
+
+    started = False
+    for line in reader:
+        frame = json.loads(line)
+        if "stale" in frame:
+            return  # agent is running older code; run locally
+        started = True
+        if "out" in frame:
+            sys.stdout.write(frame["out"])
+            sys.stdout.flush()
+        elif "err" in frame:
+            sys.stderr.write(frame["err"])
+            sys.stderr.flush()
+        elif "exit" in frame:
+            sys.exit(frame["exit"])
+    if not started:
+        return
+    # The script may have made changes already, so do not silently rerun it
+    print("❌ Lost connection to the provisioning agent mid-run", file=sys.stderr)
+    sys.exit(1)
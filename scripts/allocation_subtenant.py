@@ -25,12 +25,21 @@ Output Files:
   sandbox_env.sh        - Source-able env vars for bash scripts
 """
 
+import agent_client
+agent_client.forward()
+
 import os
 import sys
 import time
 import random
 import requests
 
+from http_session import ApiSession
+from rate_governor import get_governor
+import profiling
+
+profiling.install()
+
 # ----------------------------------
 # Configuration
 # ----------------------------------
@@ -76,11 +85,12 @@ if SANDBOX_NAME_PREFIX:
 
 max_retries = 5
 allocation_response = None
+session = ApiSession()
 
 for attempt in range(max_retries):
     try:
         print(f"🔄 Allocation attempt {attempt + 1}/{max_retries}...", flush=True)
-        resp = requests.post(
+        resp = session.post(
             f"{BROKER_API_URL}/allocate",
             headers=headers,
             timeout=(5, 30),
@@ -96,7 +106,8 @@ for attempt in range(max_retries):
             sys.exit(1)
         elif resp.status_code == 403:
             print("⚠️ Rate limited, waiting...", flush=True)
-            time.sleep(10)
+            # Broker signals throttling with 403: hold off every script on this host
+            get_governor().penalize("broker", 10)
         elif resp.status_code in {500, 502, 503, 504}:
             print(f"⚠️ Server error {resp.status_code}, retrying...", flush=True)
             time.sleep(min(2 ** attempt + random.uniform(0, 1), 30))
@@ -4,11 +4,18 @@ Assign a Federated Pool to a Federated Block in Infoblox CSP.
 Reads block ID from federation_output.json and pool ID from federated_pool_output.json
 """
 
+import agent_client
+agent_client.forward()
+
 import os
 import re
 import json
 import yaml
-import requests
+
+import csp_auth
+from http_session import ApiSession
+from federation_records import load_blocks
+import profiling
 
 def load_config_with_env(file_path):
     with open(file_path, "r") as f:
@@ -31,13 +38,20 @@ class BlockPoolAssigner:
         self.password = config['password']
         self.sandbox_id_file = config['sandbox_id_file']
         self.jwt = None
+        self.api_key = None
         self.headers = {}
+        self.session = ApiSession()
 
     def authenticate(self):
         """Login and get JWT token"""
+        self.api_key = csp_auth.load_api_key(self.sandbox_id_file)
+        if self.api_key:
+            self.headers = csp_auth.token_headers(self.api_key)
+            print("✅ Using API key, skipping sign-in.")
+            return
         url = f"{self.base_url}/v2/session/users/sign_in"
         payload = {"email": self.email, "password": self.password}
-        r = requests.post(url, json=payload)
+        r = self.session.post(url, json=payload)
         r.raise_for_status()
         self.jwt = r.json()["jwt"]
         self.headers = {
@@ -48,11 +62,14 @@ class BlockPoolAssigner:
 
     def switch_account(self):
         """Switch to sandbox account"""
+        if self.api_key:
+            print("🔁 API key is scoped to the sandbox, skipping account switch.")
+            return
         with open(self.sandbox_id_file, "r") as f:
             sandbox_id = f.read().strip()
         url = f"{self.base_url}/v2/session/account_switch"
         payload = {"id": f"identity/accounts/{sandbox_id}"}
-        r = requests.post(url, headers=self.headers, json=payload)
+        r = self.session.post(url, headers=self.headers, json=payload)
         r.raise_for_status()
         self.jwt = r.json()["jwt"]
         self.headers["Authorization"] = f"Bearer {self.jwt}"
@@ -63,15 +80,11 @@ class BlockPoolAssigner:
         if not os.path.exists(output_file):
             raise FileNotFoundError(f"❌ {output_file} not found. Run deploy_ipam.py first.")
 
-        with open(output_file, "r") as f:
-            data = json.load(f)
-
-        # Find the block by name
-        blocks = data.get("blocks", [])
-        for block in blocks:
-            if block.get("name") == block_name:
-                print(f"📖 Found block '{block_name}': {block.get('id')}")
-                return block
+        # Indexed by name; full dict rebuilt only for the block we PATCH
+        block = load_blocks(output_file).named(block_name)
+        if block:
+            print(f"📖 Found block '{block_name}': {block.id}")
+            return block.to_dict()
 
         raise ValueError(f"❌ Could not find block '{block_name}' in federation_output.json")
 
@@ -112,7 +125,7 @@ class BlockPoolAssigner:
         print(f"   Block ID: {block_uuid}")
         print(f"   Pool ID: {pool_id}")
 
-        r = requests.patch(url, headers=self.headers, json=payload)
+        r = self.session.patch(url, headers=self.headers, json=payload)
 
         if not r.ok:
             print(f"❌ Error: {r.status_code}")
@@ -126,6 +139,7 @@ class BlockPoolAssigner:
 
 
 if __name__ == "__main__":
+    profiling.install()
     import argparse
 
     parser = argparse.ArgumentParser(description="Assign federated pool to federated block")
@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+"""
+Benchmark federation_records against plain API dicts.
+
+Builds a synthetic listing shaped like /federation/federated_block results
+(ids, names, realm/pool links, comment, tags, utilization, timestamps) and
+compares, for the same objects:
+
+  dicts    - list of dicts from json.loads, linear scans (what the scripts did)
+  records  - BlockRecord list + RecordIndex
+
+Memory is what tracemalloc sees retained after building each; lookups are
+the mean of --lookups random queries by name, by id, by pool and by
+containing address. Nothing is sent to the API.
+
+Usage:
+  python3 bench_federation_records.py
+  python3 bench_federation_records.py --count 200000 --lookups 200
+"""
+
+import gc
+import json
+import time
+import random
+import argparse
+import ipaddress
+import tracemalloc
+
+from federation_records import RecordIndex
+
+REALM = "federation/federated_realm/4e6c3b3a-5f7e-11ef-9c3e-9a1b2c3d4e5f"
+
+
+def synthetic_listing(count, pools=50, seed=7):
+    """JSON text of a federated_block listing with `count` /24 blocks."""
+    rnd = random.Random(seed)
+    pool_ids = [f"federation/federated_pool/{rnd.getrandbits(128):032x}" for _ in range(pools)]
+    base = int(ipaddress.IPv4Address("10.0.0.0"))
+    results = []
+    for i in range(count):
+        results.append({
+            "id": f"federation/federated_block/{rnd.getrandbits(128):032x}",
+            "name": f"block-{i:06d}",
+            "address": str(ipaddress.IPv4Address(base + (i << 8))),
+            "cidr": 24,
+            "comment": f"imported from NIOS row {i}",
+            "federated_realm": REALM,
+            "federated_pool_id": pool_ids[i % pools] if i % 3 == 0 else None,
+            "parent": None,
+            "tags": {"env": "lab", "owner": "netops"},
+            "utilization": {"total": "256", "used": str(i % 256), "free": str(256 - i % 256)},
+            "created_at": "2025-06-01T12:00:00Z",
+            "updated_at": "2025-06-01T12:00:00Z",
+        })
+    return json.dumps({"results": results}), pool_ids
+
+
+def measure(build):
+    """(object, bytes retained, build seconds); timed without tracemalloc, which slows allocation."""
+    gc.collect()
+    start = time.perf_counter()
+    build()
+    elapsed = time.perf_counter() - start
+    gc.collect()
+    tracemalloc.start()
+    obj = build()
+    gc.collect()
+    retained = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return obj, retained, elapsed
+
+
+def timed(fn, queries):
+    start = time.perf_counter()
+    for q in queries:
+        fn(q)
+    return (time.perf_counter() - start) / len(queries) * 1e6
+
+
+def dict_containing(blocks, address):
+    ip = ipaddress.ip_address(address)
+    best = None
+    for b in blocks:
+        net = ipaddress.ip_network(f"{b['address']}/{b['cidr']}")
+        if ip in net and (best is None or net.prefixlen > best[0]):
+            best = (net.prefixlen, b)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark slotted federation records against dicts")
+    parser.add_argument("--count", type=int, default=100000, help="Blocks in the listing (default: 100000)")
+    parser.add_argument("--lookups", type=int, default=100, help="Queries per lookup kind (default: 100)")
+    args = parser.parse_args()
+
+    print(f"🧪 Building a listing of {args.count} blocks...")
+    text, pool_ids = synthetic_listing(args.count)
+    print(f"   JSON size: {len(text) / 1e6:.1f} MB")
+
+    blocks, dict_mem, dict_time = measure(lambda: json.loads(text)["results"])
+    index, rec_mem, rec_time = measure(lambda: RecordIndex.from_results(json.loads(text)["results"]))
+
+    rnd = random.Random(11)
+    sample = [blocks[rnd.randrange(len(blocks))] for _ in range(args.lookups)]
+    names = [b["name"] for b in sample]
+    ids = [b["id"] for b in sample]
+    pools = [rnd.choice(pool_ids) for _ in range(args.lookups)]
+    addrs = [str(ipaddress.IPv4Address(int(ipaddress.IPv4Address(b["address"])) + 7)) for b in sample]
+    # Address scans over dicts are slow; keep them to a handful
+    few_addrs = addrs[:max(1, args.lookups // 20)]
+    index.containing(addrs[0])  # builds the prefix tables once
+
+    results = [
+        ("by name",
+         timed(lambda n: next(b for b in blocks if b.get("name") == n), names),
+         timed(index.named, names)),
+        ("by id",
+         timed(lambda i: next(b for b in blocks if b.get("id") == i), ids),
+         timed(index.get, ids)),
+        ("by pool",
+         timed(lambda p: [b for b in blocks if b.get("federated_pool_id") == p], pools),
+         timed(index.for_pool, pools)),
+        ("containing",
+         timed(lambda a: dict_containing(blocks, a), few_addrs),
+         timed(index.containing, addrs)),
+    ]
+
+    # Records must give the same answers as the scans they replace
+    for n in names:
+        assert index.named(n).id == next(b for b in blocks if b["name"] == n)["id"]
+    for a in few_addrs:
+        assert index.containing(a).id == dict_containing(blocks, a)[1]["id"]
+
+    print(f"\n{'='*60}")
+    print(f"📊 {args.count} federated blocks")
+    print(f"   {'':<12}{'dicts':>14}{'records':>14}{'ratio':>10}")
+    print(f"   {'memory':<12}{dict_mem / 1e6:>11.1f} MB{rec_mem / 1e6:>11.1f} MB{dict_mem / rec_mem:>9.1f}x")
+    print(f"   {'build':<12}{dict_time:>12.2f} s{rec_time:>12.2f} s")
+    for label, dict_us, rec_us in results:
+        print(f"   {label:<12}{dict_us:>11.1f} µs{rec_us:>11.1f} µs{dict_us / rec_us:>9.0f}x")
+    print(f"   (bytes per block: {dict_mem / args.count:.0f} as dict, {rec_mem / args.count:.0f} as record)")
+    print(f"{'='*60}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,310 @@
+"""
+Record/replay cassettes for offline benchmarking of the lab scripts.
+
+Record a real run once, then replay the identical traffic without network
+access to profile the client-side cost (JSON parsing, payload building,
+file I/O) and compare before/after performance.
+
+  record  - every response from ApiSession / GovernedSession and from
+            boto3 clients wrapped by govern_boto3_client() is appended to
+            the cassette (JSON lines) with its latency. Secrets are
+            redacted before anything is written.
+  replay  - responses are served from the cassette in recorded order per
+            request; nothing is sent, the rate governor is bypassed, and
+            each response is delayed by its recorded latency times the
+            HTTP_CASSETTE_LATENCY scale.
+
+Requests are matched on method + URL (including query), falling back to
+method + path, so tokens and ids that differ between runs still line up.
+One cassette can span a whole setup sequence of several scripts.
+
+Usage:
+  HTTP_CASSETTE=run.jsonl HTTP_CASSETTE_MODE=record python3 deploy_vpc_from_ipam.py
+  HTTP_CASSETTE=run.jsonl python3 deploy_vpc_from_ipam.py
+  HTTP_CASSETTE=run.jsonl HTTP_CASSETTE_LATENCY=0 python3 deploy_vpc_from_ipam.py
+  python3 cassette.py run.jsonl          # summary of a recorded cassette
+
+Environment Variables:
+  HTTP_CASSETTE          - Cassette file; unset disables record/replay
+  HTTP_CASSETTE_MODE     - record | replay (default: replay)
+  HTTP_CASSETTE_LATENCY  - "original" (default) or a scale factor, e.g. 0.5 or 0
+"""
+
+import os
+import re
+import sys
+import json
+import time
+import base64
+import threading
+from datetime import timedelta
+from urllib.parse import urlparse, parse_qsl, urlencode
+
+import requests
+from requests.structures import CaseInsensitiveDict
+
+REDACTED = "REDACTED"
+SECRET_HEADERS = ("authorization", "cookie", "set-cookie", "x-amz-security-token", "x-api-key")
+SECRET_FIELD = re.compile(r"password|secret|jwt|token|^key$|api_?key|access_key|authorization", re.I)
+SECRET_XML = re.compile(r"<(SecretAccessKey|SessionToken|AccessKeyId)>[^<]*</\1>")
+DROP_HEADERS = ("content-encoding", "transfer-encoding", "content-length")
+
+
+class CassetteMiss(requests.ConnectionError):
+    """Raised in replay mode when the cassette has no response for a request."""
+
+
+# --- Redaction ---
+
+def _redact_json(value):
+    if isinstance(value, dict):
+        return {k: REDACTED if SECRET_FIELD.search(k) and isinstance(v, str) else _redact_json(v)
+                for k, v in value.items()}
+    if isinstance(value, list):
+        return [_redact_json(v) for v in value]
+    return value
+
+
+def redact_body(body):
+    """Redact secrets from a text body (JSON or AWS XML). Returns text."""
+    if body is None:
+        return None
+    if isinstance(body, bytes):
+        try:
+            body = body.decode("utf-8")
+        except UnicodeDecodeError:
+            return None
+    try:
+        return json.dumps(_redact_json(json.loads(body)))
+    except ValueError:
+        return SECRET_XML.sub(lambda m: f"<{m.group(1)}>{REDACTED}</{m.group(1)}>", body)
+
+
+def redact_headers(headers):
+    return {k: REDACTED if k.lower() in SECRET_HEADERS else v
+            for k, v in dict(headers or {}).items() if k.lower() not in DROP_HEADERS}
+
+
+def redact_url(url):
+    parsed = urlparse(url)
+    if not parsed.query:
+        return url
+    query = [(k, REDACTED if SECRET_FIELD.search(k) else v) for k, v in parse_qsl(parsed.query)]
+    return parsed._replace(query=urlencode(query)).geturl()
+
+
+def _encode_body(content):
+    try:
+        return {"body": content.decode("utf-8")}
+    except UnicodeDecodeError:
+        return {"body_b64": base64.b64encode(content).decode("ascii")}
+
+
+def _decode_body(entry):
+    if "body_b64" in entry:
+        return base64.b64decode(entry["body_b64"])
+    return (entry.get("body") or "").encode("utf-8")
+
+
+# --- Cassette ---
+
+class Cassette:
+    def __init__(self, path, mode="replay", latency="original"):
+        if mode not in ("record", "replay"):
+            raise ValueError(f"❌ HTTP_CASSETTE_MODE must be record or replay, got '{mode}'")
+        self.path = path
+        self.mode = mode
+        self.scale = 1.0 if latency in (None, "", "original") else float(latency)
+        self._lock = threading.Lock()
+        self._by_path = {}
+        self.served = 0
+        self.misses = 0
+        if mode == "replay":
+            self._load()
+
+    @property
+    def replaying(self):
+        return self.mode == "replay"
+
+    @staticmethod
+    def _keys(method, url):
+        parsed = urlparse(url)
+        query = urlencode(sorted(parse_qsl(parsed.query)))
+        return f"{method.upper()} {parsed.netloc}{parsed.path}?{query}", f"{method.upper()} {parsed.netloc}{parsed.path}"
+
+    def _load(self):
+        with open(self.path, "r") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                entry = json.loads(line)
+                entry["_key"], path = self._keys(entry["method"], entry["url"])
+                self._by_path.setdefault(path, []).append(entry)
+        print(f"📼 Replaying {sum(len(v) for v in self._by_path.values())} responses from {self.path}")
+
+    def _append(self, entry):
+        line = json.dumps(entry) + "\n"
+        with self._lock:
+            with open(self.path, "a") as f:
+                f.write(line)
+
+    def _next(self, method, url):
+        """Take the next unused entry for a request, preferring an exact URL match.
+
+        Once every entry for the path has been served, the last one repeats
+        (polling loops may run longer in replay than they did while recording).
+        """
+        exact, path = self._keys(method, redact_url(url))
+        with self._lock:
+            entries = self._by_path.get(path)
+            if not entries:
+                self.misses += 1
+                raise CassetteMiss(f"No recorded response for {method.upper()} {url} in {self.path}")
+            unused = [e for e in entries if not e.get("_used")]
+            matches = [e for e in unused if e["_key"] == exact]
+            if matches or unused:
+                entry = (matches or unused)[0]
+                entry["_used"] = True
+            else:
+                entry = ([e for e in entries if e["_key"] == exact] or entries)[-1]
+            self.served += 1
+        if self.scale:
+            time.sleep(entry.get("elapsed", 0.0) * self.scale)
+        return entry
+
+    # --- requests ---
+
+    def record(self, method, url, response, request_body=None):
+        entry = {
+            "kind": "http",
+            "method": method.upper(),
+            "url": redact_url(url),
+            "request_body": redact_body(request_body),
+            "status": response.status_code,
+            "reason": response.reason,
+            "headers": redact_headers(response.headers),
+            "elapsed": response.elapsed.total_seconds(),
+        }
+        content = response.content or b""
+        redacted = redact_body(content)
+        entry.update({"body": redacted} if redacted is not None else _encode_body(content))
+        self._append(entry)
+
+    def replay(self, method, url):
+        entry = self._next(method, url)
+        response = requests.Response()
+        response.status_code = entry["status"]
+        response.reason = entry.get("reason") or ""
+        response.headers = CaseInsensitiveDict(entry.get("headers") or {})
+        response._content = _decode_body(entry)
+        response._content_consumed = True
+        response.url = url
+        response.encoding = "utf-8"
+        response.elapsed = timedelta(seconds=entry.get("elapsed", 0.0))
+        response.request = requests.Request(method.upper(), url).prepare()
+        return response
+
+    # --- boto3 ---
+
+    def attach_boto3(self, client):
+        """Record or replay a boto3 client's HTTP traffic via botocore events."""
+        from botocore.awsrequest import AWSResponse
+
+        started = threading.local()
+
+        def _operation_url(event_name, url):
+            # Query-protocol services (EC2) POST every operation to "/"
+            return f"{url.split('?')[0].rstrip('/')}/#{event_name.split('.', 1)[1]}"
+
+        def before_send(request, event_name, **kwargs):
+            if not self.replaying:
+                started.at = time.monotonic()
+                return None
+            entry = self._next("POST", _operation_url(event_name, request.url))
+            return AWSResponse(request.url, entry["status"], entry.get("headers") or {},
+                               _RawBody(_decode_body(entry)))
+
+        def needs_retry(response, event_name, request_dict=None, **kwargs):
+            if self.replaying or response is None:
+                return None
+            http_response, _ = response
+            content = http_response.content or b""
+            redacted = redact_body(content)
+            entry = {
+                "kind": "boto3",
+                "method": "POST",
+                "url": _operation_url(event_name, (request_dict or {}).get("url", "")),
+                "status": http_response.status_code,
+                "headers": redact_headers(http_response.headers),
+                "elapsed": time.monotonic() - getattr(started, "at", time.monotonic()),
+            }
+            entry.update({"body": redacted} if redacted is not None else _encode_body(content))
+            self._append(entry)
+            return None
+
+        client.meta.events.register("before-send", before_send)
+        client.meta.events.register_first("needs-retry", needs_retry)
+        return client
+
+
+class _RawBody:
+    """Minimal stand-in for urllib3's response as read by botocore's AWSResponse."""
+
+    def __init__(self, content):
+        self.content = content
+
+    def stream(self, amt=1024, decode_content=None):
+        for i in range(0, len(self.content), amt):
+            yield self.content[i:i + amt]
+
+
+_cassette = None
+_cassette_loaded = False
+
+
+def get_cassette():
+    """The process-wide cassette from HTTP_CASSETTE, or None when disabled."""
+    global _cassette, _cassette_loaded
+    if not _cassette_loaded:
+        path = os.environ.get("HTTP_CASSETTE")
+        if path:
+            _cassette = Cassette(path, mode=os.environ.get("HTTP_CASSETTE_MODE", "replay"),
+                                 latency=os.environ.get("HTTP_CASSETTE_LATENCY", "original"))
+        _cassette_loaded = True
+    return _cassette
+
+
+def reset():
+    """Forget the cassette so the next get_cassette() re-reads HTTP_CASSETTE
+    (agent.py runs many scripts, each with its own environment)."""
+    global _cassette, _cassette_loaded
+    _cassette = None
+    _cassette_loaded = False
+
+
+def summarize(path):
+    endpoints = {}
+    with open(path, "r") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            entry = json.loads(line)
+            parsed = urlparse(entry["url"])
+            key = f"{entry['method']} {parsed.netloc}{parsed.path}{'#' + parsed.fragment if parsed.fragment else ''}"
+            count, elapsed = endpoints.get(key, (0, 0.0))
+            endpoints[key] = (count + 1, elapsed + entry.get("elapsed", 0.0))
+
+    print(f"📼 {path}")
+    for key, (count, elapsed) in sorted(endpoints.items(), key=lambda kv: -kv[1][1]):
+        print(f"   {count:5d} × {elapsed:8.2f}s  {key}")
+    print(f"\n{'='*60}")
+    print(f"   Responses:        {sum(c for c, _ in endpoints.values())}")
+    print(f"   Recorded latency: {sum(e for _, e in endpoints.values()):.2f}s")
+    print(f"{'='*60}")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 2:
+        print("Usage: python3 cassette.py <cassette.jsonl>")
+        sys.exit(1)
+    summarize(sys.argv[1])
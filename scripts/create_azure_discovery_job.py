@@ -4,11 +4,19 @@ Create Azure Cloud Discovery Job for Infoblox UDDI.
 Uses Service Principal credentials from environment variables.
 """
 
+import agent_client
+agent_client.forward()
+
 import os
 import json
 import requests
 import time
 
+import csp_auth
+from http_session import ApiSession
+from json_stream import first_match
+import profiling
+
 
 class AzureInfobloxSession:
     def __init__(self):
@@ -16,10 +24,15 @@ class AzureInfobloxSession:
         self.email = os.getenv("INFOBLOX_EMAIL")
         self.password = os.getenv("INFOBLOX_PASSWORD")
         self.jwt = None
-        self.session = requests.Session()
+        self.api_key = None
+        self.session = ApiSession()
         self.headers = {"Content-Type": "application/json"}
 
     def login(self):
+        self.api_key = csp_auth.load_api_key()
+        if self.api_key:
+            print("Using API key, skipping sign-in.")
+            return
         payload = {"email": self.email, "password": self.password}
         response = self.session.post(
             f"{self.base_url}/v2/session/users/sign_in",
@@ -32,6 +45,8 @@ class AzureInfobloxSession:
         print("Logged in and saved JWT to azure_jwt.txt")
 
     def switch_account(self):
+        if self.api_key:
+            return
         sandbox_id = self._read_file("sandbox_id.txt")
         payload = {"id": f"identity/accounts/{sandbox_id}"}
         headers = self._auth_headers()
@@ -87,18 +102,18 @@ class AzureInfobloxSession:
 
         while waited < timeout:
             try:
-                response = self.session.get(url, headers=self._auth_headers())
+                response = self.session.get(url, headers=self._auth_headers(), stream=True)
                 if response.status_code == 403:
                     print("403 Forbidden - likely no access yet or propagation delay")
+                    response.close()
                 response.raise_for_status()
-                creds = response.json().get("results", [])
+                cred = first_match(response, lambda c: c.get("credential_type") == "Microsoft Azure")
 
-                for cred in creds:
-                    if cred.get("credential_type") == "Microsoft Azure":
-                        credential_id = cred.get("id")
-                        self._save_to_file("azure_cloud_credential_id.txt", credential_id)
-                        print(f"Azure Cloud Credential ID found and saved: {credential_id}")
-                        return credential_id
+                if cred:
+                    credential_id = cred.get("id")
+                    self._save_to_file("azure_cloud_credential_id.txt", credential_id)
+                    print(f"Azure Cloud Credential ID found and saved: {credential_id}")
+                    return credential_id
 
             except requests.HTTPError as e:
                 print(f"Error fetching credentials: {e}")
@@ -168,6 +183,8 @@ class AzureInfobloxSession:
         return response.json()
 
     def _auth_headers(self):
+        if self.api_key:
+            return csp_auth.token_headers(self.api_key)
         return {"Content-Type": "application/json", "Authorization": f"Bearer {self.jwt}"}
 
     def _save_to_file(self, filename, content):
@@ -180,6 +197,7 @@ class AzureInfobloxSession:
 
 
 if __name__ == "__main__":
+    profiling.install()
     subscription_id = os.getenv("INSTRUQT_AZURE_SUBSCRIPTION_INFOBLOX_TENANT_SUBSCRIPTION_ID")
 
     if not subscription_id:
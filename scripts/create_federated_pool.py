@@ -4,11 +4,18 @@ Create a Federated Pool in Infoblox CSP.
 Reads realm ID from federation_output.json (created by deploy_ipam.py)
 """
 
+import agent_client
+agent_client.forward()
+
 import os
 import re
 import json
 import yaml
-import requests
+
+import csp_auth
+from http_session import ApiSession
+from idempotency import idempotent_create
+import profiling
 
 def load_config_with_env(file_path):
     with open(file_path, "r") as f:
@@ -31,13 +38,20 @@ class FederatedPoolCreator:
         self.password = config['password']
         self.sandbox_id_file = config['sandbox_id_file']
         self.jwt = None
+        self.api_key = None
         self.headers = {}
+        self.session = ApiSession()
 
     def authenticate(self):
         """Login and get JWT token"""
+        self.api_key = csp_auth.load_api_key(self.sandbox_id_file)
+        if self.api_key:
+            self.headers = csp_auth.token_headers(self.api_key)
+            print("✅ Using API key, skipping sign-in.")
+            return
         url = f"{self.base_url}/v2/session/users/sign_in"
         payload = {"email": self.email, "password": self.password}
-        r = requests.post(url, json=payload)
+        r = self.session.post(url, json=payload)
         r.raise_for_status()
         self.jwt = r.json()["jwt"]
         self.headers = {
@@ -48,11 +62,14 @@ class FederatedPoolCreator:
 
     def switch_account(self):
         """Switch to sandbox account"""
+        if self.api_key:
+            print("🔁 API key is scoped to the sandbox, skipping account switch.")
+            return
         with open(self.sandbox_id_file, "r") as f:
             sandbox_id = f.read().strip()
         url = f"{self.base_url}/v2/session/account_switch"
         payload = {"id": f"identity/accounts/{sandbox_id}"}
-        r = requests.post(url, headers=self.headers, json=payload)
+        r = self.session.post(url, headers=self.headers, json=payload)
         r.raise_for_status()
         self.jwt = r.json()["jwt"]
         self.headers["Authorization"] = f"Bearer {self.jwt}"
@@ -84,10 +101,7 @@ class FederatedPoolCreator:
         }
 
         print(f"📤 Creating federated pool '{pool_name}'...")
-        r = requests.post(url, headers=self.headers, json=payload)
-        r.raise_for_status()
-
-        result = r.json().get("result", {})
+        result = idempotent_create(self.session, url, self.headers, payload)
         pool_id = result.get("id")
         print(f"✅ Created federated pool: {pool_name} → ID: {pool_id}")
 
@@ -104,6 +118,7 @@ class FederatedPoolCreator:
 
 
 if __name__ == "__main__":
+    profiling.install()
     creator = FederatedPoolCreator()
     creator.authenticate()
     creator.switch_account()
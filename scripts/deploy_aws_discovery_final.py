@@ -1,20 +1,33 @@
+import agent_client
+agent_client.forward()
+
 import os
 import json
 import requests
 import time
 import random
 
+import csp_auth
+from http_session import ApiSession
+from json_stream import first_match
+import profiling
+
 class InfobloxSession:
     def __init__(self):
         self.base_url = "https://csp.infoblox.com"
         self.email = os.getenv("INFOBLOX_EMAIL")
         self.password = os.getenv("INFOBLOX_PASSWORD")
         self.jwt = None
-        self.session = requests.Session()
+        self.api_key = None
+        self.session = ApiSession()
         self.headers = {"Content-Type": "application/json"}
         self.account_id = os.getenv("INSTRUQT_AWS_ACCOUNT_INFOBLOX_DEMO_ACCOUNT_ID")
 
     def login(self):
+        self.api_key = csp_auth.load_api_key()
+        if self.api_key:
+            print("✅ Using API key, skipping sign-in.")
+            return
         payload = {"email": self.email, "password": self.password}
         response = self.session.post(
             f"{self.base_url}/v2/session/users/sign_in",
@@ -26,6 +39,8 @@ class InfobloxSession:
         print("✅ Logged in and saved JWT to jwt.txt")
 
     def switch_account(self):
+        if self.api_key:
+            return
         sandbox_id = self._read_file("sandbox_id.txt")
         payload = {"id": f"identity/accounts/{sandbox_id}"}
         response = self.session.post(
@@ -97,8 +112,9 @@ class InfobloxSession:
                 raise RuntimeError(f"❌ Timed out after {timeout}s waiting for AWS Cloud Credential to appear.")
 
             try:
-                r = self.session.get(url, headers=self._auth_headers())
+                r = self.session.get(url, headers=self._auth_headers(), stream=True)
                 if r.status_code == 429:
+                    r.close()
                     ra = r.headers.get("Retry-After")
                     sleep_s = int(ra) if (ra and ra.isdigit()) else min(max_interval, max(5, interval))
                     print(f"⏸️  429 Too Many Requests. Sleeping {sleep_s}s (Retry-After).")
@@ -106,17 +122,17 @@ class InfobloxSession:
                     continue
 
                 if r.status_code in (403, 503):
+                    r.close()
                     print(f"🚦 {r.status_code} transient ({r.reason}); retrying...")
                 else:
                     r.raise_for_status()
-                    data = r.json()
-                    creds = data.get("results", []) if isinstance(data, dict) else []
-                    for cred in creds:
-                        if cred.get("credential_type") == "Amazon Web Services":
-                            credential_id = cred.get("id")
-                            self._save_to_file("cloud_credential_id.txt", credential_id)
-                            print(f"✅ AWS Cloud Credential ID found and saved: {credential_id}")
-                            return credential_id
+                    cred = first_match(r, lambda c: isinstance(c, dict)
+                                       and c.get("credential_type") == "Amazon Web Services")
+                    if cred:
+                        credential_id = cred.get("id")
+                        self._save_to_file("cloud_credential_id.txt", credential_id)
+                        print(f"✅ AWS Cloud Credential ID found and saved: {credential_id}")
+                        return credential_id
 
             except requests.RequestException as e:
                 print(f"⚠️ Fetch error: {e}; continuing...")
@@ -274,6 +290,8 @@ class InfobloxSession:
             interval = min(60, max(3, interval * 1.7))
 
     def _auth_headers(self):
+        if self.api_key:
+            return csp_auth.token_headers(self.api_key)
         return {"Content-Type": "application/json", "Authorization": f"Bearer {self.jwt}"}
 
     def _save_to_file(self, filename, content):
@@ -286,6 +304,7 @@ class InfobloxSession:
 
 
 if __name__ == "__main__":
+    profiling.install()
     session = InfobloxSession()
     session.login()
     session.switch_account()
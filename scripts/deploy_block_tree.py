@@ -0,0 +1,253 @@
+#!/usr/bin/env python3
+"""
+Deploy a hierarchy of federated blocks in parallel, parents before children.
+
+Production layouts nest blocks, e.g.:
+
+  AWS 10.0.0.0/8
+  └── eu-west-1 10.0.0.0/12
+      └── APPS 10.10.0.0/16
+          └── ...
+
+deploy_ipam.py creates config.yaml's flat list one block at a time. This
+deployer infers parent/child relationships from CIDR containment (input
+order and YAML nesting do not matter) and starts each block as soon as
+its parent exists, so total time follows the depth of the tree rather
+than the number of blocks. A block that fails skips its subtree; blocks
+that already exist (409) count as done, so the script can be re-run.
+
+Input (--input): a YAML list of blocks (name, address, cidr, comment, tags,
+optionally nested under `children`), or a CSV / NIOS export as read by
+import_blocks.py. Without --input the `blocks:` of config.yaml are used.
+
+Usage:
+  python3 deploy_block_tree.py
+  python3 deploy_block_tree.py --input hierarchy.yaml --max-workers 32
+  python3 deploy_block_tree.py --input networks.csv --dry-run
+
+Output Files:
+  block_tree_output.json - Created blocks with their parent and depth
+"""
+
+import agent_client
+agent_client.forward()
+
+import sys
+import json
+import time
+import argparse
+import ipaddress
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import yaml
+
+from import_blocks import BlockImporter, ImportRow, detect_format, stream_blocks
+from federation_records import assign_parents
+import profiling
+
+
+class BlockNode:
+    __slots__ = ("item", "id", "parent", "children", "depth", "status", "error", "block_id")
+
+    def __init__(self, item):
+        self.item = item
+        self.id = str(item.network)
+        self.parent = None
+        self.children = []
+        self.depth = 0
+        self.status = "pending"
+        self.error = None
+        self.block_id = None
+
+
+def _tree_order(node):
+    net = node.item.network
+    return net.version, int(net.network_address), net.prefixlen
+
+
+def flatten_yaml(blocks, out=None):
+    """Flatten YAML blocks (with optional `children`) into ImportRows."""
+    out = [] if out is None else out
+    for block in blocks or []:
+        network = ipaddress.ip_network(f"{block['address']}/{block['cidr']}")
+        out.append(ImportRow(len(out) + 1, network, block.get("name") or str(network),
+                             block.get("comment", ""), block.get("tags")))
+        flatten_yaml(block.get("children"), out)
+    return out
+
+
+def build_tree(items):
+    """Link nodes to the smallest block containing them. Returns (roots, nodes)."""
+    nodes = {}
+    for item in items:
+        nodes.setdefault(str(item.network), BlockNode(item))
+    objs = [{"id": n.id, "address": str(n.item.network.network_address), "cidr": n.item.network.prefixlen}
+            for n in nodes.values()]
+    parents = assign_parents(objs)
+    roots = []
+    for node in nodes.values():
+        parent_id = parents.get(node.id)
+        if parent_id:
+            node.parent = nodes[parent_id]
+            node.parent.children.append(node)
+        else:
+            roots.append(node)
+
+    # Depths top-down (iterative: hierarchies can be deep)
+    stack = [(root, 0) for root in roots]
+    while stack:
+        node, depth = stack.pop()
+        node.depth = depth
+        stack.extend((child, depth + 1) for child in node.children)
+    return roots, nodes
+
+
+class BlockTreeDeployer:
+    def __init__(self, importer, max_workers=16):
+        self.importer = importer
+        self.max_workers = max_workers
+        self.level_times = {}
+        self._lock = threading.Lock()
+        self._all_done = threading.Event()
+        self._remaining = 0
+
+    def _finish(self, node):
+        with self._lock:
+            first, last = self.level_times.get(node.depth, (None, 0.0))
+            self.level_times[node.depth] = (first, time.monotonic())
+            self._remaining -= 1
+            if self._remaining == 0:
+                self._all_done.set()
+
+    def _skip_subtree(self, node, reason):
+        stack = list(node.children)
+        while stack:
+            child = stack.pop()
+            child.status = "skipped"
+            child.error = reason
+            self._finish(child)
+            stack.extend(child.children)
+
+    def _create(self, pool, realm_id, node):
+        try:
+            with self._lock:
+                first, last = self.level_times.get(node.depth, (None, 0.0))
+                self.level_times[node.depth] = (first or time.monotonic(), last)
+            try:
+                outcome, block = self.importer.create_block(realm_id, node.item)
+                node.status = outcome
+                node.block_id = (block or {}).get("id")
+                print(f"   {'🧱' if outcome == 'created' else '♻️'} L{node.depth} {node.item.name} ({node.id})",
+                      flush=True)
+            except Exception as e:
+                node.status = "failed"
+                node.error = str(e)
+                print(f"   ❌ L{node.depth} {node.item.name} ({node.id}): {e}", flush=True)
+                self._skip_subtree(node, f"parent {node.id} failed")
+            else:
+                # Children only need their own parent, not the whole level
+                for child in node.children:
+                    pool.submit(self._create, pool, realm_id, child)
+        finally:
+            # Whatever happened above, run() must not wait for this node forever
+            self._finish(node)
+
+    def run(self, realm_id, roots, total):
+        self._remaining = total
+        if not total:
+            return
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            for root in roots:
+                pool.submit(self._create, pool, realm_id, root)
+            self._all_done.wait()
+
+
+class _PrintErrors:
+    """Errors sink for stream_blocks: report invalid rows instead of writing a CSV."""
+
+    def writerow(self, row):
+        print(f"   ⚠️ Row {row[0]} skipped: {row[2]}")
+
+
+def load_items(path, config_blocks):
+    if not path:
+        return flatten_yaml(config_blocks)
+    if path.endswith((".yaml", ".yml")):
+        with open(path, "r") as f:
+            data = yaml.safe_load(f)
+        return flatten_yaml(data.get("blocks") if isinstance(data, dict) else data)
+    return list(stream_blocks(path, detect_format(path), _PrintErrors(), {"duplicates": 0}))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Deploy a federated block hierarchy level-parallel")
+    parser.add_argument("--config", default="config.yaml", help="Config file path")
+    parser.add_argument("--input", help="YAML hierarchy or CSV/NIOS export (default: blocks in config)")
+    parser.add_argument("--realm", help="Realm name (default: from federation_output.json or config)")
+    parser.add_argument("--max-workers", type=int, default=16, help="Concurrent block creations (default: 16)")
+    parser.add_argument("--output", default="block_tree_output.json", help="Output file")
+    parser.add_argument("--dry-run", action="store_true", help="Show the inferred tree without creating anything")
+    args = parser.parse_args()
+
+    importer = BlockImporter(args.config, max_workers=args.max_workers)
+    items = load_items(args.input, importer.client.blocks)
+    roots, nodes = build_tree(items)
+
+    levels = {}
+    for node in nodes.values():
+        levels[node.depth] = levels.get(node.depth, 0) + 1
+    print(f"🌳 {len(nodes)} blocks, {len(roots)} roots, {len(levels)} levels: "
+          + ", ".join(f"L{d}={n}" for d, n in sorted(levels.items())))
+
+    if args.dry_run:
+        print(f"\n🔍 DRY RUN — inferred tree:")
+        stack = sorted(roots, key=_tree_order, reverse=True)
+        shown = 0
+        while stack and shown < 200:
+            node = stack.pop()
+            print(f"   {'  ' * node.depth}{node.item.name} {node.id}")
+            stack.extend(sorted(node.children, key=_tree_order, reverse=True))
+            shown += 1
+        if len(nodes) > shown:
+            print(f"   ... {len(nodes) - shown} more")
+        return
+
+    importer.client.authenticate()
+    importer.client.switch_account()
+    realm_id = importer.get_realm_id(args.realm)
+
+    deployer = BlockTreeDeployer(importer, max_workers=args.max_workers)
+    start = time.monotonic()
+    deployer.run(realm_id, roots, len(nodes))
+    elapsed = time.monotonic() - start
+
+    output = [{
+        "name": n.item.name, "cidr": n.id, "id": n.block_id, "status": n.status,
+        "parent": n.parent.id if n.parent else None, "depth": n.depth, "error": n.error,
+    } for n in sorted(nodes.values(), key=lambda n: (n.depth, _tree_order(n)))]
+    with open(args.output, "w") as f:
+        json.dump(output, f, indent=2)
+
+    counts = {}
+    for n in nodes.values():
+        counts[n.status] = counts.get(n.status, 0) + 1
+    failed = counts.get("failed", 0) + counts.get("skipped", 0)
+    print(f"\n{'='*60}")
+    print("🎉 Block Tree Deployed!" if not failed else "⚠️ Block tree deployed with errors")
+    print(f"   Blocks:   {len(nodes)} in {len(levels)} levels ({elapsed:.1f}s)")
+    print(f"   Created:  {counts.get('created', 0)}")
+    print(f"   Existing: {counts.get('exists', 0)}")
+    print(f"   Failed:   {counts.get('failed', 0)} (+{counts.get('skipped', 0)} skipped)")
+    for depth, (first, last) in sorted(deployer.level_times.items()):
+        if first:
+            print(f"   L{depth}: {levels[depth]} blocks, {first - start:.1f}s → {last - start:.1f}s")
+    print(f"   Output:   {args.output}")
+    print(f"{'='*60}")
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    profiling.install()
+    main()
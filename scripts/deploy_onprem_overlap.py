@@ -2,20 +2,32 @@
 """
 Deploy on-prem IP spaces to Infoblox CSP via Terraform.
 Uses data sources to lookup realm - no need to pass realm_id.
+
+Runs through tf_runner.py: shared provider cache, init only when the lock
+file or modules changed, saved plans and per-phase timings.
+
+Usage:
+  python3 deploy_onprem_overlap.py
+  python3 deploy_onprem_overlap.py --parallelism 30 --force-init
 """
 
+import agent_client
+agent_client.forward()
+
 import os
-import subprocess
 import sys
+import argparse
+import subprocess
+
+from tf_runner import TerraformRunner, DEFAULT_PARALLELISM, print_timings
+import profiling
 
 SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
 TERRAFORM_DIR = os.path.join(SCRIPT_DIR, "..", "terraform", "infoblox-onprem")
 
 
-def run_terraform():
-    """Initialize and apply terraform"""
-    os.chdir(TERRAFORM_DIR)
-
+def run_terraform(parallelism=DEFAULT_PARALLELISM, force_init=False):
+    """Initialize (if needed) and apply terraform"""
     # Check for API key
     api_key = os.environ.get("TF_VAR_ddi_api_key")
     if not api_key:
@@ -23,18 +35,30 @@ def run_terraform():
         print("   Or: source ~/.bashrc")
         sys.exit(1)
 
-    print("🔧 Initializing Terraform...")
-    subprocess.run(["terraform", "init"], check=True)
+    runner = TerraformRunner(TERRAFORM_DIR, parallelism=parallelism, variables={"ddi_api_key": api_key},
+                             force_init=force_init)
 
     print("🚀 Applying Terraform (creating on-prem IP spaces)...")
-    subprocess.run([
-        "terraform", "apply",
-        "-auto-approve",
-        f"-var=ddi_api_key={api_key}"
-    ], check=True)
+    try:
+        runner.apply()
+    except subprocess.CalledProcessError as e:
+        print(f"❌ Terraform failed with exit code {e.returncode}")
+        print_timings([runner])
+        sys.exit(1)
 
     print("✅ On-prem IP spaces created successfully!")
+    print_timings([runner])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Deploy on-prem IP spaces via Terraform")
+    parser.add_argument("--parallelism", type=int, default=DEFAULT_PARALLELISM,
+                        help=f"Terraform -parallelism (default: {DEFAULT_PARALLELISM})")
+    parser.add_argument("--force-init", action="store_true", help="Run terraform init even if nothing changed")
+    args = parser.parse_args()
+    run_terraform(args.parallelism, args.force_init)
 
 
 if __name__ == "__main__":
-    run_terraform()
+    profiling.install()
+    main()
@@ -0,0 +1,340 @@
+#!/usr/bin/env python3
+"""
+Deploy Azure VNets using CIDRs allocated from Infoblox Federated IPAM.
+
+Azure counterpart of deploy_vpc_from_ipam.py, creating what
+terraform/modules/azure-vnet creates for the network (resource group,
+VNet, subnets, route table, NSG with the lab's rules):
+
+  1. GET next available /24 from the federated block (--block-name, from
+     federation_output.json) and POST reserved_block for it, moving past
+     CIDRs taken by concurrent deployers (AWS or Azure)
+  2. Create the resource group
+  3. Create NSG and route table concurrently (long-running operations)
+  4. Create the VNet with its subnets inline, already bound to the NSG and
+     route table (one long-running operation instead of one per subnet;
+     Azure serializes subnet writes on a VNet anyway)
+
+Everything goes through the Azure SDK's async clients, so with --count N
+the reservations and all N resource-group pipelines run concurrently, and
+the script can run next to deploy_vpc_from_ipam.py: both reserve through
+Infoblox, so hybrid labs provision Azure in parallel with AWS instead of
+after it. Wall time per operation (start offset + duration) is printed at
+the end.
+
+config.yaml has no Azure-specific block; by default VNets are allocated
+from the "AWS" cloud block (10.0.0.0/8), which keeps them from overlapping
+anything reserved for AWS.
+
+Requires: azure-identity, azure-mgmt-resource, azure-mgmt-network, aiohttp
+
+Usage:
+  python3 deploy_vnet_from_ipam.py
+  python3 deploy_vnet_from_ipam.py --count 4 --subnet-cidr 26 --subnet-count 2
+  python3 deploy_vnet_from_ipam.py --dry-run
+  python3 deploy_vnet_from_ipam.py --teardown
+
+Environment Variables:
+  INSTRUQT_AZURE_SUBSCRIPTION_INFOBLOX_TENANT_SUBSCRIPTION_ID - Azure subscription
+  INSTRUQT_AZURE_SUBSCRIPTION_INFOBLOX_TENANT_TENANT_ID       - Service principal tenant
+  INSTRUQT_AZURE_SUBSCRIPTION_INFOBLOX_TENANT_SPN_ID          - Service principal client ID
+  INSTRUQT_AZURE_SUBSCRIPTION_INFOBLOX_TENANT_SPN_PASSWORD    - Service principal secret
+
+Output Files:
+  vnet_deployment_output.json - VNets, subnets, NSGs, route tables and reservations
+"""
+
+import agent_client
+agent_client.forward()
+
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import ipaddress
+
+from azure.core.exceptions import ResourceNotFoundError
+from azure.identity.aio import ClientSecretCredential
+from azure.mgmt.network.aio import NetworkManagementClient
+from azure.mgmt.resource.resources.aio import ResourceManagementClient
+
+from deploy_vpc_from_ipam import InfobloxVPCDeployer, default_shard
+import profiling
+
+OUTPUT_FILE = "vnet_deployment_output.json"
+AZURE_ENV = "INSTRUQT_AZURE_SUBSCRIPTION_INFOBLOX_TENANT"
+
+COMMON_TAGS = {
+    "Environment": "Lab",
+    "Project": "IPAM-UDDI",
+    "ManagedBy": "Python",
+    "ResourceOwner": "lab-user",
+    "Cloud": "Azure",
+}
+
+# Same inbound rules as terraform/modules/azure-vnet
+NSG_RULES = [
+    ("SSH", 1001, "Tcp", "22"),
+    ("HTTP", 1002, "Tcp", "80"),
+    ("HTTPS", 1003, "Tcp", "443"),
+    ("Flask", 1004, "Tcp", "5000"),
+    ("iPerf", 1005, "*", "5201"),
+]
+ICMP_SOURCES = ["10.0.0.0/8", "172.16.0.0/12", "192.168.0.0/16"]
+
+
+def nsg_parameters(name, location, tags):
+    rules = [{
+        "name": rule, "priority": priority, "direction": "Inbound", "access": "Allow", "protocol": protocol,
+        "source_port_range": "*", "destination_port_range": port,
+        "source_address_prefix": "*", "destination_address_prefix": "*",
+    } for rule, priority, protocol, port in NSG_RULES]
+    rules.append({
+        "name": "ICMP", "priority": 1006, "direction": "Inbound", "access": "Allow", "protocol": "Icmp",
+        "source_port_range": "*", "destination_port_range": "*",
+        "source_address_prefixes": ICMP_SOURCES, "destination_address_prefix": "*",
+    })
+    return {"location": location, "security_rules": rules, "tags": dict(tags, Name=name)}
+
+
+def subnet_cidrs(vnet_cidr, prefix, count):
+    subnets = list(ipaddress.ip_network(vnet_cidr).subnets(new_prefix=prefix))
+    if count > len(subnets):
+        raise ValueError(f"❌ {vnet_cidr} only fits {len(subnets)} /{prefix} subnets")
+    return [str(s) for s in subnets[:count]]
+
+
+class AzureVNetDeployer:
+    def __init__(self, subscription_id, location):
+        tenant_id = os.getenv(f"{AZURE_ENV}_TENANT_ID")
+        client_id = os.getenv(f"{AZURE_ENV}_SPN_ID")
+        client_secret = os.getenv(f"{AZURE_ENV}_SPN_PASSWORD")
+        if not tenant_id or not client_id or not client_secret:
+            raise RuntimeError("Azure credentials not found in environment variables.")
+        self.location = location
+        self.credential = ClientSecretCredential(tenant_id, client_id, client_secret)
+        self.resources = ResourceManagementClient(self.credential, subscription_id)
+        self.network = NetworkManagementClient(self.credential, subscription_id)
+        self.t0 = time.perf_counter()
+        self.timings = []    # (operation, start offset, seconds)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.network.close()
+        await self.resources.close()
+        await self.credential.close()
+
+    async def _timed(self, label, awaitable):
+        start = time.perf_counter()
+        result = await awaitable
+        elapsed = time.perf_counter() - start
+        self.timings.append((label, start - self.t0, elapsed))
+        print(f"   ✅ {label} ({elapsed:.1f}s)", flush=True)
+        return result
+
+    async def _lro(self, label, begin):
+        """Run a long-running operation (begin_* coroutine) to completion."""
+        async def run():
+            poller = await begin
+            return await poller.result()
+        return await self._timed(label, run())
+
+    async def deploy(self, vnet_name, vnet_cidr, subnets, tags):
+        """Resource group → NSG ∥ route table → VNet with subnets. Returns the output record."""
+        rg = f"{vnet_name}-rg"
+        tags = dict(COMMON_TAGS, VNet=vnet_name, **tags)
+        await self._timed(f"{vnet_name}: resource group {rg}", self.resources.resource_groups.create_or_update(
+            rg, {"location": self.location, "tags": tags}))
+
+        nsg, rt = await asyncio.gather(
+            self._lro(f"{vnet_name}: NSG", self.network.network_security_groups.begin_create_or_update(
+                rg, f"{vnet_name}-nsg", nsg_parameters(f"{vnet_name}-nsg", self.location, tags))),
+            self._lro(f"{vnet_name}: route table", self.network.route_tables.begin_create_or_update(
+                rg, f"{vnet_name}-rt", {"location": self.location, "tags": dict(tags, Name=f"{vnet_name}-rt")})),
+        )
+
+        subnet_names = [f"{vnet_name}-subnet" if len(subnets) == 1 else f"{vnet_name}-subnet-{i}"
+                        for i in range(1, len(subnets) + 1)]
+        vnet = await self._lro(f"{vnet_name}: VNet {vnet_cidr} + {len(subnets)} subnets",
+                               self.network.virtual_networks.begin_create_or_update(rg, vnet_name, {
+                                   "location": self.location,
+                                   "address_space": {"address_prefixes": [vnet_cidr]},
+                                   "subnets": [{
+                                       "name": name,
+                                       "address_prefix": cidr,
+                                       "network_security_group": {"id": nsg.id},
+                                       "route_table": {"id": rt.id},
+                                   } for name, cidr in zip(subnet_names, subnets)],
+                                   "tags": dict(tags, Name=vnet_name),
+                               }))
+        return {
+            "name": vnet_name,
+            "id": vnet.id,
+            "cidr": vnet_cidr,
+            "resource_group": rg,
+            "location": self.location,
+            "created_at": time.time(),
+            "subnets": [{"id": s.id, "name": s.name, "cidr": s.address_prefix} for s in vnet.subnets],
+            "nsg": {"id": nsg.id},
+            "route_table": {"id": rt.id},
+        }
+
+    async def delete_resource_group(self, rg):
+        """Delete a resource group; one that does not exist counts as deleted."""
+        try:
+            await self._lro(f"delete {rg}", self.resources.resource_groups.begin_delete(rg))
+        except ResourceNotFoundError:
+            print(f"   ⚠️ {rg} not found (never created or already deleted)", flush=True)
+
+
+def save_output(data):
+    with open(OUTPUT_FILE, "w") as f:
+        json.dump(data, f, indent=2)
+
+
+async def reserve_all(deployer, names, block_uuid, vnet_prefix, realm_id, shard):
+    """Reserve one /vnet_prefix per VNet concurrently (blocking calls in threads).
+    Returns one reservation or exception per name."""
+    candidates = max(8, 2 * len(names))
+
+    async def reserve(i, name):
+        reserved, address, cidr = await asyncio.to_thread(
+            deployer.reserve_next_available, block_uuid, vnet_prefix, federated_realm=realm_id,
+            federated_pool_id=None, name=f"{name}-reserved", comment=f"Reserved for Azure VNet {name}",
+            candidates=candidates, shard=shard + i)
+        return {"address": address, "cidr": cidr, "reserved_block_id": reserved.get("id")}
+
+    return await asyncio.gather(*(reserve(i, name) for i, name in enumerate(names)), return_exceptions=True)
+
+
+async def deploy(args, subscription_id):
+    ipam = InfobloxVPCDeployer()
+    ipam.authenticate()
+    ipam.switch_account()
+    block, block_uuid = ipam.get_aws_block(block_name=args.block_name)
+    realm_id = ipam.get_realm_id()
+    names = [args.vnet_name] if args.count == 1 else [f"{args.vnet_name}-{i:02d}" for i in range(1, args.count + 1)]
+
+    print(f"\n{'='*60}")
+    print(f"📋 Plan: {len(names)} × /{args.vnet_cidr} VNet + {args.subnet_count} × /{args.subnet_cidr} subnet")
+    print(f"   Block:    {args.block_name} {block.get('address')}/{block.get('cidr')}")
+    print(f"   Location: {args.location}")
+    print(f"{'='*60}\n")
+
+    if args.dry_run:
+        blocks = ipam.get_next_available_blocks(block_uuid, args.vnet_cidr, count=len(names))
+        print(f"\n🔍 DRY RUN — Would create:")
+        for name, (address, cidr) in zip(names, blocks):
+            subnets = subnet_cidrs(f"{address}/{cidr}", args.subnet_cidr, args.subnet_count)
+            print(f"   {name:<24} VNet {address}/{cidr:<4} Subnets {', '.join(subnets)}")
+        return
+
+    results = await reserve_all(ipam, names, block_uuid, args.vnet_cidr, realm_id, default_shard())
+    reserved = [(n, r) for n, r in zip(names, results) if not isinstance(r, Exception)]
+    # Record reservations before touching Azure, so --teardown can always release them
+    output = {"vnets": [{"name": n, "infoblox": dict(r, realm_id=realm_id)} for n, r in reserved],
+              "subscription_id": subscription_id}
+    save_output(output)
+    errors = [r for r in results if isinstance(r, Exception)]
+    if errors:
+        print(f"❌ {len(errors)} reservations failed: {errors[0]}")
+        print(f"   {len(reserved)} reserved are recorded in {OUTPUT_FILE}; release them with --teardown")
+        sys.exit(1)
+    names, reservations = [n for n, _ in reserved], [r for _, r in reserved]
+
+    start = time.perf_counter()
+    async with AzureVNetDeployer(subscription_id, args.location) as azure:
+        results = await asyncio.gather(*(
+            azure.deploy(name, f"{r['address']}/{r['cidr']}",
+                         subnet_cidrs(f"{r['address']}/{r['cidr']}", args.subnet_cidr, args.subnet_count), {})
+            for name, r in zip(names, reservations)), return_exceptions=True)
+    elapsed = time.perf_counter() - start
+
+    failed = 0
+    for record, result in zip(output["vnets"], results):
+        if isinstance(result, Exception):
+            failed += 1
+            record["error"] = str(result)
+            print(f"❌ {record['name']}: {result}")
+        else:
+            record.update(result)
+    save_output(output)
+
+    print(f"\n{'='*60}")
+    print("🎉 VNet Deployment Complete!" if not failed else f"⚠️ {failed}/{len(names)} VNets failed")
+    for record in output["vnets"]:
+        if "id" in record:
+            print(f"   {record['name']:<24} {record['cidr']:<18} "
+                  f"{', '.join(s['cidr'] for s in record['subnets'])}  ({record['resource_group']})")
+    print(f"\n   ⏱️ Azure wall time {elapsed:.1f}s; per operation (start → duration):")
+    for label, offset, seconds in sorted(azure.timings, key=lambda t: t[1]):
+        print(f"      +{offset:6.1f}s {seconds:6.1f}s  {label}")
+    print(f"   Sum of operations {sum(t for _, _, t in azure.timings):.1f}s")
+    print(f"\n   📄 Output → {OUTPUT_FILE}")
+    print(f"{'='*60}")
+    if failed:
+        sys.exit(1)
+
+
+async def teardown(args, subscription_id):
+    with open(OUTPUT_FILE, "r") as f:
+        output = json.load(f)
+    vnets = output.get("vnets", [])
+    # Also VNets whose deploy failed part-way: their <name>-rg may exist
+    groups = [v.get("resource_group") or f"{v['name']}-rg" for v in vnets]
+    print(f"🗑️ Deleting {len(groups)} resource groups concurrently...")
+    async with AzureVNetDeployer(subscription_id, args.location) as azure:
+        results = await asyncio.gather(*(azure.delete_resource_group(rg) for rg in groups), return_exceptions=True)
+    errors = [r for r in results if isinstance(r, Exception)]
+    for e in errors:
+        print(f"❌ {e}")
+    if errors:
+        print("⚠️ Keeping reservations for VNets that may still exist")
+        sys.exit(1)
+
+    ipam = InfobloxVPCDeployer()
+    ipam.authenticate()
+    ipam.switch_account()
+    for v in vnets:
+        ipam.delete_reserved_block(v["infoblox"]["reserved_block_id"])
+    os.remove(OUTPUT_FILE)
+    print(f"✅ Removed {len(groups)} VNets and released {len(vnets)} reservations")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Deploy Azure VNets from Infoblox Federated IPAM")
+    parser.add_argument("--vnet-cidr", type=int, default=24, help="CIDR prefix for each VNet (default: 24)")
+    parser.add_argument("--subnet-cidr", type=int, default=26, help="CIDR prefix for subnets (default: 26)")
+    parser.add_argument("--subnet-count", type=int, default=1, help="Subnets per VNet (default: 1)")
+    parser.add_argument("--count", type=int, default=1, help="Number of VNets, deployed concurrently (default: 1)")
+    parser.add_argument("--block-name", default="AWS",
+                        help="Federated block to allocate from, as in federation_output.json (default: AWS)")
+    parser.add_argument("--vnet-name", default="apps-vnet-from-ipam", help="VNet name (prefix with --count)")
+    parser.add_argument("--location", default="northeurope", help="Azure region (default: northeurope)")
+    parser.add_argument("--dry-run", action="store_true", help="Preview without creating resources")
+    parser.add_argument("--teardown", action="store_true", help=f"Delete what {OUTPUT_FILE} records")
+    args = parser.parse_args()
+
+    if not args.teardown:
+        # Check the layout before anything is reserved: every /vnet_cidr fits the same subnets
+        try:
+            subnet_cidrs(f"0.0.0.0/{args.vnet_cidr}", args.subnet_cidr, args.subnet_count)
+        except ValueError:
+            print(f"❌ A /{args.vnet_cidr} VNet cannot hold {args.subnet_count} × /{args.subnet_cidr} subnets")
+            sys.exit(1)
+
+    subscription_id = os.getenv(f"{AZURE_ENV}_SUBSCRIPTION_ID")
+    if not subscription_id and not args.dry_run:
+        print(f"❌ {AZURE_ENV}_SUBSCRIPTION_ID not set")
+        sys.exit(1)
+
+    asyncio.run(teardown(args, subscription_id) if args.teardown else deploy(args, subscription_id))
+
+
+if __name__ == "__main__":
+    profiling.install()
+    main()
@@ -11,19 +11,41 @@ Flow:
   5. Create AWS subnet with /25
   6. Create IGW + Route Table
 
+Concurrent deployers:
+  Step 1 only reads, so two deployers can be handed the same /24 and one
+  POST in step 4 would fail. Instead, each deployer prefetches N candidates
+  (count=N) and starts at its own offset in that list (shard hint, derived
+  from INSTRUQT_PARTICIPANT_ID unless --shard is given). A reservation that
+  conflicts (409 / overlap) moves straight on to the next candidate, so many
+  deployers can share one pool without serializing.
+
 Usage:
   python3 deploy_vpc_from_ipam.py
   python3 deploy_vpc_from_ipam.py --dry-run
+  python3 deploy_vpc_from_ipam.py --candidates 16 --shard 3
 """
 
+import agent_client
+agent_client.forward()
+
 import os
 import re
 import sys
 import json
+import zlib
+import time
 import argparse
 import yaml
-import requests
 import boto3
+import requests
+
+import csp_auth
+from http_session import ApiSession
+from idempotency import idempotent_create
+from federation_records import BlockRecord
+from json_stream import first_match
+from rate_governor import govern_boto3_client
+import profiling
 
 
 def load_config_with_env(file_path):
@@ -36,6 +58,23 @@ def load_config_with_env(file_path):
     return yaml.safe_load(interpolated_yaml)
 
 
+def is_reservation_conflict(response):
+    """True if a reserved_block POST failed because the CIDR is already taken."""
+    if response is None:
+        return False
+    if response.status_code == 409:
+        return True
+    text = response.text.lower()
+    return response.status_code == 400 and ("overlap" in text or "already" in text)
+
+
+def default_shard():
+    participant = os.environ.get("INSTRUQT_PARTICIPANT_ID")
+    if participant:
+        return zlib.crc32(participant.encode())
+    return os.getpid()
+
+
 class InfobloxVPCDeployer:
     def __init__(self, config_file="config.yaml"):
         config = load_config_with_env(config_file)
@@ -44,13 +83,21 @@ class InfobloxVPCDeployer:
         self.password = config['password']
         self.sandbox_id_file = config['sandbox_id_file']
         self.jwt = None
+        self.api_key = None
         self.headers = {}
+        self.session = ApiSession()
+        self.ec2 = None
 
     # --- Auth ---
 
     def authenticate(self):
+        self.api_key = csp_auth.load_api_key(self.sandbox_id_file)
+        if self.api_key:
+            self.headers = csp_auth.token_headers(self.api_key)
+            print("✅ Using API key, skipping sign-in.")
+            return
         url = f"{self.base_url}/v2/session/users/sign_in"
-        r = requests.post(url, json={"email": self.email, "password": self.password})
+        r = self.session.post(url, json={"email": self.email, "password": self.password})
         r.raise_for_status()
         self.jwt = r.json()["jwt"]
         self.headers = {
@@ -60,10 +107,13 @@ class InfobloxVPCDeployer:
         print("✅ Logged in and JWT obtained.")
 
     def switch_account(self):
+        if self.api_key:
+            print("🔁 API key is scoped to the sandbox, skipping account switch.")
+            return
         with open(self.sandbox_id_file, "r") as f:
             sandbox_id = f.read().strip()
         url = f"{self.base_url}/v2/session/account_switch"
-        r = requests.post(url, headers=self.headers, json={"id": f"identity/accounts/{sandbox_id}"})
+        r = self.session.post(url, headers=self.headers, json={"id": f"identity/accounts/{sandbox_id}"})
         r.raise_for_status()
         self.jwt = r.json()["jwt"]
         self.headers["Authorization"] = f"Bearer {self.jwt}"
@@ -93,70 +143,115 @@ class InfobloxVPCDeployer:
     def find_apps_pool_id(self, pool_name="APPS"):
         """Find the APPS federated pool ID."""
         url = f"{self.base_url}/api/ddi/v1/federation/federated_pool"
-        r = requests.get(url, headers=self.headers)
+        r = self.session.get(url, headers=self.headers, stream=True)
         r.raise_for_status()
-        for p in r.json().get("results", []):
-            pname = p.get("name", "")
-            if pname.startswith(pool_name) or pool_name in pname:
-                pool_id = p.get("id")
-                print(f"📖 Found pool '{pname}' (ID: {pool_id})")
-                return pool_id
+        # Streamed: stops downloading at the first matching pool
+        p = first_match(r, lambda p: pool_name in (p.get("name") or ""))
+        if p:
+            pool_id = p.get("id")
+            print(f"📖 Found pool '{p.get('name')}' (ID: {pool_id})")
+            return pool_id
         raise ValueError(f"❌ Pool '{pool_name}' not found")
 
     def find_block_for_pool(self, pool_id):
         """Find the federated block linked to a specific pool."""
         url = f"{self.base_url}/api/ddi/v1/federation/federated_block"
-        r = requests.get(url, headers=self.headers)
+        r = self.session.get(url, headers=self.headers, stream=True)
         r.raise_for_status()
-        for b in r.json().get("results", []):
-            if b.get("federated_pool_id") == pool_id:
-                block_uuid = b["id"].split("/")[-1]
-                name = b.get("name") or "(unnamed)"
-                print(f"📖 Found block for pool: {name} {b.get('address')}/{b.get('cidr')} (ID: {block_uuid})")
-                return b, block_uuid
+        match = first_match(r, lambda b: b.get("federated_pool_id") == pool_id)
+        if match:
+            b = BlockRecord.from_api(match)
+            name = b.name or "(unnamed)"
+            print(f"📖 Found block for pool: {name} {b.network} (ID: {b.uuid})")
+            return match, b.uuid
         raise ValueError(f"❌ No federated block found for pool {pool_id}")
 
+    def delete_reserved_block(self, reserved_block_id):
+        """DELETE reserved_block → releases the custom-allocation in AWS IPAM."""
+        block_uuid = reserved_block_id.split("/")[-1]
+        url = f"{self.base_url}/api/ddi/v1/federation/reserved_block/{block_uuid}"
+        r = self.session.delete(url, headers=self.headers)
+        if r.status_code == 404:
+            print(f"⚠️ Reserved block {block_uuid} not found (already released?)")
+            return False
+        if not r.ok:
+            print(f"❌ Error {r.status_code}: {r.text}")
+        r.raise_for_status()
+        print(f"🗑️ Reserved block released: {block_uuid}")
+        return True
+
     def get_next_available_block(self, block_uuid, cidr):
         """GET next available federated block from parent (read-only)."""
+        address, cidr = self.get_next_available_blocks(block_uuid, cidr, count=1)[0]
+        print(f"✅ Next available: {address}/{cidr}")
+        return address, cidr
+
+    def get_next_available_blocks(self, block_uuid, cidr, count):
+        """GET up to `count` next available federated blocks from parent (read-only)."""
         url = f"{self.base_url}/api/ddi/v1/federation/federated_block/{block_uuid}/next_available_federated_block"
-        params = {"cidr": cidr, "count": 1}
-        print(f"🔍 GET next available /{cidr} from block {block_uuid}...")
-        r = requests.get(url, headers=self.headers, params=params)
+        params = {"cidr": cidr, "count": count}
+        print(f"🔍 GET next {count} available /{cidr} from block {block_uuid}...")
+        r = self.session.get(url, headers=self.headers, params=params)
         r.raise_for_status()
         results = r.json().get("results", [])
         if not results:
             raise RuntimeError(f"❌ No available /{cidr} blocks")
-        block = results[0]
-        print(f"✅ Next available: {block.get('address')}/{block.get('cidr')}")
-        return block.get("address"), block.get("cidr")
+        return [(b.get("address"), b.get("cidr")) for b in results]
+
+    def reserve_next_available(self, block_uuid, cidr, federated_realm, federated_pool_id,
+                               name="", comment="", candidates=8, shard=0, max_rounds=5):
+        """Reserve the first free /cidr, moving past candidates taken by concurrent deployers.
+
+        Returns (reserved_block, address, cidr).
+        """
+        for round_no in range(max_rounds):
+            blocks = self.get_next_available_blocks(block_uuid, cidr, count=candidates)
+            # Start at this deployer's shard so concurrent deployers spread out
+            offset = shard % len(blocks)
+            ordered = blocks[offset:] + blocks[:offset]
+            for address, prefix in ordered:
+                try:
+                    reserved = self.create_reserved_block(address, prefix, federated_realm, federated_pool_id,
+                                                          name=name, comment=comment)
+                    return reserved, address, prefix
+                except requests.HTTPError as e:
+                    if not is_reservation_conflict(e.response):
+                        raise
+                    print(f"⚠️ {address}/{prefix} taken by a concurrent deployer, trying next candidate")
+            print(f"⚠️ All {len(ordered)} candidates taken (round {round_no + 1}/{max_rounds}), refetching...")
+        raise RuntimeError(f"❌ Could not reserve a /{cidr} after {max_rounds} rounds of conflicts")
 
     def create_reserved_block(self, address, cidr, federated_realm, federated_pool_id, name="", comment=""):
-        """POST reserved_block with pool ID → custom-allocation in AWS IPAM."""
+        """POST reserved_block; with a pool ID it becomes a custom-allocation in AWS IPAM."""
         url = f"{self.base_url}/api/ddi/v1/federation/reserved_block"
         payload = {
             "address": address,
             "cidr": cidr,
-            "federated_realm": federated_realm,
-            "federated_pool_id": federated_pool_id
+            "federated_realm": federated_realm
         }
+        if federated_pool_id:
+            payload["federated_pool_id"] = federated_pool_id
         if name:
             payload["name"] = name
         if comment:
             payload["comment"] = comment
-        print(f"📤 POST reserved_block {address}/{cidr} (pool: {federated_pool_id})...")
-        r = requests.post(url, headers=self.headers, json=payload)
-        if not r.ok:
-            print(f"❌ Error {r.status_code}: {r.text}")
-        r.raise_for_status()
-        result = r.json().get("result", {})
+        print(f"📤 POST reserved_block {address}/{cidr} (pool: {federated_pool_id or 'none'})...")
+        result = idempotent_create(self.session, url, self.headers, payload)
         print(f"✅ Reserved block created: {address}/{cidr} → {result.get('id')}")
-        print("   ↳ Custom-allocation in AWS IPAM under APPS pool")
+        if federated_pool_id:
+            print("   ↳ Custom-allocation in AWS IPAM under APPS pool")
         return result
 
     # --- AWS ---
 
+    def _ec2(self):
+        if self.ec2 is None:
+            region = os.environ.get('AWS_DEFAULT_REGION', 'eu-west-1')
+            self.ec2 = govern_boto3_client(boto3.client('ec2', region_name=region))
+        return self.ec2
+
     def create_aws_vpc(self, cidr_block, name):
-        ec2 = boto3.client('ec2', region_name=os.environ.get('AWS_DEFAULT_REGION', 'eu-west-1'))
+        ec2 = self._ec2()
         print(f"\n☁️  Creating AWS VPC with CIDR {cidr_block}...")
         resp = ec2.create_vpc(CidrBlock=cidr_block)
         vpc_id = resp['Vpc']['VpcId']
@@ -171,7 +266,7 @@ class InfobloxVPCDeployer:
         return vpc_id
 
     def create_aws_subnet(self, vpc_id, cidr_block, name):
-        ec2 = boto3.client('ec2', region_name=os.environ.get('AWS_DEFAULT_REGION', 'eu-west-1'))
+        ec2 = self._ec2()
         az = os.environ.get('AWS_DEFAULT_REGION', 'eu-west-1') + 'a'
         print(f"☁️  Creating AWS Subnet {cidr_block} in {vpc_id}...")
         resp = ec2.create_subnet(VpcId=vpc_id, CidrBlock=cidr_block, AvailabilityZone=az)
@@ -185,7 +280,7 @@ class InfobloxVPCDeployer:
         return subnet_id
 
     def create_aws_igw(self, vpc_id, name):
-        ec2 = boto3.client('ec2', region_name=os.environ.get('AWS_DEFAULT_REGION', 'eu-west-1'))
+        ec2 = self._ec2()
         print(f"☁️  Creating Internet Gateway for {vpc_id}...")
         resp = ec2.create_internet_gateway()
         igw_id = resp['InternetGateway']['InternetGatewayId']
@@ -198,7 +293,7 @@ class InfobloxVPCDeployer:
         return igw_id
 
     def create_aws_route_table(self, vpc_id, subnet_id, igw_id, name):
-        ec2 = boto3.client('ec2', region_name=os.environ.get('AWS_DEFAULT_REGION', 'eu-west-1'))
+        ec2 = self._ec2()
         print(f"☁️  Creating Route Table for {vpc_id}...")
         resp = ec2.create_route_table(VpcId=vpc_id)
         rt_id = resp['RouteTable']['RouteTableId']
@@ -219,8 +314,13 @@ def main():
     parser.add_argument("--subnet-cidr", type=int, default=25, help="CIDR prefix for subnet (default: 25)")
     parser.add_argument("--pool-name", default="APPS", help="APPS pool name (default: APPS)")
     parser.add_argument("--vpc-name", default="apps-vpc-from-ipam", help="Name tag for the VPC")
+    parser.add_argument("--candidates", type=int, default=8,
+                        help="Candidate CIDRs to prefetch for conflict-free reservation (default: 8)")
+    parser.add_argument("--shard", type=int, default=None,
+                        help="Shard hint: start offset in the candidate list (default: from INSTRUQT_PARTICIPANT_ID)")
     parser.add_argument("--dry-run", action="store_true", help="Preview without creating resources")
     args = parser.parse_args()
+    shard = args.shard if args.shard is not None else default_shard()
 
     deployer = InfobloxVPCDeployer()
     deployer.authenticate()
@@ -238,36 +338,40 @@ def main():
     print(f"   Pool:  {args.pool_name} ({apps_pool_id})")
     print(f"{'='*60}\n")
 
-    # Step 1: GET next available /24 from APPS block (10.10.0.0/16)
-    vpc_addr, vpc_cidr = deployer.get_next_available_block(block_uuid, args.vpc_cidr)
-    vpc_cidr_block = f"{vpc_addr}/{vpc_cidr}"
-
-    # Step 2: GET next available /25 for subnet
-    subnet_cidr_block = f"{vpc_addr}/{args.subnet_cidr}"
-    print(f"✅ Subnet CIDR: {subnet_cidr_block}")
-
     if args.dry_run:
+        # Step 1: GET next available /24 from APPS block (10.10.0.0/16)
+        vpc_addr, vpc_cidr = deployer.get_next_available_block(block_uuid, args.vpc_cidr)
         print(f"\n🔍 DRY RUN — Would create:")
-        print(f"   VPC:            {vpc_cidr_block}")
-        print(f"   Subnet:         {subnet_cidr_block}")
+        print(f"   VPC:            {vpc_addr}/{vpc_cidr}")
+        print(f"   Subnet:         {vpc_addr}/{args.subnet_cidr}")
         print(f"   Reserved Block: {vpc_addr}/{vpc_cidr} → APPS pool")
         return
 
-    # Step 3: POST reserved_block FIRST → custom-allocation in AWS IPAM
-    reserved = deployer.create_reserved_block(
-        address=vpc_addr,
-        cidr=vpc_cidr,
+    # Steps 1+3: take the next available /24 and POST reserved_block FIRST
+    # → custom-allocation in AWS IPAM; conflicts move on to the next candidate
+    reserved, vpc_addr, vpc_cidr = deployer.reserve_next_available(
+        block_uuid,
+        args.vpc_cidr,
         federated_realm=realm_id,
         federated_pool_id=apps_pool_id,
         name=f"{args.vpc_name}-reserved",
-        comment=f"Reserved for {args.vpc_name}"
+        comment=f"Reserved for {args.vpc_name}",
+        candidates=args.candidates,
+        shard=shard
     )
+    vpc_cidr_block = f"{vpc_addr}/{vpc_cidr}"
+
+    # Step 2: /25 subnet at the start of the VPC range
+    subnet_cidr_block = f"{vpc_addr}/{args.subnet_cidr}"
+    print(f"✅ Subnet CIDR: {subnet_cidr_block}")
 
     # Step 4: Create VPC
     vpc_id = deployer.create_aws_vpc(vpc_cidr_block, name=args.vpc_name)
+    vpc_created_at = time.time()
 
     # Step 5: Create Subnet
     subnet_id = deployer.create_aws_subnet(vpc_id, subnet_cidr_block, name=f"{args.vpc_name}-subnet")
+    subnet_created_at = time.time()
 
     # Step 6: IGW + Route Table
     igw_id = deployer.create_aws_igw(vpc_id, name=f"{args.vpc_name}-igw")
@@ -275,10 +379,11 @@ def main():
 
     # Save output
     output = {
-        "vpc": {"id": vpc_id, "cidr": vpc_cidr_block, "name": args.vpc_name},
-        "subnet": {"id": subnet_id, "cidr": subnet_cidr_block},
+        "vpc": {"id": vpc_id, "cidr": vpc_cidr_block, "name": args.vpc_name, "created_at": vpc_created_at},
+        "subnet": {"id": subnet_id, "cidr": subnet_cidr_block, "created_at": subnet_created_at},
         "igw": {"id": igw_id},
         "route_table": {"id": rt_id},
+        "region": os.environ.get('AWS_DEFAULT_REGION', 'eu-west-1'),
         "infoblox": {
             "reserved_block_id": reserved.get("id"),
             "pool_id": apps_pool_id,
@@ -304,4 +409,5 @@ def main():
 
 
 if __name__ == "__main__":
+    profiling.install()
     main()
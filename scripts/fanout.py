@@ -0,0 +1,280 @@
+#!/usr/bin/env python3
+"""
+Fan one operation out to many sandboxes with a single admin session.
+
+Signs in once as the admin, switches into every target sandbox
+concurrently (one JWT per sandbox, cached and reused until it nears
+expiry, refreshed once on 401), runs the operation, and aggregates
+per-sandbox results and latencies. Fleet-wide changes become one
+command bounded by --max-workers.
+
+Operations:
+  get PATH                      GET a CSP path in every sandbox (audit)
+  post PATH --payload FILE      POST a JSON payload ({sandbox_id} is substituted),
+                                with idempotency keys so retries never duplicate
+  add-block                     Add a federated block to a realm in every sandbox
+
+Targets come from --sandbox (repeatable) and/or --targets FILE: one
+sandbox ID per line, or a CSV with a sandbox_id column (the
+user_provision.py --manifest format works as-is).
+
+Usage:
+  python3 fanout.py --targets sandboxes.txt get /api/ddi/v1/federation/federated_realm
+  python3 fanout.py --targets participants.csv --max-workers 32 \\
+      add-block --realm "ACME Corporation" --name EDGE --address 10.50.0.0 --cidr 16
+  python3 fanout.py --sandbox abc --sandbox def post /api/ddi/v1/federation/federated_pool --payload pool.json
+
+Output Files:
+  fanout_results.json - Per-sandbox status, latency and result
+"""
+
+import agent_client
+agent_client.forward()
+
+import os
+import re
+import sys
+import csv
+import json
+import time
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import yaml
+import requests
+
+from http_session import ApiSession
+from idempotency import idempotent_create
+import profiling
+
+# CSP JWTs are valid for an hour; switch again well before that
+JWT_MAX_AGE = 45 * 60
+
+
+def load_config_with_env(file_path):
+    with open(file_path, "r") as f:
+        raw_yaml = f.read()
+
+    def replace_env(match):
+        env_var = match.group(1)
+        return os.environ.get(env_var, f"<MISSING:{env_var}>")
+
+    interpolated_yaml = re.sub(r'\$\{(\w+)\}', replace_env, raw_yaml)
+    return yaml.safe_load(interpolated_yaml)
+
+
+def read_targets(filename):
+    """Sandbox IDs from a plain list or a CSV with a sandbox_id column."""
+    with open(filename, "r", newline="") as f:
+        first = f.readline()
+        f.seek(0)
+        if "sandbox_id" in [c.strip() for c in first.split(",")]:
+            ids = [row["sandbox_id"].strip() for row in csv.DictReader(f)]
+        else:
+            ids = [line.strip() for line in f]
+    return [i for i in ids if i and not i.startswith("#")]
+
+
+class FanOutExecutor:
+    def __init__(self, config_file="config.yaml", max_workers=16, settle=0):
+        config = load_config_with_env(config_file)
+
+        self.base_url = config['base_url']
+        self.email = config['email']
+        self.password = config['password']
+        self.max_workers = max_workers
+        self.settle = settle
+        self.admin_headers = None
+        self.session = ApiSession()
+        self._jwts = {}            # sandbox_id -> (headers, obtained_at)
+        self._locks = {}
+        self._lock = threading.Lock()
+
+    def authenticate(self):
+        """Login once as the admin"""
+        url = f"{self.base_url}/v2/session/users/sign_in"
+        payload = {"email": self.email, "password": self.password}
+        r = self.session.post(url, json=payload)
+        r.raise_for_status()
+        self.admin_headers = {
+            "Authorization": f"Bearer {r.json()['jwt']}",
+            "Content-Type": "application/json"
+        }
+        print("✅ Logged in and JWT obtained.")
+
+    def sandbox_headers(self, sandbox_id, refresh=False):
+        """Headers for a sandbox, switching into it only when no fresh JWT is cached."""
+        with self._lock:
+            lock = self._locks.setdefault(sandbox_id, threading.Lock())
+        with lock:
+            cached = self._jwts.get(sandbox_id)
+            if cached and not refresh and time.monotonic() - cached[1] < JWT_MAX_AGE:
+                return cached[0]
+            url = f"{self.base_url}/v2/session/account_switch"
+            payload = {"id": f"identity/accounts/{sandbox_id}"}
+            r = self.session.post(url, headers=self.admin_headers, json=payload)
+            r.raise_for_status()
+            headers = {
+                "Authorization": f"Bearer {r.json()['jwt']}",
+                "Content-Type": "application/json"
+            }
+            self._jwts[sandbox_id] = (headers, time.monotonic())
+            if self.settle:
+                time.sleep(self.settle)  # permission lag on freshly created sandboxes
+            return headers
+
+    def _run_one(self, operation, sandbox_id):
+        start = time.monotonic()
+        try:
+            headers = self.sandbox_headers(sandbox_id)
+            switched = time.monotonic()
+            try:
+                result = operation(self, sandbox_id, headers)
+            except requests.HTTPError as e:
+                if e.response is None or e.response.status_code != 401:
+                    raise
+                # JWT revoked or expired early: switch again once
+                result = operation(self, sandbox_id, self.sandbox_headers(sandbox_id, refresh=True))
+            end = time.monotonic()
+            return {"sandbox_id": sandbox_id, "status": "ok", "result": result,
+                    "switch_s": round(switched - start, 3), "latency_s": round(end - start, 3)}
+        except Exception as e:
+            return {"sandbox_id": sandbox_id, "status": "failed", "error": str(e),
+                    "latency_s": round(time.monotonic() - start, 3)}
+
+    def run(self, operation, sandbox_ids):
+        """Run operation(executor, sandbox_id, headers) in every sandbox. Returns per-sandbox results."""
+        results = []
+        print(f"🚀 Fanning out to {len(sandbox_ids)} sandboxes ({self.max_workers} concurrent)...", flush=True)
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            futures = [pool.submit(self._run_one, operation, s) for s in sandbox_ids]
+            for future in as_completed(futures):
+                r = future.result()
+                results.append(r)
+                if r["status"] == "ok":
+                    print(f"  ✅ {r['sandbox_id']} ({r['latency_s']:.2f}s)", flush=True)
+                else:
+                    print(f"  ❌ {r['sandbox_id']}: {r['error']}", flush=True)
+        order = {s: i for i, s in enumerate(sandbox_ids)}
+        return sorted(results, key=lambda r: order[r["sandbox_id"]])
+
+
+# --- Operations ---
+
+def op_get(path):
+    def get(executor, sandbox_id, headers):
+        r = executor.session.get(f"{executor.base_url}{path}", headers=headers)
+        r.raise_for_status()
+        body = r.json()
+        if isinstance(body.get("results"), list):
+            return {"count": len(body["results"]), "results": body["results"]}
+        return body
+    return get
+
+
+def op_post(path, payload_template):
+    def post(executor, sandbox_id, headers):
+        payload = json.loads(payload_template.replace("{sandbox_id}", sandbox_id))
+        result = idempotent_create(executor.session, f"{executor.base_url}{path}", headers, payload)
+        return {"id": result.get("id")}
+    return post
+
+
+def op_add_block(realm, name, address, cidr, comment=""):
+    def add_block(executor, sandbox_id, headers):
+        base = f"{executor.base_url}/api/ddi/v1/federation"
+        r = executor.session.get(f"{base}/federated_realm", headers=headers,
+                                 params={"_filter": f'name=="{realm}"'})
+        r.raise_for_status()
+        realms = r.json().get("results", [])
+        if not realms:
+            raise ValueError(f"Realm '{realm}' not found")
+        payload = {
+            "name": name,
+            "address": address,
+            "cidr": cidr,
+            "comment": comment,
+            "federated_realm": realms[0]["id"],
+            "utilization": 0
+        }
+        result = idempotent_create(executor.session, f"{base}/federated_block", headers, payload)
+        return {"id": result.get("id")}
+    return add_block
+
+
+def percentile(values, p):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(p * len(ordered)))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run one operation in many sandboxes with one admin session")
+    parser.add_argument("--config", default="config.yaml", help="Config file path")
+    parser.add_argument("--targets", help="File with sandbox IDs (one per line, or CSV with sandbox_id)")
+    parser.add_argument("--sandbox", action="append", default=[], help="Target sandbox ID (repeatable)")
+    parser.add_argument("--max-workers", type=int, default=16, help="Concurrent sandboxes (default: 16)")
+    parser.add_argument("--settle", type=float, default=0, help="Seconds to wait after each account switch (default: 0)")
+    parser.add_argument("--output", default="fanout_results.json", help="Results file (default: fanout_results.json)")
+    sub = parser.add_subparsers(dest="operation", required=True)
+
+    get = sub.add_parser("get", help="GET a path in every sandbox")
+    get.add_argument("path")
+
+    post = sub.add_parser("post", help="POST a JSON payload in every sandbox")
+    post.add_argument("path")
+    post.add_argument("--payload", required=True, help="JSON file; {sandbox_id} is substituted")
+
+    block = sub.add_parser("add-block", help="Add a federated block in every sandbox")
+    block.add_argument("--realm", required=True, help="Realm name")
+    block.add_argument("--name", required=True, help="Block name")
+    block.add_argument("--address", required=True, help="Block address, e.g. 10.50.0.0")
+    block.add_argument("--cidr", type=int, required=True, help="Prefix length, e.g. 16")
+    block.add_argument("--comment", default="", help="Block comment")
+    args = parser.parse_args()
+
+    sandbox_ids = list(args.sandbox)
+    if args.targets:
+        sandbox_ids.extend(read_targets(args.targets))
+    sandbox_ids = list(dict.fromkeys(sandbox_ids))
+    if not sandbox_ids:
+        parser.error("no targets: use --sandbox and/or --targets")
+
+    if args.operation == "get":
+        operation = op_get(args.path)
+    elif args.operation == "post":
+        with open(args.payload, "r") as f:
+            operation = op_post(args.path, f.read())
+    else:
+        operation = op_add_block(args.realm, args.name, args.address, args.cidr, args.comment)
+
+    executor = FanOutExecutor(args.config, max_workers=args.max_workers, settle=args.settle)
+    start = time.monotonic()
+    executor.authenticate()
+    results = executor.run(operation, sandbox_ids)
+    elapsed = time.monotonic() - start
+
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+
+    ok = [r for r in results if r["status"] == "ok"]
+    failed = [r for r in results if r["status"] != "ok"]
+    latencies = [r["latency_s"] for r in ok]
+    print(f"\n{'='*60}")
+    print("🎉 Fan-out Complete!" if not failed else "⚠️ Fan-out finished with errors")
+    print(f"   Operation: {args.operation}")
+    print(f"   Sandboxes: {len(results)} ({len(ok)} ok, {len(failed)} failed)")
+    print(f"   Latency:   p50 {percentile(latencies, 0.5):.2f}s, p95 {percentile(latencies, 0.95):.2f}s, "
+          f"max {max(latencies, default=0):.2f}s")
+    print(f"   Wall time: {elapsed:.1f}s")
+    print(f"   Results:   {args.output}")
+    print(f"{'='*60}")
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    profiling.install()
+    main()
@@ -0,0 +1,309 @@
+"""
+Compact record types and indexes for federation objects.
+
+The lab scripts pass API results around as plain dicts and find things
+with linear scans, which is fine for the handful of blocks in config.yaml
+but not for tenants with 100k+ blocks and reserved blocks. Records keep
+only the fields every lookup needs in __slots__ (id, name, address as an
+int, prefix length, realm, pool); everything else (comment, tags,
+utilization, timestamps, ...) stays as compact JSON bytes and is decoded
+the first time one of those fields is read. Repeated strings such as realm
+and pool ids are interned, so 100k blocks in one realm share one string.
+
+RecordIndex adds id / name / pool lookups and "smallest block containing
+this address" on top, built once per listing. assign_parents() resolves
+the nesting of a whole listing at once.
+
+Records answer .get() / [] like the dicts they replace, so existing code
+that does block.get("address") keeps working. bench_federation_records.py
+compares memory and lookup time against lists of dicts.
+"""
+
+import sys
+import json
+import ipaddress
+
+_HOT_FIELDS = ("id", "name", "address", "cidr", "federated_realm", "federated_pool_id")
+_COMPACT = (",", ":")
+
+
+class BlockRecord:
+    """A federated block or reserved block."""
+
+    __slots__ = ("id", "name", "address", "prefixlen", "version", "realm", "pool", "_extra")
+
+    def __init__(self, id, name, address, prefixlen, version=4, realm=None, pool=None, extra=None):
+        self.id = id
+        self.name = name
+        self.address = address
+        self.prefixlen = prefixlen
+        self.version = version
+        self.realm = realm
+        self.pool = pool
+        self._extra = json.dumps(extra, separators=_COMPACT).encode() if extra else None
+
+    @classmethod
+    def from_api(cls, obj):
+        """Build a record from an API result dict (the dict is not kept).
+
+        Raises ValueError if the address or cidr is missing or invalid.
+        """
+        label = obj.get("id") or obj.get("name")
+        if not obj.get("address") or obj.get("cidr") in (None, ""):
+            raise ValueError(f"{label}: missing address or cidr")
+        try:
+            address = ipaddress.ip_address(obj["address"])
+        except ValueError as e:
+            raise ValueError(f"{label}: {e}") from None
+        extra = {k: v for k, v in obj.items() if k not in _HOT_FIELDS}
+        realm = obj.get("federated_realm")
+        pool = obj.get("federated_pool_id")
+        return cls(obj.get("id"), obj.get("name"), int(address), int(obj["cidr"]), address.version,
+                   sys.intern(realm) if realm else None, sys.intern(pool) if pool else None, extra)
+
+    @property
+    def uuid(self):
+        return self.id.split("/")[-1] if self.id else None
+
+    @property
+    def network(self):
+        return ipaddress.IPv4Network((self.address, self.prefixlen)) if self.version == 4 \
+            else ipaddress.IPv6Network((self.address, self.prefixlen))
+
+    @property
+    def address_str(self):
+        return str(ipaddress.IPv4Address(self.address) if self.version == 4 else ipaddress.IPv6Address(self.address))
+
+    @property
+    def extra(self):
+        """Rarely used fields, decoded on first access."""
+        if self._extra is None:
+            return {}
+        if isinstance(self._extra, bytes):
+            self._extra = json.loads(self._extra)
+        return self._extra
+
+    def to_dict(self):
+        """The API dict this record was built from."""
+        d = {
+            "id": self.id,
+            "name": self.name,
+            "address": self.address_str,
+            "cidr": self.prefixlen,
+            "federated_realm": self.realm,
+        }
+        if self.pool is not None:
+            d["federated_pool_id"] = self.pool
+        d.update(self.extra)
+        return d
+
+    def get(self, key, default=None):
+        if key == "id":
+            value = self.id
+        elif key == "name":
+            value = self.name
+        elif key == "address":
+            value = self.address_str
+        elif key == "cidr":
+            value = self.prefixlen
+        elif key == "federated_realm":
+            value = self.realm
+        elif key == "federated_pool_id":
+            value = self.pool
+        else:
+            return self.extra.get(key, default)
+        return default if value is None else value
+
+    def __getitem__(self, key):
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            raise KeyError(key)
+        return value
+
+    def __repr__(self):
+        return f"BlockRecord({self.name!r}, {self.network}, id={self.uuid})"
+
+
+class PoolRecord:
+    """A federated pool."""
+
+    __slots__ = ("id", "name", "realm", "_extra")
+
+    def __init__(self, id, name, realm=None, extra=None):
+        self.id = id
+        self.name = name
+        self.realm = realm
+        self._extra = json.dumps(extra, separators=_COMPACT).encode() if extra else None
+
+    @classmethod
+    def from_api(cls, obj):
+        realm = obj.get("federated_realm")
+        extra = {k: v for k, v in obj.items() if k not in ("id", "name", "federated_realm")}
+        return cls(obj.get("id"), obj.get("name"), sys.intern(realm) if realm else None, extra)
+
+    @property
+    def uuid(self):
+        return self.id.split("/")[-1] if self.id else None
+
+    extra = BlockRecord.extra
+
+    def to_dict(self):
+        d = {"id": self.id, "name": self.name, "federated_realm": self.realm}
+        d.update(self.extra)
+        return d
+
+    def get(self, key, default=None):
+        if key == "id":
+            value = self.id
+        elif key == "name":
+            value = self.name
+        elif key == "federated_realm":
+            value = self.realm
+        else:
+            return self.extra.get(key, default)
+        return default if value is None else value
+
+    def __getitem__(self, key):
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            raise KeyError(key)
+        return value
+
+    def __repr__(self):
+        return f"PoolRecord({self.name!r}, id={self.uuid})"
+
+
+_MISSING = object()
+
+
+def _uuid(record_id):
+    return record_id.rsplit("/", 1)[-1] if record_id else record_id
+
+
+class RecordIndex:
+    """id / name / pool lookups over a list of records.
+
+    by_id is keyed by uuid, so full ids ("federation/federated_block/<uuid>")
+    and bare uuids both resolve.
+
+    Names are not unique in the API, so by_name keeps the first record with
+    each name (what the old linear scans returned); named_all() has the rest.
+
+    from_results() leaves out results that are not valid records (no
+    address or cidr) and lists their errors in `invalid`.
+    """
+
+    def __init__(self, records):
+        self.records = records if isinstance(records, list) else list(records)
+        self.invalid = []
+        self.by_id = {}
+        self.by_name = {}
+        self.by_pool = {}
+        for rec in self.records:
+            self.by_id[_uuid(rec.id)] = rec
+            self.by_name.setdefault(rec.name, rec)
+            pool = getattr(rec, "pool", None)
+            if pool is not None:
+                self.by_pool.setdefault(pool, []).append(rec)
+        self._prefixes = None
+
+    @classmethod
+    def from_results(cls, results, record_type=BlockRecord):
+        records = []
+        invalid = []
+        for obj in results:
+            try:
+                records.append(record_type.from_api(obj))
+            except ValueError as e:
+                invalid.append(str(e))
+        index = cls(records)
+        index.invalid = invalid
+        return index
+
+    def __len__(self):
+        return len(self.records)
+
+    def __iter__(self):
+        return iter(self.records)
+
+    def get(self, record_id):
+        """Lookup by full id or bare uuid."""
+        return self.by_id.get(_uuid(record_id))
+
+    def named(self, name):
+        return self.by_name.get(name)
+
+    def named_all(self, name):
+        return [r for r in self.records if r.name == name]
+
+    def for_pool(self, pool_id):
+        return self.by_pool.get(pool_id, [])
+
+    def containing(self, address, max_prefixlen=None):
+        """Smallest block containing `address` (str or ipaddress), or None.
+
+        With max_prefixlen, only blocks at least that large are considered,
+        e.g. the block that holds a whole network rather than its first address.
+        """
+        ip = ipaddress.ip_address(address)
+        if self._prefixes is None:
+            # (version, prefix) -> {network bits: record}: one dict hit per
+            # prefix length in use, longest first
+            self._prefixes = {}
+            for rec in self.records:
+                if isinstance(rec, BlockRecord):
+                    bits = 32 if rec.version == 4 else 128
+                    table = self._prefixes.setdefault((rec.version, rec.prefixlen), {})
+                    table.setdefault(rec.address >> (bits - rec.prefixlen), rec)
+        bits = 32 if ip.version == 4 else 128
+        target = int(ip)
+        for version, prefixlen in sorted(self._prefixes, key=lambda k: -k[1]):
+            if version == ip.version and (max_prefixlen is None or prefixlen <= max_prefixlen):
+                rec = self._prefixes[(version, prefixlen)].get(target >> (bits - prefixlen))
+                if rec is not None:
+                    return rec
+        return None
+
+
+def _network(obj):
+    try:
+        return ipaddress.ip_network(f"{obj.get('address')}/{obj.get('cidr')}", strict=False)
+    except ValueError:
+        return None
+
+
+def assign_parents(containers, children=None):
+    """Map each object id to the id of the smallest container holding it.
+
+    Sort-and-stack walk over (version, address, prefix), so nesting is
+    resolved in O(n log n) instead of comparing every pair.
+    """
+    entries = []
+    for obj in containers:
+        net = _network(obj)
+        if net:
+            entries.append((net.version, int(net.network_address), net.prefixlen, 0, obj["id"], net))
+    for obj in children or []:
+        net = _network(obj)
+        if net:
+            # Children sort after a container with the same CIDR
+            entries.append((net.version, int(net.network_address), net.prefixlen, 1, obj["id"], net))
+    entries.sort(key=lambda e: e[:4])
+
+    parents = {}
+    stack = []
+    for version, _, _, is_child, obj_id, net in entries:
+        while stack and (stack[-1][1].version != version or not net.subnet_of(stack[-1][1])):
+            stack.pop()
+        if stack:
+            parents[obj_id] = stack[-1][0]
+        if not is_child:
+            stack.append((obj_id, net))
+    return parents
+
+
+def load_blocks(output_file="federation_output.json"):
+    """RecordIndex over the blocks of a federation_output.json."""
+    with open(output_file, "r") as f:
+        data = json.load(f)
+    return RecordIndex.from_results(data.get("blocks", []))
@@ -0,0 +1,459 @@
+#!/usr/bin/env python3
+"""
+Snapshot a tenant's federation state into a compact columnar file.
+
+federation_output.json only holds what deploy_ipam.py created, pretty
+printed. For audits and what-if analysis we want every realm, pool, block
+and reserved block, without downloading the tenant again for each run.
+`save` pages through the federation API (streamed, one object at a time)
+into per-column arrays and writes them as one packed binary file; `load`
+memory-maps it back, so opening even a 100k-block snapshot takes
+milliseconds and only the columns (and rows) you touch are read from disk.
+
+File format (little-endian):
+
+  b"FEDSNAP\\x01"  u32 header length  header JSON  padding to 8 bytes
+  column data, each column 8-byte aligned
+
+The header lists, per table, the row count and (offset, length, type) of
+each column. Types: u8, i32, u64, str (u32 end offsets + UTF-8 blob).
+Addresses are integer-encoded as addr_hi/addr_lo u64 pairs (addr_hi is 0
+for IPv4) with a u8 prefixlen and version. Realm and pool links are i32
+row numbers into the realms/pools tables (-1 = none). All other fields
+(comment, tags, utilization, ...) are kept per row as compact JSON in the
+`extra` column and only decoded when asked for.
+
+Usage:
+  python3 federation_snapshot.py save                     # all realms
+  python3 federation_snapshot.py save --realm "ACME Corporation" -o acme.fedsnap
+  python3 federation_snapshot.py info federation.fedsnap
+  python3 federation_snapshot.py info federation.fedsnap --show APPS
+
+  from federation_snapshot import load_snapshot
+  snap = load_snapshot("federation.fedsnap")
+  index = snap.block_index()          # federation_records.RecordIndex
+  index.containing("10.20.1.7")
+
+Output Files:
+  federation.fedsnap - The snapshot (default name)
+"""
+
+import agent_client
+agent_client.forward()
+
+import os
+import sys
+import json
+import mmap
+import time
+import array
+import struct
+import argparse
+import ipaddress
+
+from deploy_ipam import InfobloxCSPClient
+from federation_records import BlockRecord, PoolRecord, RecordIndex
+from json_stream import iter_results
+import profiling
+
+MAGIC = b"FEDSNAP\x01"
+FEDERATION_API = "/api/ddi/v1/federation"
+PAGE_SIZE = 1000
+
+# table -> API kind
+TABLES = {
+    "realms": "federated_realm",
+    "pools": "federated_pool",
+    "blocks": "federated_block",
+    "reserved_blocks": "reserved_block",
+}
+_TYPECODES = {"u8": "B", "i32": "i", "u64": "Q"}
+_BLOCK_FIELDS = ("id", "name", "address", "cidr", "federated_realm", "federated_pool_id")
+_COMPACT = (",", ":")
+
+if array.array("I").itemsize != 4 or array.array("i").itemsize != 4 or array.array("Q").itemsize != 8:
+    raise ImportError("federation_snapshot needs 4-byte I/i and 8-byte Q arrays")
+
+
+def _array(typecode, data):
+    """Little-endian array from bytes, copying only on big-endian hosts."""
+    if sys.byteorder == "little":
+        return memoryview(data).cast(typecode)
+    a = array.array(typecode, bytes(data))
+    a.byteswap()
+    return a
+
+
+# --- Writing ---
+
+class _StrColumn:
+    def __init__(self):
+        self.ends = array.array("I")
+        self.blob = bytearray()
+
+    def append(self, value):
+        if value is not None:
+            self.blob += value.encode("utf-8")
+        self.ends.append(len(self.blob))
+
+
+class _TableBuilder:
+    def __init__(self, columns):
+        self.rows = 0
+        self.columns = {}
+        for name, kind in columns:
+            self.columns[name] = _StrColumn() if kind == "str" else array.array(_TYPECODES[kind])
+        self.kinds = dict(columns)
+
+    def append(self, **values):
+        for name, column in self.columns.items():
+            column.append(values[name])
+        self.rows += 1
+
+
+def _extra(obj, hot):
+    rest = {k: v for k, v in obj.items() if k not in hot}
+    return json.dumps(rest, separators=_COMPACT) if rest else None
+
+
+def _split_address(obj):
+    """(version, high 64 bits, low 64 bits, prefix length); ValueError without address/cidr."""
+    label = obj.get("id") or obj.get("name")
+    if not obj.get("address") or obj.get("cidr") in (None, ""):
+        raise ValueError(f"{label}: missing address or cidr")
+    try:
+        address = ipaddress.ip_address(obj["address"])
+    except ValueError as e:
+        raise ValueError(f"{label}: {e}") from None
+    value = int(address)
+    return address.version, value >> 64, value & 0xFFFFFFFFFFFFFFFF, int(obj["cidr"])
+
+
+class SnapshotWriter:
+    """Collects federation objects into column arrays, then writes one file."""
+
+    BLOCK_COLUMNS = [("id", "str"), ("name", "str"), ("version", "u8"), ("addr_hi", "u64"),
+                     ("addr_lo", "u64"), ("prefixlen", "u8"), ("realm", "i32"), ("pool", "i32"),
+                     ("extra", "str")]
+
+    def __init__(self):
+        self.tables = {
+            "realms": _TableBuilder([("id", "str"), ("name", "str"), ("extra", "str")]),
+            "pools": _TableBuilder([("id", "str"), ("name", "str"), ("realm", "i32"), ("extra", "str")]),
+            "blocks": _TableBuilder(self.BLOCK_COLUMNS),
+            "reserved_blocks": _TableBuilder(self.BLOCK_COLUMNS),
+        }
+        self.realm_rows = {}
+        self.pool_rows = {}
+
+    def add(self, table, obj):
+        t = self.tables[table]
+        if table == "realms":
+            self.realm_rows[obj.get("id")] = t.rows
+            t.append(id=obj.get("id"), name=obj.get("name"), extra=_extra(obj, ("id", "name")))
+        elif table == "pools":
+            self.pool_rows[obj.get("id")] = t.rows
+            t.append(id=obj.get("id"), name=obj.get("name"),
+                     realm=self.realm_rows.get(obj.get("federated_realm"), -1),
+                     extra=_extra(obj, ("id", "name", "federated_realm")))
+        else:
+            version, hi, lo, prefixlen = _split_address(obj)
+            t.append(id=obj.get("id"), name=obj.get("name"), version=version, addr_hi=hi, addr_lo=lo,
+                     prefixlen=prefixlen, realm=self.realm_rows.get(obj.get("federated_realm"), -1),
+                     pool=self.pool_rows.get(obj.get("federated_pool_id"), -1),
+                     extra=_extra(obj, _BLOCK_FIELDS))
+
+    def write(self, path, meta=None):
+        chunks = []
+        header = {"meta": meta or {}, "tables": {}}
+        offset = 0
+
+        def place(data):
+            nonlocal offset
+            pad = -offset % 8
+            if pad:
+                chunks.append(b"\0" * pad)
+                offset += pad
+            start = offset
+            chunks.append(data)
+            offset += len(data)
+            return [start, len(data)]
+
+        def packed(a):
+            if sys.byteorder != "little":
+                a = array.array(a.typecode, a)
+                a.byteswap()
+            return a.tobytes()
+
+        for name, t in self.tables.items():
+            columns = {}
+            for col, data in t.columns.items():
+                kind = t.kinds[col]
+                if kind == "str":
+                    columns[col] = {"type": "str", "ends": place(packed(data.ends)), "blob": place(bytes(data.blob))}
+                else:
+                    columns[col] = {"type": kind, "data": place(packed(data))}
+            header["tables"][name] = {"rows": t.rows, "columns": columns}
+
+        head = json.dumps(header, separators=_COMPACT).encode()
+        preamble = MAGIC + struct.pack("<I", len(head)) + head
+        preamble += b"\0" * (-len(preamble) % 8)
+        tmp = f"{path}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(preamble)
+            for chunk in chunks:
+                f.write(chunk)
+        os.replace(tmp, path)
+        return len(preamble) + offset
+
+
+# --- Reading ---
+
+class _StrView:
+    """Lazily decoded view of a str column."""
+
+    def __init__(self, ends, blob):
+        self.ends = ends
+        self.blob = blob
+
+    def raw(self, i):
+        start = self.ends[i - 1] if i else 0
+        return self.blob[start:self.ends[i]]
+
+    def __getitem__(self, i):
+        return bytes(self.raw(i)).decode("utf-8")
+
+    def __len__(self):
+        return len(self.ends)
+
+
+class Table:
+    def __init__(self, buf, base, spec):
+        self.rows = spec["rows"]
+        self.spec = spec["columns"]
+        self._buf = buf
+        self._base = base
+        self._columns = {}
+
+    def __len__(self):
+        return self.rows
+
+    def _slice(self, where):
+        start, length = where
+        return self._buf[self._base + start:self._base + start + length]
+
+    def column(self, name):
+        """Column as an array-like (memoryview over the mapped file where possible)."""
+        col = self._columns.get(name)
+        if col is None:
+            spec = self.spec[name]
+            if spec["type"] == "str":
+                col = _StrView(_array("I", self._slice(spec["ends"])), self._slice(spec["blob"]))
+            else:
+                col = _array(_TYPECODES[spec["type"]], self._slice(spec["data"]))
+            self._columns[name] = col
+        return col
+
+
+class Snapshot:
+    """A memory-mapped snapshot. Only the header is parsed when it is opened."""
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, "rb")
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        buf = memoryview(self._map)
+        if bytes(buf[:len(MAGIC)]) != MAGIC:
+            raise ValueError(f"❌ {path} is not a federation snapshot")
+        (head_len,) = struct.unpack_from("<I", buf, len(MAGIC))
+        head_start = len(MAGIC) + 4
+        header = json.loads(bytes(buf[head_start:head_start + head_len]))
+        base = head_start + head_len
+        base += -base % 8
+        self.meta = header["meta"]
+        self.tables = {name: Table(buf, base, spec) for name, spec in header["tables"].items()}
+        self._ids = {}
+
+    def _ids_of(self, table):
+        """Interned ids of a small table (realms, pools), for link columns."""
+        if table not in self._ids:
+            ids = self.tables[table].column("id")
+            self._ids[table] = [sys.intern(ids[i]) for i in range(len(ids))]
+        return self._ids[table]
+
+    def block(self, i, table="blocks"):
+        t = self.tables[table]
+        realms, pools = self._ids_of("realms"), self._ids_of("pools")
+        realm, pool = t.column("realm")[i], t.column("pool")[i]
+        rec = BlockRecord(t.column("id")[i], t.column("name")[i],
+                          (t.column("addr_hi")[i] << 64) | t.column("addr_lo")[i], t.column("prefixlen")[i],
+                          t.column("version")[i], realms[realm] if realm >= 0 else None,
+                          pools[pool] if pool >= 0 else None)
+        extra = t.column("extra").raw(i)
+        rec._extra = bytes(extra) if len(extra) else None  # decoded on first access
+        return rec
+
+    def pool(self, i):
+        t = self.tables["pools"]
+        realms = self._ids_of("realms")
+        realm = t.column("realm")[i]
+        rec = PoolRecord(t.column("id")[i], t.column("name")[i], realms[realm] if realm >= 0 else None)
+        extra = t.column("extra").raw(i)
+        rec._extra = bytes(extra) if len(extra) else None
+        return rec
+
+    def block_index(self, table="blocks"):
+        """RecordIndex over blocks (or reserved_blocks)."""
+        return RecordIndex(self.block(i, table) for i in range(len(self.tables[table])))
+
+    def pool_index(self):
+        return RecordIndex(self.pool(i) for i in range(len(self.tables["pools"])))
+
+    def close(self):
+        self.tables = {}
+        self._ids = {}
+        try:
+            self._map.close()
+        except BufferError:
+            pass  # columns still referenced; the map goes when they do
+        self._file.close()
+
+
+def load_snapshot(path):
+    return Snapshot(path)
+
+
+# --- API ---
+
+class SnapshotTaker:
+    def __init__(self, config_file="config.yaml"):
+        self.client = InfobloxCSPClient(config_file)
+
+    def iter_kind(self, kind, _filter=None):
+        """Every object of a federation kind, streamed page by page."""
+        url = f"{self.client.base_url}{FEDERATION_API}/{kind}"
+        offset = 0
+        while True:
+            params = {"_limit": PAGE_SIZE, "_offset": offset}
+            if _filter:
+                params["_filter"] = _filter
+            r = self.client.session.get(url, headers=self.client.headers, params=params, stream=True)
+            r.raise_for_status()
+            count = 0
+            for obj in iter_results(r):
+                count += 1
+                yield obj
+            if count < PAGE_SIZE:
+                return
+            offset += PAGE_SIZE
+
+    def take(self, writer, realm_name=None):
+        realm_filter = None
+        if realm_name:
+            realms = list(self.iter_kind("federated_realm", _filter=f'name=="{realm_name}"'))
+            if not realms:
+                raise ValueError(f"❌ Realm '{realm_name}' not found")
+            realm_filter = f'federated_realm=="{realms[0]["id"]}"'
+            writer.add("realms", realms[0])
+        else:
+            for obj in self.iter_kind("federated_realm"):
+                writer.add("realms", obj)
+        print(f"📋 realms: {writer.tables['realms'].rows}", flush=True)
+
+        # Pools before blocks so block rows can link to pool rows
+        for table in ("pools", "blocks", "reserved_blocks"):
+            start = time.monotonic()
+            skipped = 0
+            for obj in self.iter_kind(TABLES[table], _filter=realm_filter):
+                try:
+                    writer.add(table, obj)
+                except ValueError as e:
+                    skipped += 1
+                    print(f"   ⚠️ Skipping {TABLES[table]} {e}", flush=True)
+            print(f"📋 {table}: {writer.tables[table].rows} ({time.monotonic() - start:.1f}s)"
+                  + (f", {skipped} skipped" if skipped else ""), flush=True)
+
+
+def cmd_save(args):
+    taker = SnapshotTaker(args.config)
+    taker.client.authenticate()
+    taker.client.switch_account()
+
+    start = time.monotonic()
+    writer = SnapshotWriter()
+    taker.take(writer, args.realm)
+    meta = {
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "base_url": taker.client.base_url,
+        "realm": args.realm,
+    }
+    size = writer.write(args.output, meta)
+    elapsed = time.monotonic() - start
+
+    print(f"\n{'='*60}")
+    print("🎉 Federation Snapshot Saved!")
+    for name, t in writer.tables.items():
+        print(f"   {name + ':':<17}{t.rows}")
+    print(f"   Size:            {size / 1e6:.2f} MB ({elapsed:.1f}s)")
+    print(f"   Output:          {args.output}")
+    print(f"{'='*60}")
+
+
+def cmd_info(args):
+    start = time.perf_counter()
+    snap = load_snapshot(args.snapshot)
+    opened = time.perf_counter() - start
+
+    print(f"📦 {args.snapshot} ({os.path.getsize(args.snapshot) / 1e6:.2f} MB, opened in {opened * 1000:.1f} ms)")
+    print(f"   Taken:  {snap.meta.get('created_at')} from {snap.meta.get('base_url')}"
+          + (f", realm '{snap.meta['realm']}'" if snap.meta.get("realm") else ""))
+    for name, t in snap.tables.items():
+        print(f"   {name + ':':<17}{len(t)}")
+
+    # Column scan, no per-row objects: IPv4 address space per realm
+    blocks = snap.tables["blocks"]
+    if len(blocks):
+        names = snap.tables["realms"].column("name")
+        realm_names = [names[i] for i in range(len(names))]
+        version, prefixlen, realm = blocks.column("version"), blocks.column("prefixlen"), blocks.column("realm")
+        space = {}
+        for i in range(len(blocks)):
+            if version[i] == 4:
+                space[realm[i]] = space.get(realm[i], 0) + (1 << (32 - prefixlen[i]))
+        for r, total in sorted(space.items()):
+            label = realm_names[r] if r >= 0 else "(no realm)"
+            print(f"   IPv4 in blocks of '{label}': {total} addresses (nested blocks counted again)")
+
+    if args.show:
+        start = time.perf_counter()
+        index = snap.block_index()
+        built = time.perf_counter() - start
+        matches = index.named_all(args.show)
+        print(f"\n🔍 '{args.show}': {len(matches)} block(s) (index of {len(index)} built in {built * 1000:.0f} ms)")
+        for rec in matches:
+            print(f"   {rec.network} {rec.id}")
+            print(f"      realm={rec.realm} pool={rec.pool} extra={json.dumps(rec.extra)[:200]}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Columnar snapshots of federation state")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("save", help="Download federation objects into a snapshot file")
+    p.add_argument("--config", default="config.yaml", help="Config file path")
+    p.add_argument("--realm", help="Only this realm (default: every realm in the tenant)")
+    p.add_argument("-o", "--output", default="federation.fedsnap", help="Snapshot file")
+    p.set_defaults(func=cmd_save)
+
+    p = sub.add_parser("info", help="Summarize a snapshot")
+    p.add_argument("snapshot", nargs="?", default="federation.fedsnap", help="Snapshot file")
+    p.add_argument("--show", metavar="NAME", help="Print blocks with this name")
+    p.set_defaults(func=cmd_info)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    profiling.install()
+    main()
@@ -0,0 +1,291 @@
+#!/usr/bin/env python3
+"""
+Generate Terraform JSON for N AWS VPCs from Infoblox Federated IPAM.
+
+deploy_vpc_from_ipam.py builds one VPC with serial boto3 calls (VPC, then
+subnet, then IGW, then route table). terraform/modules/aws-vpc already
+describes the whole stack (VPC, subnet, IGW, route table, SG, ENI, EC2,
+EIP), so for N VPCs this script only does the IPAM part:
+
+  1. Find the APPS pool and its federated block
+  2. Reserve N /24s from it (reserved_block → custom-allocation in AWS
+     IPAM), concurrently, moving past CIDRs taken by other deployers
+  3. Write terraform/ipam-vpcs/main.tf.json with one module block per VPC
+
+and leaves the rest to Terraform, whose graph walk creates the N stacks
+in parallel. `--apply` runs it right away through tf_runner.py (shared
+provider cache, -parallelism, timings).
+
+Reservations are kept in ipam_reservations.json next to the generated
+file; running again with the same names reuses them, so regenerating (or
+growing --count) never reserves a CIDR twice (a different --vpc-cidr than
+they were reserved with is refused). `--release` destroys the VPCs and
+releases the reservations. Module and user-data paths in the generated
+file are relative to --output-dir, wherever that is.
+
+Usage:
+  python3 generate_vpc_tf.py --count 10
+  python3 generate_vpc_tf.py --count 10 --apply --parallelism 50
+  python3 generate_vpc_tf.py --count 3 --no-ec2 --dry-run
+  python3 generate_vpc_tf.py --release
+
+Output Files:
+  terraform/ipam-vpcs/main.tf.json           - Provider + N module "aws-vpc" blocks
+  terraform/ipam-vpcs/ipam_reservations.json - Reserved block per VPC
+"""
+
+import agent_client
+agent_client.forward()
+
+import os
+import sys
+import json
+import argparse
+import ipaddress
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+from deploy_vpc_from_ipam import InfobloxVPCDeployer, default_shard
+from tf_runner import TerraformRunner, CONFIGS, DEFAULT_PARALLELISM, SCRIPT_DIR, TERRAFORM_ROOT, print_timings
+import profiling
+
+OUTPUT_DIR = CONFIGS["ipam-vpcs"]
+RESERVATIONS_FILE = "ipam_reservations.json"
+MODULE_DIR = os.path.join(TERRAFORM_ROOT, "modules", "aws-vpc")
+USER_DATA_FILE = os.path.join(SCRIPT_DIR, "aws-user-data.sh")
+PRIVATE_IP_OFFSET = 10      # AWS reserves the first four addresses of a subnet
+
+COMMON_TAGS = {
+    "Environment": "Lab",
+    "Project": "IPAM-UDDI",
+    "ManagedBy": "Terraform",
+    "ResourceOwner": "lab-user",
+}
+
+
+def load_reservations(output_dir):
+    path = os.path.join(output_dir, RESERVATIONS_FILE)
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r") as f:
+        return json.load(f)
+
+
+def save_reservations(output_dir, reservations):
+    with open(os.path.join(output_dir, RESERVATIONS_FILE), "w") as f:
+        json.dump(reservations, f, indent=2)
+
+
+def relative_to(path, output_dir):
+    """path as Terraform expects a local path from output_dir ("./" or "../")."""
+    rel = os.path.relpath(path, os.path.abspath(output_dir)).replace(os.sep, "/")
+    return rel if rel.startswith("../") else f"./{rel}"
+
+
+def module_key(vpc_name):
+    return "vpc_" + vpc_name.replace("-", "_").lower()
+
+
+def vpc_module(vpc_name, vpc_cidr, subnet_prefix, enable_internet, create_ec2, source=None):
+    """One instance of modules/aws-vpc for an allocated VPC CIDR."""
+    vpc_net = ipaddress.ip_network(vpc_cidr)
+    subnet = next(vpc_net.subnets(new_prefix=subnet_prefix))
+    return {
+        "source": source,
+        "vpc_name": vpc_name,
+        "vpc_cidr": str(vpc_net),
+        "subnet_name": f"{vpc_name}-subnet",
+        "subnet_cidr": str(subnet),
+        "private_ip": str(subnet.network_address + PRIVATE_IP_OFFSET),
+        "ec2_name": f"{vpc_name}-server",
+        "enable_internet": enable_internet,
+        "create_ec2": create_ec2,
+        "instance_type": "${var.instance_type}",
+        "user_data": "${local.user_data}",
+        "tags": "${merge(local.common_tags, {VPC = \"%s\", Cloud = \"AWS\"})}" % vpc_name,
+    }
+
+
+def render(reservations, subnet_prefix, enable_internet, create_ec2, region, output_dir):
+    """Terraform JSON configuration for every reserved VPC, to be written to output_dir."""
+    source = relative_to(MODULE_DIR, output_dir)
+    modules = {}
+    outputs = {}
+    for vpc_name, r in sorted(reservations.items()):
+        key = module_key(vpc_name)
+        modules[key] = vpc_module(vpc_name, f"{r['address']}/{r['cidr']}", subnet_prefix, enable_internet, create_ec2,
+                                  source=source)
+        outputs[vpc_name] = {
+            "vpc_id": f"${{module.{key}.vpc_id}}",
+            "vpc_cidr": f"${{module.{key}.vpc_cidr}}",
+            "subnet_id": f"${{module.{key}.subnet_id}}",
+            "private_ip": f"${{module.{key}.private_ip}}",
+            "public_ip": f"${{module.{key}.public_ip}}",
+            "reserved_block_id": r["reserved_block_id"],
+        }
+    return {
+        "//": "Generated by scripts/generate_vpc_tf.py from Infoblox IPAM reservations - do not edit",
+        "terraform": {
+            "required_version": ">= 1.0",
+            "required_providers": {
+                "aws": {"source": "hashicorp/aws", "version": ">= 5.0"},
+                "tls": {"source": "hashicorp/tls", "version": ">= 4.0"},
+            },
+        },
+        "provider": {"aws": {"region": "${var.aws_region}"}},
+        "variable": {
+            "aws_region": {"type": "string", "default": region},
+            "instance_type": {"type": "string", "default": "t3.micro"},
+        },
+        "locals": {
+            "common_tags": COMMON_TAGS,
+            "user_data": "${file(\"${path.module}/%s\")}" % relative_to(USER_DATA_FILE, output_dir),
+        },
+        "module": modules,
+        "output": {"vpcs": {"value": outputs}},
+    }
+
+
+def reserve_all(deployer, names, block_uuid, vpc_prefix, realm_id, pool_id, shard, max_workers):
+    """Reserve one /vpc_prefix per name concurrently. Returns {name: reservation}."""
+    candidates = max(8, 2 * len(names))
+
+    def reserve(i, name):
+        # Distinct shard offsets keep this run's own workers off each other's candidates
+        reserved, address, cidr = deployer.reserve_next_available(
+            block_uuid, vpc_prefix, federated_realm=realm_id, federated_pool_id=pool_id,
+            name=f"{name}-reserved", comment=f"Reserved for {name} (generate_vpc_tf.py)",
+            candidates=candidates, shard=shard + i)
+        return name, {"address": address, "cidr": cidr, "reserved_block_id": reserved.get("id")}
+
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        futures = [pool.submit(reserve, i, name) for i, name in enumerate(names)]
+        results = {}
+        errors = []
+        for future in futures:
+            try:
+                name, reservation = future.result()
+                results[name] = reservation
+            except Exception as e:
+                errors.append(e)
+    return results, errors
+
+
+def release(deployer, output_dir, args):
+    reservations = load_reservations(output_dir)
+    if not reservations:
+        print(f"✅ Nothing reserved in {output_dir}")
+        return
+    tf_file = os.path.join(output_dir, "main.tf.json")
+    if os.path.exists(tf_file):
+        runner = TerraformRunner(output_dir, parallelism=args.parallelism, name="ipam-vpcs")
+        try:
+            runner.destroy()
+        finally:
+            print_timings([runner])
+    deployer.authenticate()
+    deployer.switch_account()
+    for name, r in sorted(reservations.items()):
+        deployer.delete_reserved_block(r["reserved_block_id"])
+    save_reservations(output_dir, {})
+    if os.path.exists(tf_file):
+        os.remove(tf_file)
+    print(f"🗑️ Released {len(reservations)} reservations and removed the generated configuration")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate Terraform JSON for N VPCs from Infoblox Federated IPAM")
+    parser.add_argument("--count", type=int, default=1, help="Number of VPCs (default: 1)")
+    parser.add_argument("--name-prefix", default="apps-vpc", help="VPC names are <prefix>-01 .. -NN (default: apps-vpc)")
+    parser.add_argument("--vpc-cidr", type=int, default=24, help="CIDR prefix for each VPC (default: 24)")
+    parser.add_argument("--subnet-cidr", type=int, default=25, help="CIDR prefix for each subnet (default: 25)")
+    parser.add_argument("--pool-name", default="APPS", help="APPS pool name (default: APPS)")
+    parser.add_argument("--no-ec2", action="store_true", help="Only the network (create_ec2 = false)")
+    parser.add_argument("--no-internet", action="store_true", help="No IGW / default route (enable_internet = false)")
+    parser.add_argument("--output-dir", default=OUTPUT_DIR, help="Directory of the generated configuration")
+    parser.add_argument("--max-workers", type=int, default=8, help="Concurrent reservations (default: 8)")
+    parser.add_argument("--apply", action="store_true", help="terraform apply the generated configuration")
+    parser.add_argument("--parallelism", type=int, default=DEFAULT_PARALLELISM,
+                        help=f"Terraform -parallelism for --apply / --release (default: {DEFAULT_PARALLELISM})")
+    parser.add_argument("--release", action="store_true", help="Destroy the VPCs and release their reservations")
+    parser.add_argument("--dry-run", action="store_true", help="Show the CIDRs that would be reserved")
+    args = parser.parse_args()
+
+    output_dir = args.output_dir
+    os.makedirs(output_dir, exist_ok=True)
+    deployer = InfobloxVPCDeployer()
+
+    if args.release:
+        release(deployer, output_dir, args)
+        return
+
+    names = [f"{args.name_prefix}-{i:02d}" for i in range(1, args.count + 1)]
+    reservations = load_reservations(output_dir)
+    missing = [n for n in names if n not in reservations]
+    mismatched = [n for n in names if n in reservations and int(reservations[n]["cidr"]) != args.vpc_cidr]
+    if mismatched:
+        print(f"❌ Already reserved with another prefix than /{args.vpc_cidr}: "
+              + ", ".join(f"{n} ({reservations[n]['address']}/{reservations[n]['cidr']})" for n in mismatched))
+        print("   Run with the prefix they were reserved with, or --release them first")
+        sys.exit(1)
+    print(f"📋 {len(names)} VPCs: {len(names) - len(missing)} already reserved, {len(missing)} to reserve")
+
+    if missing:
+        deployer.authenticate()
+        deployer.switch_account()
+        pool_id = deployer.find_apps_pool_id(pool_name=args.pool_name)
+        block, block_uuid = deployer.find_block_for_pool(pool_id)
+        realm_id = block.get("federated_realm")
+
+        if args.dry_run:
+            blocks = deployer.get_next_available_blocks(block_uuid, args.vpc_cidr, count=len(missing))
+            print(f"\n🔍 DRY RUN — Would reserve and generate:")
+            for name, (address, cidr) in zip(missing, blocks):
+                m = vpc_module(name, f"{address}/{cidr}", args.subnet_cidr, not args.no_internet, not args.no_ec2)
+                print(f"   {name:<20} VPC {m['vpc_cidr']:<18} Subnet {m['subnet_cidr']:<18} EC2 {m['private_ip']}")
+            return
+
+        reserved, errors = reserve_all(deployer, missing, block_uuid, args.vpc_cidr, realm_id, pool_id,
+                                       default_shard(), args.max_workers)
+        reservations.update(reserved)
+        # Save before anything else can fail, so reservations are never orphaned
+        save_reservations(output_dir, reservations)
+        if errors:
+            print(f"❌ {len(errors)} reservations failed: {errors[0]}")
+            sys.exit(1)
+
+    region = os.environ.get('AWS_DEFAULT_REGION', 'eu-west-1')
+    selected = {n: reservations[n] for n in names}
+    config = render(selected, args.subnet_cidr, not args.no_internet, not args.no_ec2, region, output_dir)
+    tf_file = os.path.join(output_dir, "main.tf.json")
+    with open(tf_file, "w") as f:
+        json.dump(config, f, indent=2)
+
+    print(f"\n{'='*60}")
+    print(f"📄 Generated {tf_file}")
+    for name in names:
+        m = config["module"][module_key(name)]
+        print(f"   {name:<20} VPC {m['vpc_cidr']:<18} Subnet {m['subnet_cidr']:<18} EC2 {m['private_ip']}")
+    extra = sorted(set(reservations) - set(names))
+    if extra:
+        print(f"   ⚠️ Reserved but not generated (run --release or raise --count): {', '.join(extra)}")
+    print(f"{'='*60}")
+
+    if not args.apply:
+        print(f"\n🔍 Next: python3 tf_runner.py apply ipam-vpcs --parallelism {args.parallelism}")
+        return
+
+    runner = TerraformRunner(output_dir, parallelism=args.parallelism, name="ipam-vpcs")
+    try:
+        runner.apply()
+    except subprocess.CalledProcessError as e:
+        print(f"❌ Terraform failed with exit code {e.returncode}")
+        print_timings([runner])
+        sys.exit(1)
+    print(f"🎉 {len(names)} VPCs applied")
+    print_timings([runner])
+
+
+if __name__ == "__main__":
+    profiling.install()
+    main()
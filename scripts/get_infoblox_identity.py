@@ -12,11 +12,17 @@ These values are needed for:
 2. Creating AWS IAM role for discovery job (trust policy)
 """
 
+import agent_client
+agent_client.forward()
+
 import os
 import re
 import json
 import yaml
-import requests
+
+import csp_auth
+from http_session import ApiSession
+import profiling
 
 def load_config_with_env(file_path):
     with open(file_path, "r") as f:
@@ -39,13 +45,21 @@ class InfobloxIdentity:
         self.password = config['password']
         self.sandbox_id_file = config.get('sandbox_id_file')
         self.jwt = None
+        self.api_key = None
         self.headers = {}
+        self.session = ApiSession()
 
-    def authenticate(self):
+    def authenticate(self, allow_api_key=True):
         """Login and get JWT token"""
+        if allow_api_key:
+            self.api_key = csp_auth.load_api_key(self.sandbox_id_file)
+        if self.api_key:
+            self.headers = csp_auth.token_headers(self.api_key)
+            print("Using API key, skipping sign-in.")
+            return
         url = f"{self.base_url}/v2/session/users/sign_in"
         payload = {"email": self.email, "password": self.password}
-        r = requests.post(url, json=payload)
+        r = self.session.post(url, json=payload)
         r.raise_for_status()
         self.jwt = r.json()["jwt"]
         self.headers = {
@@ -56,6 +70,9 @@ class InfobloxIdentity:
 
     def switch_account(self):
         """Switch to sandbox account if configured"""
+        if self.api_key:
+            print("API key is scoped to the sandbox, skipping account switch.")
+            return
         if not self.sandbox_id_file or not os.path.exists(self.sandbox_id_file):
             print("No sandbox configured, using main account.")
             return
@@ -64,7 +81,7 @@ class InfobloxIdentity:
             sandbox_id = f.read().strip()
         url = f"{self.base_url}/v2/session/account_switch"
         payload = {"id": f"identity/accounts/{sandbox_id}"}
-        r = requests.post(url, headers=self.headers, json=payload)
+        r = self.session.post(url, headers=self.headers, json=payload)
         r.raise_for_status()
         self.jwt = r.json()["jwt"]
         self.headers["Authorization"] = f"Bearer {self.jwt}"
@@ -73,7 +90,7 @@ class InfobloxIdentity:
     def get_current_user(self):
         """Fetch current user info including Blox-ID and External-ID"""
         url = f"{self.base_url}/v2/current_user"
-        r = requests.get(url, headers=self.headers)
+        r = self.session.get(url, headers=self.headers)
         r.raise_for_status()
         return r.json().get("result", {})
 
@@ -103,6 +120,7 @@ class InfobloxIdentity:
 
 
 if __name__ == "__main__":
+    profiling.install()
     import argparse
 
     parser = argparse.ArgumentParser(description="Fetch Infoblox identity for AWS integration")
@@ -112,7 +130,7 @@ if __name__ == "__main__":
     args = parser.parse_args()
 
     client = InfobloxIdentity(args.config)
-    client.authenticate()
+    client.authenticate(allow_api_key=args.sandbox)
 
     if args.sandbox:
         client.switch_account()
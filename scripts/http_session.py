@@ -0,0 +1,281 @@
+"""
+Shared HTTP session for CSP, broker and sandbox API calls.
+
+ApiSession builds on rate_governor.GovernedSession and adds:
+  - Per-endpoint timeouts, so a stalled connection can never hang a
+    student's setup (requests has no timeout by default)
+  - Hedged GETs: if an idempotent GET has not answered after the endpoint's
+    observed p95 latency, a duplicate is sent and the first answer wins
+  - A circuit breaker per endpoint that fails fast with CircuitOpenError
+    after repeated connection failures, timeouts or 502/504s, and lets a
+    single probe through once the cooldown has passed
+  - Hedging/breaker/latency stats via ApiSession.stats()
+
+CircuitOpenError is a requests.ConnectionError, so existing
+`except requests.RequestException` handling keeps working.
+
+Environment Variables:
+  HTTP_HEDGE=0        - Disable hedged GETs
+  HTTP_STATS_FILE     - Write per-endpoint stats as JSON here at exit
+  HTTP_CASSETTE       - Record/replay traffic (see cassette.py)
+"""
+
+import os
+import re
+import json
+import time
+import atexit
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from urllib.parse import urlparse
+
+import requests
+
+from rate_governor import GovernedSession
+
+# (method or None for any, path regex, (connect, read) timeout in seconds)
+ENDPOINT_TIMEOUTS = [
+    ("POST", r"^/v2/session/", (5, 30)),
+    ("GET", r"^/v2/current_user$", (5, 10)),
+    ("GET", r"^/api/ddi/v1/dns/view$", (5, 15)),
+    ("GET", r"^/api/ddi/v1/federation/", (5, 30)),
+    ("GET", r"^/api/iam/v1/cloud_credential$", (5, 15)),
+    (None, r"^/api/cloud_discovery/", (5, 60)),
+]
+DEFAULT_TIMEOUT = (5, 60)
+
+HEDGE_METHODS = ("GET", "HEAD")
+HEDGE_MIN_SAMPLES = 10
+HEDGE_DEFAULT_DELAY = 1.5
+HEDGE_MIN_DELAY = 0.05
+# Attempts in flight on the hedge pool; past this, GETs run unhedged on the
+# calling thread instead of queueing behind other callers' attempts
+HEDGE_POOL_SIZE = 32
+
+BREAKER_THRESHOLD = 5
+BREAKER_COOLDOWN = 30.0
+# 503 is left out on purpose: CSP returns it while a new sandbox's
+# permissions propagate, and the polling loops expect to see it
+BREAKER_STATUSES = (502, 504)
+
+_ID_SEGMENT = re.compile(r"^(?=.*\d)[0-9a-zA-Z_-]{8,}$")
+
+
+class CircuitOpenError(requests.ConnectionError):
+    """Raised instead of sending a request to an endpoint whose breaker is open."""
+
+
+def endpoint_key(method, url):
+    """'GET /api/ddi/v1/federation/federated_block/{id}' — ids collapsed so stats group."""
+    path = urlparse(url).path.rstrip("/") or "/"
+    segments = ["{id}" if _ID_SEGMENT.match(seg) else seg for seg in path.split("/")]
+    return f"{method.upper()} {'/'.join(segments)}"
+
+
+def timeout_for(method, url):
+    path = urlparse(url).path
+    for m, pattern, timeout in ENDPOINT_TIMEOUTS:
+        if (m is None or m == method.upper()) and re.search(pattern, path):
+            return timeout
+    return DEFAULT_TIMEOUT
+
+
+class EndpointStats:
+    def __init__(self):
+        self.latencies = deque(maxlen=200)
+        self.requests = 0
+        self.errors = 0
+        self.hedges_sent = 0
+        self.hedge_wins = 0
+        self.failures = 0          # consecutive, drives the breaker
+        self.opened_at = None
+        self.breaker_opens = 0
+        self.short_circuits = 0
+        self.probing = False
+
+    def percentile(self, p):
+        if not self.latencies:
+            return None
+        ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(p * len(ordered)))]
+
+    def as_dict(self):
+        p50, p95 = self.percentile(0.50), self.percentile(0.95)
+        return {
+            "requests": self.requests,
+            "errors": self.errors,
+            "p50_ms": round(p50 * 1000, 1) if p50 is not None else None,
+            "p95_ms": round(p95 * 1000, 1) if p95 is not None else None,
+            "hedges_sent": self.hedges_sent,
+            "hedge_wins": self.hedge_wins,
+            "breaker": "open" if self.opened_at else "closed",
+            "breaker_opens": self.breaker_opens,
+            "short_circuits": self.short_circuits,
+        }
+
+
+_sessions = []
+
+
+def dump_stats():
+    """Write the stats of every session so far to HTTP_STATS_FILE, if set."""
+    path = os.environ.get("HTTP_STATS_FILE")
+    if not path:
+        return
+    merged = {}
+    for session in _sessions:
+        merged.update(session.stats())
+    with open(path, "w") as f:
+        json.dump(merged, f, indent=2)
+
+
+atexit.register(dump_stats)
+
+
+class ApiSession(GovernedSession):
+    """GovernedSession with per-endpoint timeouts, hedged GETs and circuit breaking."""
+
+    def __init__(self, governor=None, hedge=None, breaker_threshold=BREAKER_THRESHOLD,
+                 breaker_cooldown=BREAKER_COOLDOWN, **kwargs):
+        super().__init__(governor=governor, **kwargs)
+        self.hedge = hedge if hedge is not None else os.environ.get("HTTP_HEDGE", "1") != "0"
+        self.breaker_threshold = breaker_threshold
+        self.breaker_cooldown = breaker_cooldown
+        self._stats = {}
+        self._lock = threading.Lock()
+        self._hedge_pool = None
+        self._hedge_busy = 0
+        _sessions.append(self)
+
+    # --- Stats ---
+
+    def _endpoint(self, key):
+        with self._lock:
+            if key not in self._stats:
+                self._stats[key] = EndpointStats()
+            return self._stats[key]
+
+    def stats(self):
+        with self._lock:
+            return {key: s.as_dict() for key, s in self._stats.items()}
+
+    def print_stats(self):
+        for key, s in sorted(self.stats().items()):
+            print(f"   {key}: {s['requests']} req, p95 {s['p95_ms']}ms, "
+                  f"hedges {s['hedge_wins']}/{s['hedges_sent']}, breaker {s['breaker']}")
+
+    # --- Circuit breaker ---
+
+    def _before(self, key, ep):
+        with self._lock:
+            if ep.opened_at is None:
+                return
+            if time.monotonic() - ep.opened_at >= self.breaker_cooldown and not ep.probing:
+                ep.probing = True  # half-open: let one request through
+                return
+            ep.short_circuits += 1
+        raise CircuitOpenError(f"Circuit open for {key} after {ep.failures} consecutive failures")
+
+    def _after(self, ep, latency, failed):
+        with self._lock:
+            ep.requests += 1
+            ep.probing = False
+            if failed:
+                ep.errors += 1
+                ep.failures += 1
+                if ep.failures >= self.breaker_threshold:
+                    if ep.opened_at is None:
+                        ep.breaker_opens += 1
+                    ep.opened_at = time.monotonic()
+            else:
+                ep.failures = 0
+                ep.opened_at = None
+                ep.latencies.append(latency)
+
+    # --- Hedging ---
+
+    def _hedge_delay(self, ep, read_timeout):
+        if len(ep.latencies) < HEDGE_MIN_SAMPLES:
+            delay = HEDGE_DEFAULT_DELAY
+        else:
+            delay = ep.percentile(0.95)
+        return min(max(HEDGE_MIN_DELAY, delay), read_timeout / 2)
+
+    def _submit(self, fn, *args, **kwargs):
+        """Run fn on the hedge pool if a thread is free now, else return None."""
+        with self._lock:
+            if self._hedge_busy >= HEDGE_POOL_SIZE:
+                return None
+            if self._hedge_pool is None:
+                self._hedge_pool = ThreadPoolExecutor(max_workers=HEDGE_POOL_SIZE, thread_name_prefix="hedge")
+            self._hedge_busy += 1
+            future = self._hedge_pool.submit(fn, *args, **kwargs)
+        future.add_done_callback(self._release_slot)
+        return future
+
+    def _release_slot(self, future):
+        with self._lock:
+            self._hedge_busy -= 1
+
+    def _send_backup(self, upstream, method, url, *args, **kwargs):
+        # The duplicate is a real request, so it takes its own token
+        self.governor.acquire(upstream)
+        return GovernedSession._dispatch(self, upstream, method, url, *args, **kwargs)
+
+    def _dispatch(self, upstream, method, url, *args, **kwargs):
+        """Send one attempt, hedging idempotent GETs. The hedge timer starts
+        only after the governor token is taken, so pacing never triggers it.
+        Attempts are only handed to the pool when a thread is free, so a
+        busy pool never delays them: the primary then runs on the calling
+        thread, and a backup that finds no thread is not sent."""
+        if not (self.hedge and method.upper() in HEDGE_METHODS and not kwargs.get("stream")):
+            return GovernedSession._dispatch(self, upstream, method, url, *args, **kwargs)
+
+        ep = self._endpoint(endpoint_key(method, url))
+        primary = self._submit(GovernedSession._dispatch, self, upstream, method, url, *args, **kwargs)
+        if primary is None:
+            return GovernedSession._dispatch(self, upstream, method, url, *args, **kwargs)
+        timeout = kwargs["timeout"]
+        read_timeout = timeout[1] if isinstance(timeout, tuple) else timeout
+        done, _ = wait([primary], timeout=self._hedge_delay(ep, read_timeout))
+        if done:
+            return primary.result()
+
+        backup = self._submit(self._send_backup, upstream, method, url, *args, **kwargs)
+        if backup is None:
+            return primary.result()
+        with self._lock:
+            ep.hedges_sent += 1
+        futures = [primary, backup]
+        while futures:
+            done, _ = wait(futures, return_when=FIRST_COMPLETED)
+            for future in done:
+                futures.remove(future)
+                if future.exception() is None:
+                    if future is backup:
+                        with self._lock:
+                            ep.hedge_wins += 1
+                    for loser in futures:
+                        loser.add_done_callback(lambda f: f.exception() is None and f.result().close())
+                    return future.result()
+        # Both attempts failed: surface the primary's error
+        return primary.result()
+
+    # --- Request ---
+
+    def request(self, method, url, *args, **kwargs):
+        key = endpoint_key(method, url)
+        ep = self._endpoint(key)
+        self._before(key, ep)
+        if kwargs.get("timeout") is None:
+            kwargs["timeout"] = timeout_for(method, url)
+
+        try:
+            response = GovernedSession.request(self, method, url, *args, **kwargs)
+        except requests.RequestException:
+            self._after(ep, None, failed=True)
+            raise
+        # elapsed covers send → response headers, excluding governor waits
+        self._after(ep, response.elapsed.total_seconds(), failed=response.status_code in BREAKER_STATUSES)
+        return response
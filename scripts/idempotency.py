@@ -0,0 +1,81 @@
+"""
+Safe retries for mutating federation calls (POST realm / block / pool / reserved_block).
+
+Blindly retrying a POST can create the object twice — for a reserved block
+that means reserving the same CIDR twice. idempotent_create() tags every
+payload with a client-generated token and, after an ambiguous failure
+(timeout, dropped connection, 5xx), looks the object up by that tag before
+sending the POST again:
+
+  POST ─ 2xx ──────────────→ done
+       ├ 4xx ──────────────→ raise (409: unless the object carrying our token exists)
+       └ timeout / 5xx ────→ GET ?_tfilter=idempotency_key=="<token>"
+                               ├ found → done (the first POST did land)
+                               └ none  → back off, POST again with the same token
+
+Usage:
+  from idempotency import idempotent_create
+  result = idempotent_create(self.session, url, self.headers, payload)
+"""
+
+import time
+import uuid
+import random
+
+import requests
+
+IDEMPOTENCY_TAG = "idempotency_key"
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+
+def find_by_token(session, url, headers, token):
+    """Return the object created with this token, or None."""
+    r = session.get(url, headers=headers, params={"_tfilter": f'{IDEMPOTENCY_TAG}=="{token}"'})
+    r.raise_for_status()
+    results = r.json().get("results", [])
+    return results[0] if results else None
+
+
+def idempotent_create(session, url, headers, payload, max_attempts=6, token=None, max_backoff=30):
+    """POST payload with an idempotency token, retrying safely. Returns the created object."""
+    token = token or uuid.uuid4().hex
+    payload = dict(payload)
+    payload["tags"] = {**(payload.get("tags") or {}), IDEMPOTENCY_TAG: token}
+
+    last_error = None
+    for attempt in range(max_attempts):
+        if attempt:
+            # Reconcile before re-POSTing: the previous attempt may have landed
+            try:
+                existing = find_by_token(session, url, headers, token)
+                if existing:
+                    print(f"♻️ Previous attempt succeeded, found {existing.get('id')}")
+                    return existing
+            except requests.RequestException as e:
+                print(f"⚠️ Lookup by idempotency key failed: {e}")
+                last_error = e
+                time.sleep(min(max_backoff, 2 ** attempt + random.random()))
+                continue
+
+        try:
+            r = session.post(url, headers=headers, json=payload)
+        except requests.RequestException as e:
+            print(f"⚠️ POST attempt {attempt + 1}/{max_attempts} failed: {e}")
+            last_error = e
+        else:
+            if r.ok:
+                return r.json().get("result", {})
+            if r.status_code == 409 and attempt:
+                existing = find_by_token(session, url, headers, token)
+                if existing:
+                    return existing
+            if r.status_code not in RETRY_STATUSES:
+                print(f"❌ Error {r.status_code}: {r.text}")
+                r.raise_for_status()
+            print(f"⚠️ POST attempt {attempt + 1}/{max_attempts} got {r.status_code}")
+            last_error = requests.HTTPError(f"{r.status_code} {r.reason}", response=r)
+
+        if attempt < max_attempts - 1:
+            time.sleep(min(max_backoff, 2 ** attempt + random.random()))
+
+    raise last_error
@@ -0,0 +1,379 @@
+#!/usr/bin/env python3
+"""
+Stream a block inventory from CSV or a NIOS export into a federated realm.
+
+deploy_ipam.py creates the handful of blocks in config.yaml. Migrating a
+real estate means tens of thousands of networks, so this importer:
+
+  - parses the input row by row; the only thing kept per row is one int
+    per unique network for dedupe (~100 bytes, so ~10 MB per 100k networks)
+  - validates every CIDR and drops duplicates on the fly
+  - feeds a bounded queue drained by --max-workers concurrent POSTs
+  - checkpoints the last row below which everything is done, so an
+    interrupted import resumes where it stopped (rows re-sent after a
+    crash are recognised by their idempotency key or as 409 conflicts);
+    rows that failed are listed in import_errors.csv — fix and re-run
+    with --restart, already imported blocks are skipped as existing
+
+Input formats (--format auto picks by the header):
+  csv   Header with `network` (10.1.0.0/16) or `address` + `cidr`
+        (prefix length) or `address` + `netmask`; optional `name`, `comment`
+  nios  NIOS CSV export: `header-network` / `header-networkcontainer`
+        sections with `address*` and `netmask*` columns; other record
+        types in the file are skipped
+
+Blocks are created in input order, so containers must come before the
+networks inside them (NIOS exports list them that way); a block whose
+container is still being created by another worker waits for it. For
+layouts in arbitrary order use deploy_block_tree.py.
+
+Usage:
+  python3 import_blocks.py networks.csv
+  python3 import_blocks.py nios_export.csv --format nios --max-workers 32
+  python3 import_blocks.py networks.csv --realm "ACME Corporation" --dry-run
+  python3 import_blocks.py networks.csv --restart     # ignore the checkpoint
+
+Output Files:
+  import_checkpoint.json  - Resume point and counters
+  import_errors.csv       - Rows that were invalid or failed to import
+"""
+
+import agent_client
+agent_client.forward()
+
+import os
+import sys
+import csv
+import json
+import time
+import queue
+import hashlib
+import argparse
+import ipaddress
+import threading
+
+import requests
+
+from deploy_ipam import InfobloxCSPClient
+from idempotency import idempotent_create
+import profiling
+
+CHECKPOINT_EVERY = 2.0  # seconds between checkpoint writes
+
+
+class ImportRow:
+    __slots__ = ("row", "network", "name", "comment", "tags", "done", "after")
+
+    def __init__(self, row, network, name, comment, tags=None):
+        self.row = row
+        self.network = network
+        self.name = name
+        self.comment = comment
+        self.tags = tags
+        self.done = None     # set once this block's POST returned
+        self.after = None    # done event of the container still in flight
+
+
+def _clean(value):
+    return (value or "").strip()
+
+
+def _parse_network(fields):
+    """ip_network from a row's fields; raises ValueError if missing or invalid."""
+    network = _clean(fields.get("network"))
+    if network:
+        return ipaddress.ip_network(network)
+    address = _clean(fields.get("address") or fields.get("address*"))
+    prefix = _clean(fields.get("cidr") or fields.get("prefix"))
+    if not prefix:
+        prefix = _clean(fields.get("netmask") or fields.get("netmask*"))
+    if not address or not prefix:
+        raise ValueError("missing address or prefix")
+    return ipaddress.ip_network(f"{address}/{prefix}")
+
+
+def iter_csv(f):
+    reader = csv.DictReader(f)
+    reader.fieldnames = [n.strip().lower() for n in reader.fieldnames or []]
+    for row_no, fields in enumerate(reader, start=2):
+        yield row_no, fields
+
+
+def iter_nios(f):
+    """Rows of network / networkcontainer sections in a NIOS CSV export."""
+    header = None
+    for row_no, values in enumerate(csv.reader(f), start=1):
+        if not values:
+            continue
+        kind = values[0].strip().lower()
+        if kind.startswith("header-"):
+            header = [v.strip().lower() for v in values] if kind in ("header-network", "header-networkcontainer") else None
+            continue
+        if header and kind in ("network", "networkcontainer"):
+            yield row_no, dict(zip(header, values))
+
+
+def detect_format(path):
+    with open(path, "r", newline="") as f:
+        first = f.readline().strip().lower()
+    return "nios" if first.startswith("header-") else "csv"
+
+
+def stream_blocks(path, fmt, errors, counts, after_row=0):
+    """Yield ImportRow for every valid, not-yet-seen network after `after_row`.
+
+    Invalid rows are written to the errors writer. Rows up to `after_row`
+    (a resumed import) are only parsed so dedupe sees them; their errors
+    were written by the earlier run. Dedupe keeps one packed
+    (version, address, prefix) int per unique network, so memory grows
+    with the number of unique networks.
+    """
+    seen = set()
+    with open(path, "r", newline="") as f:
+        rows = iter_nios(f) if fmt == "nios" else iter_csv(f)
+        for row_no, fields in rows:
+            try:
+                network = _parse_network(fields)
+            except ValueError as e:
+                if row_no > after_row:
+                    errors.writerow([row_no, fields.get("network") or fields.get("address")
+                                     or fields.get("address*", ""), f"invalid: {e}"])
+                continue
+            key = (network.version << 136) | (int(network.network_address) << 8) | network.prefixlen
+            if key in seen:
+                counts["duplicates"] += 1
+                continue
+            seen.add(key)
+            if row_no <= after_row:
+                continue
+            name = _clean(fields.get("name")) or str(network)
+            yield ImportRow(row_no, network, name, _clean(fields.get("comment")))
+
+
+class Checkpoint:
+    """Low watermark over completed rows: every row <= `row` is done."""
+
+    def __init__(self, path, source):
+        self.path = path
+        self.source = os.path.abspath(source)
+        self.row = 0
+        self.counts = {"created": 0, "exists": 0, "failed": 0, "duplicates": 0}
+        self._pending = []   # rows handed out, in order
+        self._done = {}      # finished rows above the watermark -> outcome
+        self._lock = threading.Lock()
+        self._saved_at = 0.0
+
+    def load(self):
+        try:
+            with open(self.path, "r") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return
+        if data.get("source") == self.source:
+            self.row = data.get("row", 0)
+            # Duplicates are recounted as the file is re-read up to the checkpoint
+            self.counts.update({k: v for k, v in data.get("counts", {}).items() if k != "duplicates"})
+
+    def started(self, row):
+        with self._lock:
+            self._pending.append(row)
+
+    def finished(self, row, outcome):
+        with self._lock:
+            self._done[row] = outcome
+            # Only count rows once they are below the watermark, so a resumed
+            # import does not count re-sent rows twice
+            while self._pending and self._pending[0] in self._done:
+                self.row = self._pending.pop(0)
+                self.counts[self._done.pop(self.row)] += 1
+            if time.monotonic() - self._saved_at > CHECKPOINT_EVERY:
+                self._save()
+
+    def save(self):
+        with self._lock:
+            self._save()
+
+    def _save(self):
+        tmp = f"{self.path}.tmp"
+        with open(tmp, "w") as f:
+            json.dump({"source": self.source, "row": self.row, "counts": self.counts}, f, indent=2)
+        os.replace(tmp, self.path)
+        self._saved_at = time.monotonic()
+
+
+class BlockImporter:
+    def __init__(self, config_file="config.yaml", max_workers=16):
+        self.client = InfobloxCSPClient(config_file)
+        self.max_workers = max_workers
+
+    def get_realm_id(self, name=None):
+        """Realm from federation_output.json, or looked up by name."""
+        if not name and os.path.exists("federation_output.json"):
+            with open("federation_output.json", "r") as f:
+                realm_id = json.load(f).get("realm", {}).get("id")
+            if realm_id:
+                return realm_id
+        name = name or self.client.realm["name"]
+        url = f"{self.client.base_url}/api/ddi/v1/federation/federated_realm"
+        r = self.client.session.get(url, headers=self.client.headers, params={"_filter": f'name=="{name}"'})
+        r.raise_for_status()
+        results = r.json().get("results", [])
+        if not results:
+            raise ValueError(f"❌ Realm '{name}' not found")
+        return results[0]["id"]
+
+    def create_block(self, realm_id, item):
+        """POST one block. Returns ('created', block) or ('exists', None), or raises."""
+        url = f"{self.client.base_url}/api/ddi/v1/federation/federated_block"
+        payload = {
+            "name": item.name,
+            "address": str(item.network.network_address),
+            "cidr": item.network.prefixlen,
+            "comment": item.comment,
+            "federated_realm": realm_id,
+            "utilization": 0
+        }
+        if item.tags:
+            payload["tags"] = item.tags
+        # Same block → same key, so a resumed import reconciles instead of duplicating
+        token = hashlib.sha1(f"{realm_id}|{item.network}".encode()).hexdigest()[:32]
+        try:
+            return "created", idempotent_create(self.client.session, url, self.client.headers, payload, token=token)
+        except requests.HTTPError as e:
+            if e.response is not None and e.response.status_code == 409:
+                return "exists", None
+            raise
+
+    def run(self, realm_id, blocks, checkpoint, errors):
+        work = queue.Queue(maxsize=self.max_workers * 4)
+        # Blocks queued or being created, so a network can wait for its container
+        in_flight = {}
+        in_flight_lock = threading.Lock()
+
+        def worker():
+            while True:
+                item = work.get()
+                if item is None:
+                    return
+                # The container was queued first, so another worker already has it
+                if item.after:
+                    item.after.wait()
+                try:
+                    outcome, _ = self.create_block(realm_id, item)
+                except Exception as e:
+                    outcome = "failed"
+                    errors.writerow([item.row, str(item.network), str(e)[:300]])
+                finally:
+                    with in_flight_lock:
+                        in_flight.pop(item.network, None)
+                    item.done.set()
+                checkpoint.finished(item.row, outcome)
+
+        def container_in_flight(network):
+            """Done event of the smallest in-flight block containing network."""
+            with in_flight_lock:
+                if not in_flight:
+                    return None
+                for prefixlen in range(network.prefixlen - 1, -1, -1):
+                    done = in_flight.get(network.supernet(new_prefix=prefixlen))
+                    if done:
+                        return done
+            return None
+
+        threads = [threading.Thread(target=worker, daemon=True) for _ in range(self.max_workers)]
+        for t in threads:
+            t.start()
+
+        queued = 0
+        last_report = time.monotonic()
+        for item in blocks:
+            item.after = container_in_flight(item.network)
+            item.done = threading.Event()
+            with in_flight_lock:
+                in_flight[item.network] = item.done
+            checkpoint.started(item.row)
+            work.put(item)  # blocks while the workers are behind: bounded memory
+            queued += 1
+            if time.monotonic() - last_report > 10:
+                c = checkpoint.counts
+                print(f"   … {queued} queued, {c['created']} created, {c['exists']} existing, "
+                      f"{c['failed']} failed (row {checkpoint.row})", flush=True)
+                last_report = time.monotonic()
+        for _ in threads:
+            work.put(None)
+        for t in threads:
+            t.join()
+        checkpoint.save()
+        return queued
+
+
+class _LockedWriter:
+    """csv writer shared by the reader and the worker threads."""
+
+    def __init__(self, f):
+        self.writer = csv.writer(f)
+        self.lock = threading.Lock()
+
+    def writerow(self, row):
+        with self.lock:
+            self.writer.writerow(row)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Stream a CSV/NIOS block inventory into a federated realm")
+    parser.add_argument("input", help="CSV or NIOS CSV export")
+    parser.add_argument("--config", default="config.yaml", help="Config file path")
+    parser.add_argument("--format", choices=["auto", "csv", "nios"], default="auto", help="Input format (default: auto)")
+    parser.add_argument("--realm", help="Realm name (default: from federation_output.json or config)")
+    parser.add_argument("--max-workers", type=int, default=16, help="Concurrent block creations (default: 16)")
+    parser.add_argument("--checkpoint", default="import_checkpoint.json", help="Checkpoint file")
+    parser.add_argument("--errors", default="import_errors.csv", help="Invalid/failed rows file")
+    parser.add_argument("--restart", action="store_true", help="Ignore an existing checkpoint")
+    parser.add_argument("--dry-run", action="store_true", help="Validate and count without creating anything")
+    args = parser.parse_args()
+
+    fmt = detect_format(args.input) if args.format == "auto" else args.format
+    checkpoint = Checkpoint(args.checkpoint, args.input)
+    if not args.restart and not args.dry_run:
+        checkpoint.load()
+        if checkpoint.row:
+            print(f"♻️ Resuming after row {checkpoint.row} ({checkpoint.counts['created']} already created)")
+
+    start = time.monotonic()
+    with open(args.errors, "a" if checkpoint.row else "w", newline="") as ef:
+        errors = _LockedWriter(ef)
+        if not checkpoint.row:
+            errors.writerow(["row", "network", "error"])
+        # Rows up to the checkpoint are still parsed (cheap) so dedupe sees them
+        blocks = stream_blocks(args.input, fmt, errors, checkpoint.counts, after_row=checkpoint.row)
+
+        if args.dry_run:
+            count = sum(1 for _ in blocks)
+            print(f"\n🔍 DRY RUN — {count} unique valid blocks in {args.input} ({fmt}), "
+                  f"{checkpoint.counts['duplicates']} duplicates; invalid rows in {args.errors}")
+            return
+
+        importer = BlockImporter(args.config, max_workers=args.max_workers)
+        importer.client.authenticate()
+        importer.client.switch_account()
+        realm_id = importer.get_realm_id(args.realm)
+        print(f"📥 Importing {args.input} ({fmt}) into {realm_id} with {args.max_workers} workers...", flush=True)
+        queued = importer.run(realm_id, blocks, checkpoint, errors)
+
+    elapsed = time.monotonic() - start
+    c = checkpoint.counts
+    print(f"\n{'='*60}")
+    print("🎉 Block Import Complete!" if not c["failed"] else "⚠️ Block import finished with errors")
+    print(f"   Processed:  {queued} blocks in {elapsed:.1f}s ({queued / elapsed if elapsed else 0:.0f}/s)")
+    print(f"   Created:    {c['created']}")
+    print(f"   Existing:   {c['exists']}")
+    print(f"   Duplicates: {c['duplicates']}")
+    print(f"   Failed:     {c['failed']} (see {args.errors})")
+    print(f"{'='*60}")
+    if c["failed"]:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    profiling.install()
+    main()
@@ -0,0 +1,140 @@
+"""
+Incremental decoding of large JSON list responses.
+
+`r.json().get("results", [])` downloads and decodes the whole collection
+before the first object can be looked at. For lookups that only want the
+first match (the APPS pool, the block linked to a pool, the AWS cloud
+credential) that is wasted time and memory on large tenants. iter_results()
+reads the body in chunks via iter_content and yields each object of the
+list as soon as it is complete; breaking out of the loop stops the
+download. Peak memory is one chunk plus one object.
+
+Request with stream=True, otherwise requests has already read everything:
+
+    r = session.get(url, headers=headers, stream=True)
+    r.raise_for_status()
+    pool = first_match(r, lambda p: p.get("name") == "APPS")
+
+Each object is decoded by json's C decoder; only the framing around the
+list (top-level keys, commas, brackets) is walked here. Responses whose
+top level is a plain list are streamed the same way.
+"""
+
+import json
+import codecs
+
+CHUNK_SIZE = 64 * 1024
+_WHITESPACE = " \t\n\r"
+_NUMBER_CHARS = frozenset("0123456789.eE+-")
+_decoder = json.JSONDecoder()
+
+
+class _Reader:
+    """Text buffer over a byte-chunk iterator that drops what has been consumed."""
+
+    def __init__(self, chunks):
+        self.chunks = chunks
+        self.text = codecs.getincrementaldecoder("utf-8")()
+        self.buf = ""
+        self.pos = 0
+        self.eof = False
+
+    def fill(self):
+        """Append the next chunk. Returns False at end of body."""
+        if self.eof:
+            return False
+        chunk = next(self.chunks, None)
+        if chunk is None:
+            self.eof = True
+            tail = self.text.decode(b"", final=True)
+            self.buf = self.buf[self.pos:] + tail
+            self.pos = 0
+            return bool(tail)
+        self.buf = self.buf[self.pos:] + self.text.decode(chunk)
+        self.pos = 0
+        return True
+
+    def peek(self):
+        """Next non-whitespace character (not consumed), or '' at end of body."""
+        while True:
+            while self.pos < len(self.buf) and self.buf[self.pos] in _WHITESPACE:
+                self.pos += 1
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self.fill():
+                return ""
+
+    def expect(self, chars):
+        c = self.peek()
+        if not c or c not in chars:
+            raise ValueError(f"Expected {' or '.join(repr(x) for x in chars)} at offset {self.pos}, got {c!r}")
+        self.pos += 1
+        return c
+
+    def value(self):
+        """Decode one complete JSON value, reading more of the body as needed."""
+        self.peek()
+        while True:
+            try:
+                obj, end = _decoder.raw_decode(self.buf, self.pos)
+            except json.JSONDecodeError:
+                if not self.fill():
+                    raise
+                continue
+            # A number cut at the chunk boundary ("-1." | "25e-3") decodes as its
+            # leading part; read on while only number characters follow it
+            if (isinstance(obj, (int, float)) and not isinstance(obj, bool) and not self.eof
+                    and all(c in _NUMBER_CHARS for c in self.buf[end:]) and self.fill()):
+                continue
+            self.pos = end
+            return obj
+
+
+def _iter_array(reader):
+    reader.expect("[")
+    if reader.peek() == "]":
+        reader.pos += 1
+        return
+    while True:
+        yield reader.value()
+        if reader.expect(",]") == "]":
+            return
+
+
+def iter_results(response, key="results", chunk_size=CHUNK_SIZE):
+    """Yield the objects of response[key] (or of a top-level list) one at a time.
+
+    The response is closed when the generator finishes or is closed early,
+    so a lookup that stops at its first match does not download the rest.
+    """
+    reader = _Reader(response.iter_content(chunk_size=chunk_size))
+    try:
+        if reader.peek() == "[":
+            yield from _iter_array(reader)
+            return
+        reader.expect("{")
+        if reader.peek() == "}":
+            return
+        while True:
+            name = reader.value()
+            reader.expect(":")
+            if name == key:
+                yield from _iter_array(reader)
+                return
+            reader.value()  # some other top-level field; skip it
+            if reader.expect(",}") == "}":
+                return
+    finally:
+        response.close()
+
+
+def first_match(response, predicate, key="results", chunk_size=CHUNK_SIZE):
+    """First object in response[key] for which predicate(obj) is true, or None."""
+    results = iter_results(response, key, chunk_size)
+    try:
+        for obj in results:
+            if predicate(obj):
+                return obj
+        return None
+    finally:
+        results.close()
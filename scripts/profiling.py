@@ -0,0 +1,233 @@
+"""
+Built-in profiling for every lab script.
+
+Any entry point that calls profiling.install() accepts --profile (or
+PROFILE=1) and, at exit, writes to PROFILE_DIR:
+
+  <script>-<time>-<pid>.pstats     cProfile stats of the main thread
+                                   (python3 -m pstats <file>, snakeviz, ...)
+  <script>-<time>-<pid>.collapsed  Sampled stacks of ALL threads in collapsed
+                                   format, weighted in ms (flamegraph.pl,
+                                   speedscope, inferno)
+  <script>-<time>-<pid>.json       Wall / CPU / I/O / wait / sleep breakdown and
+                                   time.sleep totals per call site
+
+A background sampler classifies every thread's current frame as:
+  sleep - inside time.sleep (deliberate waiting: polling, backoff, pacing)
+  io    - blocked in socket / ssl / select / subprocess (network, terraform)
+  wait  - blocked on a lock, future or thread join
+  cpu   - everything else (JSON parsing, payload building, file I/O)
+
+time.sleep itself is wrapped, so the sleep summary is exact rather than
+sampled. Scripts without their own flag parsing can be run as:
+
+  python3 profiling.py create_user.py
+
+Usage:
+  python3 deploy_vpc_from_ipam.py --profile
+  PROFILE=1 python3 deploy_ipam.py
+  PROFILE=1 PROFILE_DIR=/tmp/profiles python3 user_provision.py
+
+Environment Variables:
+  PROFILE=1            - Enable profiling (same as --profile)
+  PROFILE_DIR          - Output directory (default: profiles)
+  PROFILE_INTERVAL_MS  - Sampling interval (default: 5)
+"""
+
+import os
+import sys
+import json
+import time
+import atexit
+import cProfile
+import runpy
+import threading
+from collections import Counter, defaultdict
+from datetime import datetime
+
+IO_FILES = ("socket.py", "ssl.py", "selectors.py", "subprocess.py", "connection.py")
+WAIT_FUNCTIONS = ("wait", "acquire", "join", "_wait_for_tstate_lock", "result")
+
+_real_sleep = time.sleep
+_profiler = None
+
+
+def _sleep_site(frame):
+    return f"{os.path.basename(frame.f_code.co_filename)}:{frame.f_lineno} {frame.f_code.co_name}"
+
+
+def _frame_label(frame):
+    return f"{os.path.basename(frame.f_code.co_filename)}:{frame.f_code.co_name}"
+
+
+class ScriptProfiler:
+    def __init__(self, name, output_dir="profiles", interval=0.005):
+        self.name = name
+        self.output_dir = output_dir
+        self.interval = interval
+        self.profile = cProfile.Profile()
+        self.stacks = Counter()
+        self.states = defaultdict(Counter)      # thread name -> state -> seconds
+        self.sleeps = defaultdict(lambda: [0, 0.0])  # call site -> [calls, seconds]
+        self._sleep_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._sampler = None
+        self.start_wall = None
+        self.start_cpu = None
+
+    # --- time.sleep accounting ---
+
+    def _traced_sleep(self, seconds):
+        start = time.perf_counter()
+        try:
+            _real_sleep(seconds)
+        finally:
+            site = _sleep_site(sys._getframe(1))
+            with self._sleep_lock:
+                entry = self.sleeps[site]
+                entry[0] += 1
+                entry[1] += time.perf_counter() - start
+
+    # --- Sampling ---
+
+    def _classify(self, frame):
+        code = frame.f_code
+        if code is self._traced_sleep.__code__:
+            return "sleep"
+        if os.path.basename(code.co_filename) in IO_FILES:
+            return "io"
+        if os.path.basename(code.co_filename) == "threading.py" and code.co_name in WAIT_FUNCTIONS:
+            return "wait"
+        if os.path.basename(code.co_filename) == "_base.py" and code.co_name in WAIT_FUNCTIONS:
+            return "wait"  # concurrent.futures
+        return "cpu"
+
+    def _sample(self):
+        me = threading.get_ident()
+        names = {t.ident: t.name for t in threading.enumerate()}
+        last = time.perf_counter()
+        while not self._stop.wait(self.interval):
+            # Weight each sample by the real time since the previous one: a
+            # CPU-bound thread holding the GIL delays the sampler, and plain
+            # counting would under-report exactly that thread
+            now = time.perf_counter()
+            dt, last = now - last, now
+            for ident, frame in sys._current_frames().items():
+                if ident == me:
+                    continue
+                state = self._classify(frame)
+                stack = []
+                f = frame
+                while f is not None:
+                    if f.f_code is not self._traced_sleep.__code__:
+                        stack.append(_frame_label(f))
+                    f = f.f_back
+                if state == "sleep":
+                    stack.insert(0, "time.sleep")
+                name = names.get(ident)
+                if name is None:
+                    names = {t.ident: t.name for t in threading.enumerate()}
+                    name = names.get(ident, str(ident))
+                self.stacks[";".join([name.split("_")[0]] + stack[::-1])] += max(1, round(dt * 1000))
+                self.states[name][state] += dt
+
+    # --- Lifecycle ---
+
+    def start(self):
+        self.start_wall = time.perf_counter()
+        self.start_cpu = time.process_time()
+        time.sleep = self._traced_sleep
+        self._sampler = threading.Thread(target=self._sample, name="profiler-sampler", daemon=True)
+        self._sampler.start()
+        self.profile.enable()
+
+    def stop(self):
+        self.profile.disable()
+        self._stop.set()
+        self._sampler.join()
+        time.sleep = _real_sleep
+        return self.write()
+
+    def breakdown(self):
+        wall = time.perf_counter() - self.start_wall
+        main = self.states.get("MainThread", Counter())
+        sampled = sum(main.values()) or 1
+        threads = {}
+        for name, counts in self.states.items():
+            total = sum(counts.values()) or 1
+            threads[name] = {state: round(counts[state] / total, 3) for state in ("cpu", "io", "wait", "sleep")}
+        return {
+            "script": self.name,
+            "wall_s": round(wall, 3),
+            "process_cpu_s": round(time.process_time() - self.start_cpu, 3),
+            # Main-thread wall split by sampled state
+            "main_thread_s": {state: round(wall * main[state] / sampled, 3) for state in ("cpu", "io", "wait", "sleep")},
+            "thread_state_share": threads,
+            "sleep_total_s": round(sum(s for _, s in self.sleeps.values()), 3),
+            "sleep_calls": sum(c for c, _ in self.sleeps.values()),
+            "sleep_sites": {site: {"calls": c, "seconds": round(s, 3)}
+                            for site, (c, s) in sorted(self.sleeps.items(), key=lambda kv: -kv[1][1])},
+            "interval_ms": self.interval * 1000,
+        }
+
+    def write(self):
+        os.makedirs(self.output_dir, exist_ok=True)
+        stem = os.path.join(self.output_dir, f"{self.name}-{datetime.now():%Y%m%d-%H%M%S}-{os.getpid()}")
+        self.profile.dump_stats(f"{stem}.pstats")
+        with open(f"{stem}.collapsed", "w") as f:
+            for stack, count in sorted(self.stacks.items()):
+                f.write(f"{stack} {count}\n")
+        summary = self.breakdown()
+        with open(f"{stem}.json", "w") as f:
+            json.dump(summary, f, indent=2)
+
+        main = summary["main_thread_s"]
+        print(f"\n{'='*60}")
+        print(f"⏱️  Profile: {self.name}")
+        print(f"   Wall:        {summary['wall_s']:.2f}s  (process CPU {summary['process_cpu_s']:.2f}s)")
+        print(f"   Main thread: cpu {main['cpu']:.2f}s | io {main['io']:.2f}s | "
+              f"wait {main['wait']:.2f}s | sleep {main['sleep']:.2f}s")
+        print(f"   time.sleep:  {summary['sleep_total_s']:.2f}s in {summary['sleep_calls']} calls (all threads)")
+        for site, s in list(summary["sleep_sites"].items())[:5]:
+            print(f"     {s['seconds']:8.2f}s  {s['calls']:4d}×  {site}")
+        print(f"   Output:      {stem}.{{pstats,collapsed,json}}")
+        print(f"{'='*60}")
+        return stem
+
+
+def enabled(argv=None):
+    argv = sys.argv if argv is None else argv
+    return "--profile" in argv or os.environ.get("PROFILE") == "1"
+
+
+def install(name=None):
+    """Start profiling if --profile / PROFILE=1 is set; results are written at exit.
+
+    Strips --profile from sys.argv so the script's own argparse never sees it.
+    Safe to call more than once.
+    """
+    global _profiler
+    if not enabled():
+        return None
+    sys.argv = [a for a in sys.argv if a != "--profile"]
+    if _profiler is not None:
+        return _profiler
+    name = name or os.path.splitext(os.path.basename(sys.argv[0]))[0]
+    _profiler = ScriptProfiler(
+        name,
+        output_dir=os.environ.get("PROFILE_DIR", "profiles"),
+        interval=float(os.environ.get("PROFILE_INTERVAL_MS", "5")) / 1000,
+    )
+    _profiler.start()
+    atexit.register(_profiler.stop)
+    return _profiler
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("Usage: python3 profiling.py <script.py> [args...]")
+        sys.exit(1)
+    sys.argv = sys.argv[1:] + ["--profile"]
+    sys.path.insert(0, os.path.dirname(os.path.abspath(sys.argv[0])))
+    install()
+    runpy.run_path(sys.argv[0], run_name="__main__")
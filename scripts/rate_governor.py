@@ -0,0 +1,308 @@
+"""
+Host-wide rate-limit governor shared by every script on the runner.
+
+Many participants' scripts run concurrently on one host and hit the same
+upstreams (CSP, the sandbox broker, EC2). Instead of each process bursting
+and backing off on its own, every HTTP call takes a token from a per-upstream
+token bucket whose state lives in one lock-protected file, so all processes
+on the host draw from the same budget.
+
+The buckets learn from responses:
+  - 429 (and any Retry-After) blocks the upstream for everyone until the
+    advertised time and halves the rate (multiplicative decrease)
+  - X-RateLimit-* / RateLimit-* headers set the rate to the advertised
+    limit per window and cap the tokens to what is remaining
+  - every success nudges the rate back up towards its ceiling
+
+Usage:
+  from rate_governor import GovernedSession, govern_boto3_client
+
+  session = GovernedSession()          # drop-in for requests / requests.Session
+  ec2 = govern_boto3_client(boto3.client('ec2'))
+
+Environment Variables:
+  RATE_GOVERNOR_STATE     - State file (default: /tmp/ipam-uddi-rate-governor.json)
+  RATE_GOVERNOR_DISABLED  - Set to 1 to bypass the governor
+  RATE_GOVERNOR_<UPSTREAM> - Override a bucket as "rate[:burst]", e.g. RATE_GOVERNOR_CSP=5:10
+"""
+
+import os
+import json
+import time
+import threading
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlparse
+
+import requests
+
+from cassette import get_cassette
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - non-POSIX hosts fall back to a per-process lock
+    fcntl = None
+
+DEFAULT_STATE_FILE = "/tmp/ipam-uddi-rate-governor.json"
+
+# Requests per second and burst size per upstream, before anything is learned
+DEFAULT_LIMITS = {
+    "csp": (10.0, 20),
+    "broker": (2.0, 5),
+    "ec2": (20.0, 40),
+    "default": (10.0, 20),
+}
+
+MIN_RATE = 0.2
+RECOVERY_STEP = 0.05
+DEFAULT_BACKOFF = 5.0
+MAX_BACKOFF = 120.0
+
+
+def upstream_for_url(url):
+    host = urlparse(url).hostname or ""
+    if host.endswith("infoblox.com"):
+        return "csp"
+    if "sandbox-broker" in host:
+        return "broker"
+    if host.startswith("ec2.") or ".ec2." in host:
+        return "ec2"
+    return host or "default"
+
+
+def _limits(upstream):
+    override = os.environ.get(f"RATE_GOVERNOR_{upstream.upper().replace('.', '_').replace('-', '_')}")
+    if override:
+        rate, _, burst = override.partition(":")
+        return float(rate), int(burst or max(1, float(rate) * 2))
+    return DEFAULT_LIMITS.get(upstream, DEFAULT_LIMITS["default"])
+
+
+def parse_retry_after(value, now=None):
+    """Retry-After as seconds (delta-seconds or HTTP-date), or None."""
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - (now or time.time()))
+    except (TypeError, ValueError):
+        return None
+
+
+def _header(headers, *names):
+    for name in names:
+        value = headers.get(name)
+        if value is not None:
+            try:
+                return float(str(value).split(",")[0].split(";")[0])
+            except ValueError:
+                pass
+    return None
+
+
+class RateGovernor:
+    """Token buckets persisted in a flock-protected JSON file."""
+
+    def __init__(self, state_file=None):
+        self.state_file = state_file or os.environ.get("RATE_GOVERNOR_STATE", DEFAULT_STATE_FILE)
+        self.lock_file = self.state_file + ".lock"
+        self._thread_lock = threading.Lock()
+        self.disabled = os.environ.get("RATE_GOVERNOR_DISABLED") == "1"
+
+    # --- State ---
+
+    def _locked(self, fn):
+        with self._thread_lock:
+            fd = os.open(self.lock_file, os.O_RDWR | os.O_CREAT, 0o666)
+            try:
+                if fcntl:
+                    fcntl.flock(fd, fcntl.LOCK_EX)
+                state = self._load()
+                result = fn(state, time.time())
+                self._save(state)
+                return result
+            finally:
+                os.close(fd)  # closing releases the flock
+
+    def _load(self):
+        try:
+            with open(self.state_file, "r") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _save(self, state):
+        tmp = f"{self.state_file}.{os.getpid()}.tmp"
+        with open(tmp, "w") as f:
+            json.dump(state, f)
+        os.replace(tmp, self.state_file)
+
+    @staticmethod
+    def _bucket(state, upstream, now):
+        bucket = state.get(upstream)
+        if bucket is None:
+            rate, burst = _limits(upstream)
+            bucket = state[upstream] = {
+                "rate": rate, "ceiling": rate, "burst": burst,
+                "tokens": float(burst), "updated": now, "blocked_until": 0.0,
+            }
+        elapsed = max(0.0, now - bucket["updated"])
+        bucket["tokens"] = min(bucket["burst"], bucket["tokens"] + elapsed * bucket["rate"])
+        bucket["updated"] = now
+        return bucket
+
+    # --- API ---
+
+    def acquire(self, upstream):
+        """Block until a token for the upstream is available. Returns seconds waited."""
+        if self.disabled:
+            return 0.0
+
+        def take(state, now):
+            bucket = self._bucket(state, upstream, now)
+            if now < bucket["blocked_until"]:
+                return bucket["blocked_until"] - now
+            if bucket["tokens"] >= 1:
+                bucket["tokens"] -= 1
+                return 0.0
+            return (1 - bucket["tokens"]) / bucket["rate"]
+
+        waited = 0.0
+        while True:
+            wait = self._locked(take)
+            if wait <= 0:
+                return waited
+            time.sleep(wait)
+            waited += wait
+
+    def observe(self, upstream, status_code, headers=None):
+        """Feed a response back so the bucket learns the upstream's limits."""
+        if self.disabled:
+            return
+        headers = headers or {}
+
+        def learn(state, now):
+            bucket = self._bucket(state, upstream, now)
+            limit = _header(headers, "X-RateLimit-Limit", "RateLimit-Limit")
+            remaining = _header(headers, "X-RateLimit-Remaining", "RateLimit-Remaining")
+            reset = _header(headers, "X-RateLimit-Reset", "RateLimit-Reset")
+            if limit and reset:
+                # Reset is either seconds-until-reset or an epoch timestamp
+                window = reset - now if reset > 1e9 else reset
+                if window > 0:
+                    bucket["ceiling"] = max(MIN_RATE, limit / window)
+                    bucket["rate"] = min(bucket["rate"], bucket["ceiling"])
+            if remaining is not None:
+                bucket["tokens"] = min(bucket["tokens"], remaining)
+
+            if status_code == 429:
+                retry_after = parse_retry_after(headers.get("Retry-After"), now)
+                backoff = min(MAX_BACKOFF, retry_after if retry_after is not None else DEFAULT_BACKOFF)
+                bucket["blocked_until"] = max(bucket["blocked_until"], now + backoff)
+                bucket["rate"] = max(MIN_RATE, bucket["rate"] / 2)
+                bucket["tokens"] = 0.0
+            elif status_code < 400:
+                bucket["rate"] = min(bucket["ceiling"], bucket["rate"] + RECOVERY_STEP)
+
+        self._locked(learn)
+
+    def penalize(self, upstream, seconds):
+        """Block an upstream for every process, e.g. on a non-429 throttle signal."""
+        if self.disabled:
+            return
+
+        def block(state, now):
+            bucket = self._bucket(state, upstream, now)
+            bucket["blocked_until"] = max(bucket["blocked_until"], now + seconds)
+            bucket["rate"] = max(MIN_RATE, bucket["rate"] / 2)
+            bucket["tokens"] = 0.0
+
+        self._locked(block)
+
+    def snapshot(self):
+        return self._locked(lambda state, now: {k: dict(v) for k, v in state.items()})
+
+
+_governor = None
+
+
+def get_governor():
+    global _governor
+    if _governor is None:
+        _governor = RateGovernor()
+    return _governor
+
+
+def reset():
+    """Drop the process-wide governor so the next one re-reads
+    RATE_GOVERNOR_STATE / RATE_GOVERNOR_DISABLED (see agent.py)."""
+    global _governor
+    _governor = None
+
+
+class GovernedSession(requests.Session):
+    """requests.Session that takes a governor token before every request.
+
+    A 429 means the request was not processed, so it is safe to resend even
+    for POST/PATCH; the governor holds the resend until Retry-After passes.
+    """
+
+    def __init__(self, governor=None, max_429_retries=3):
+        super().__init__()
+        self.governor = governor or get_governor()
+        self.max_429_retries = max_429_retries
+
+    def request(self, method, url, *args, **kwargs):
+        cassette = get_cassette()
+        if cassette and cassette.replaying:
+            full_url = requests.Request(method, url, params=kwargs.get("params")).prepare().url
+            return cassette.replay(method, full_url)
+
+        upstream = upstream_for_url(url)
+        for attempt in range(self.max_429_retries + 1):
+            self.governor.acquire(upstream)
+            response = self._dispatch(upstream, method, url, *args, **kwargs)
+            self.governor.observe(upstream, response.status_code, response.headers)
+            if response.status_code != 429 or attempt == self.max_429_retries:
+                break
+        if cassette:
+            cassette.record(method, response.request.url, response, response.request.body)
+        return response
+
+    def _dispatch(self, upstream, method, url, *args, **kwargs):
+        """Send one attempt once its token is taken. Subclasses hook in here."""
+        return super().request(method, url, *args, **kwargs)
+
+
+def govern_boto3_client(client, upstream=None, governor=None):
+    """Make a boto3 client take a governor token before every HTTP attempt."""
+    if getattr(client, "_rate_governed", False):
+        return client  # shared client (e.g. cached by agent.py), already hooked
+    client._rate_governed = True
+    cassette = get_cassette()
+    if cassette:
+        cassette.attach_boto3(client)
+        if cassette.replaying:
+            return client
+    governor = governor or get_governor()
+    upstream = upstream or client.meta.service_model.endpoint_prefix
+
+    def before_send(request, **kwargs):
+        governor.acquire(upstream)
+
+    def needs_retry(response, **kwargs):
+        if response is None:
+            return None
+        http_response, parsed = response
+        status = http_response.status_code
+        code = (parsed or {}).get("Error", {}).get("Code", "")
+        if code in ("RequestLimitExceeded", "Throttling", "ThrottlingException"):
+            status = 429
+        governor.observe(upstream, status, http_response.headers)
+        return None  # leave the retry decision to botocore
+
+    client.meta.events.register("before-send", before_send)
+    # Run before botocore's own retry handler, which stops the event chain
+    client.meta.events.register_first("needs-retry", needs_retry)
+    return client
@@ -0,0 +1,353 @@
+#!/usr/bin/env python3
+"""
+Reconcile AWS VPCs and IPAM allocations against Infoblox federated IPAM.
+
+After deploy_vpc_from_ipam.py the VPC only shows up in Infoblox once
+discovery has synced (~15 min). This script checks right away, from
+here: it pulls VPCs, subnets and AWS IPAM pool allocations from every
+enabled region in parallel (boto3 paginators), lists the federated
+blocks and reserved blocks, and reports:
+
+  unmanaged VPCs        VPC CIDR inside a federated block but not reserved
+  outside federation    VPC CIDR in no federated block (default VPCs, ...)
+  orphan reservations   reserved_block that matches no VPC CIDR or IPAM
+                        allocation in any region
+  overlaps              federated VPC CIDRs overlapping each other, or a
+                        reservation without being equal to it (VPCs
+                        outside federation, like every region's default
+                        172.31.0.0/16, are left out)
+  IPAM drift            custom IPAM allocations without a reserved_block,
+                        reserved blocks in an AWS IPAM pool's range without
+                        a custom allocation
+
+Orphan reservations and reservations without IPAM allocation are only
+reported when every region could be fetched: a failed region's VPCs and
+allocations are unknown, so its reservations would look orphaned.
+
+Per-region inventories are cached in --cache-dir. A region checked less
+than --max-age seconds ago is not fetched at all; after that its VPCs are
+listed again and subnets are only re-listed for VPCs that are new or
+whose CIDRs/state changed (IPAM allocations only if any VPC changed).
+Every --full-age seconds, or with --refresh, a region is fetched in full,
+which also picks up subnet changes inside unchanged VPCs.
+
+Usage:
+  python3 reconcile_aws.py
+  python3 reconcile_aws.py --regions eu-west-1 us-east-1 --refresh
+  python3 reconcile_aws.py --realm "ACME Corporation" --max-workers 8
+
+Output Files:
+  reconcile_report.json - Findings, per region inventory counts
+"""
+
+import agent_client
+agent_client.forward()
+
+import os
+import sys
+import json
+import time
+import argparse
+import ipaddress
+from concurrent.futures import ThreadPoolExecutor
+
+import boto3
+
+from federation_records import RecordIndex
+from federation_snapshot import SnapshotTaker
+from rate_governor import govern_boto3_client
+import profiling
+
+CACHE_VERSION = 1
+VPC_FILTER_CHUNK = 200
+
+
+def _tag(resource, key="Name"):
+    return next((t["Value"] for t in resource.get("Tags", []) if t["Key"] == key), None)
+
+
+def _vpc_cidrs(vpc):
+    return sorted(a["CidrBlock"] for a in vpc.get("CidrBlockAssociationSet", [])
+                  if a.get("CidrBlockState", {}).get("State") == "associated")
+
+
+def find_overlaps(intervals):
+    """Pairs of overlapping (start, end, label) intervals, by a sort-and-sweep."""
+    pairs = []
+    active = []
+    for start, end, label in sorted(intervals):
+        active = [a for a in active if a[1] >= start]
+        pairs.extend((a[2], label) for a in active)
+        active.append((start, end, label))
+    return pairs
+
+
+# --- AWS ---
+
+class RegionInventory:
+    """VPCs, subnets and IPAM allocations of one region, with an on-disk cache."""
+
+    def __init__(self, ec2, region, account, cache_dir):
+        self.ec2 = ec2
+        self.region = region
+        self.path = os.path.join(cache_dir, f"{account}-{region}.json")
+        self.data = None
+        self.mode = None
+        self.calls = 0
+
+    def _paginate(self, operation, key, **kwargs):
+        for page in self.ec2.get_paginator(operation).paginate(**kwargs):
+            self.calls += 1
+            yield from page.get(key, [])
+
+    def _subnets(self, vpc_ids=None):
+        subnets = {}
+        if vpc_ids is None:
+            pages = [self._paginate("describe_subnets", "Subnets")]
+        else:
+            ids = sorted(vpc_ids)
+            pages = [self._paginate("describe_subnets", "Subnets",
+                                    Filters=[{"Name": "vpc-id", "Values": ids[i:i + VPC_FILTER_CHUNK]}])
+                     for i in range(0, len(ids), VPC_FILTER_CHUNK)]
+        for page in pages:
+            for s in page:
+                subnets.setdefault(s["VpcId"], []).append(
+                    {"id": s["SubnetId"], "cidr": s.get("CidrBlock"), "name": _tag(s)})
+        return subnets
+
+    def _allocations(self):
+        allocations = []
+        for pool in self._paginate("describe_ipam_pools", "IpamPools"):
+            if pool.get("AddressFamily") != "ipv4":
+                continue
+            for a in self._paginate("get_ipam_pool_allocations", "IpamPoolAllocations",
+                                    IpamPoolId=pool["IpamPoolId"]):
+                allocations.append({
+                    "pool": pool["IpamPoolId"], "locale": pool.get("Locale"), "cidr": a.get("Cidr"),
+                    "type": a.get("ResourceType"), "resource": a.get("ResourceId"),
+                    "region": a.get("ResourceRegion"),
+                })
+        return allocations
+
+    def _vpcs(self):
+        return {v["VpcId"]: {"cidrs": _vpc_cidrs(v), "state": v.get("State"), "name": _tag(v)}
+                for v in self._paginate("describe_vpcs", "Vpcs")}
+
+    def load(self, max_age, full_age, refresh=False):
+        now = time.time()
+        cached = None
+        if not refresh and os.path.exists(self.path):
+            with open(self.path, "r") as f:
+                cached = json.load(f)
+            if cached.get("version") != CACHE_VERSION:
+                cached = None
+
+        if cached and now - cached["checked_at"] < max_age:
+            self.data, self.mode = cached, "cached"
+            return self
+        if cached and now - cached["fetched_at"] < full_age:
+            vpcs = self._vpcs()
+            old = cached["vpcs"]
+            # State or CIDR changes are what make a VPC's subnets worth re-listing
+            changed = {v for v, info in vpcs.items()
+                       if v not in old or [info["state"], info["cidrs"]] != [old[v]["state"], old[v]["cidrs"]]}
+            subnets = {v: s for v, s in cached["subnets"].items() if v in vpcs and v not in changed}
+            if changed:
+                subnets.update(self._subnets(changed))
+            vpc_set_changed = bool(changed) or set(old) != set(vpcs)
+            allocations = self._allocations() if vpc_set_changed else cached["allocations"]
+            self.data = dict(cached, checked_at=now, vpcs=vpcs, subnets=subnets, allocations=allocations)
+            self.mode = f"incremental ({len(changed)} VPCs changed)"
+        else:
+            self.data = {
+                "version": CACHE_VERSION, "region": self.region, "fetched_at": now, "checked_at": now,
+                "vpcs": self._vpcs(), "subnets": self._subnets(), "allocations": self._allocations(),
+            }
+            self.mode = "full"
+
+        tmp = f"{self.path}.tmp"
+        with open(tmp, "w") as f:
+            json.dump(self.data, f)
+        os.replace(tmp, self.path)
+        return self
+
+
+def enabled_regions(ec2):
+    resp = ec2.describe_regions(Filters=[{"Name": "opt-in-status", "Values": ["opt-in-not-required", "opted-in"]}])
+    return sorted(r["RegionName"] for r in resp["Regions"])
+
+
+# --- Diff ---
+
+def reconcile(inventories, blocks, reserved, complete=True):
+    """Findings from region inventories against federated and reserved blocks.
+
+    With complete=False (some regions could not be fetched) the checks
+    that need every region, orphan and missing-allocation, are skipped.
+    """
+    block_index = RecordIndex(blocks)
+    reserved_by_cidr = {}
+    for rec in reserved:
+        reserved_by_cidr.setdefault(str(rec.network), []).append(rec)
+
+    vpc_cidrs = []          # (network, label)
+    for inv in inventories:
+        for vpc_id, vpc in inv.data["vpcs"].items():
+            for cidr in vpc["cidrs"]:
+                vpc_cidrs.append((ipaddress.ip_network(cidr), {
+                    "region": inv.region, "vpc": vpc_id, "name": vpc["name"], "cidr": cidr,
+                    "subnets": len(inv.data["subnets"].get(vpc_id, []))}))
+    allocations = [dict(a, source_region=inv.region) for inv in inventories for a in inv.data["allocations"]
+                   if a.get("cidr")]
+
+    findings = {"unmanaged_vpcs": [], "outside_federation": [], "orphan_reservations": [],
+                "overlaps": [], "ipam_unreserved_allocations": [], "ipam_missing_allocations": []}
+
+    federated = []
+    for net, vpc in vpc_cidrs:
+        if str(net) in reserved_by_cidr:
+            federated.append((net, vpc))
+            continue
+        block = block_index.containing(net.network_address, max_prefixlen=net.prefixlen)
+        if block:
+            federated.append((net, vpc))
+            findings["unmanaged_vpcs"].append(dict(vpc, block=block.name or str(block.network)))
+        else:
+            findings["outside_federation"].append(vpc)
+
+    used = {str(net) for net, _ in vpc_cidrs} | {a["cidr"] for a in allocations}
+    for cidr, recs in reserved_by_cidr.items():
+        if complete and cidr not in used:
+            for rec in recs:
+                findings["orphan_reservations"].append({"cidr": cidr, "id": rec.id, "name": rec.name})
+
+    # Default VPCs share 172.31.0.0/16 in every region; only federated VPCs can conflict
+    items = [("vpc", net, vpc) for net, vpc in federated]
+    items += [("reserved", rec.network, {"cidr": str(rec.network), "id": rec.id}) for rec in reserved]
+    intervals = [(net.version << 128 | int(net.network_address), net.version << 128 | int(net.broadcast_address), i)
+                 for i, (_, net, _) in enumerate(items)]
+    for i, j in find_overlaps(intervals):
+        (kind_a, _, a), (kind_b, _, b) = items[i], items[j]
+        if kind_a == kind_b == "reserved":
+            continue  # nested reservations are Infoblox's business
+        if kind_a != kind_b and a["cidr"] == b["cidr"]:
+            continue  # VPC and its own reservation
+        findings["overlaps"].append({"a": dict(a, kind=kind_a), "b": dict(b, kind=kind_b)})
+
+    custom = [a for a in allocations if a["type"] == "custom"]
+    for a in custom:
+        if a["cidr"] not in reserved_by_cidr:
+            findings["ipam_unreserved_allocations"].append(a)
+    custom_cidrs = {a["cidr"] for a in custom}
+    pool_ranges = [ipaddress.ip_network(a["cidr"]) for a in allocations if a["type"] == "ipam-pool"]
+    for cidr, recs in reserved_by_cidr.items():
+        net = ipaddress.ip_network(cidr)
+        if complete and cidr not in custom_cidrs and any(net.version == p.version and net.subnet_of(p) for p in pool_ranges):
+            findings["ipam_missing_allocations"].append({"cidr": cidr, "id": recs[0].id})
+    return findings
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Reconcile AWS VPCs/IPAM against Infoblox reservations")
+    parser.add_argument("--config", default="config.yaml", help="Config file path")
+    parser.add_argument("--realm", help="Only this realm's blocks (default: every realm)")
+    parser.add_argument("--regions", nargs="+", help="Regions (default: all enabled regions)")
+    parser.add_argument("--max-workers", type=int, default=16, help="Regions fetched in parallel (default: 16)")
+    parser.add_argument("--cache-dir", default=".aws_inventory_cache", help="Per-region cache directory")
+    parser.add_argument("--max-age", type=float, default=300, help="Reuse a region checked this recently, seconds (default: 300)")
+    parser.add_argument("--full-age", type=float, default=3600, help="Fetch a region in full after this many seconds (default: 3600)")
+    parser.add_argument("--refresh", action="store_true", help="Ignore the cache")
+    parser.add_argument("--output", default="reconcile_report.json", help="Report file")
+    args = parser.parse_args()
+
+    start = time.monotonic()
+    home = os.environ.get('AWS_DEFAULT_REGION', 'eu-west-1')
+    account = boto3.client("sts", region_name=home).get_caller_identity()["Account"]
+    regions = args.regions or enabled_regions(govern_boto3_client(boto3.client("ec2", region_name=home)))
+    os.makedirs(args.cache_dir, exist_ok=True)
+    # Client creation is not thread-safe; the clients themselves are
+    inventories = [RegionInventory(govern_boto3_client(boto3.client("ec2", region_name=r)), r, account, args.cache_dir)
+                   for r in regions]
+    print(f"🌍 Account {account}: {len(regions)} regions")
+
+    taker = SnapshotTaker(args.config)
+
+    def fetch_infoblox():
+        # Sign-in (and its propagation wait) overlaps with the AWS fetches
+        taker.client.authenticate()
+        taker.client.switch_account()
+        realm_filter = None
+        if args.realm:
+            realm = next(iter(taker.iter_kind("federated_realm", _filter=f'name=="{args.realm}"')), None)
+            if not realm:
+                raise ValueError(f"❌ Realm '{args.realm}' not found")
+            realm_filter = f'federated_realm=="{realm["id"]}"'
+        listed = []
+        for kind in ("federated_block", "reserved_block"):
+            index = RecordIndex.from_results(taker.iter_kind(kind, _filter=realm_filter))
+            for error in index.invalid:
+                print(f"   ⚠️ Skipping {kind} {error}")
+            listed.append(index.records)
+        return listed
+
+    with ThreadPoolExecutor(max_workers=args.max_workers + 1) as pool:
+        infoblox = pool.submit(fetch_infoblox)
+        futures = {inv.region: pool.submit(inv.load, args.max_age, args.full_age, args.refresh) for inv in inventories}
+        failed = {}
+        for region, future in futures.items():
+            try:
+                inv = future.result()
+                d = inv.data
+                print(f"   {'📦' if inv.mode == 'cached' else '🔄'} {region}: {len(d['vpcs'])} VPCs, "
+                      f"{sum(len(s) for s in d['subnets'].values())} subnets, {len(d['allocations'])} IPAM allocations "
+                      f"— {inv.mode}, {inv.calls} calls")
+            except Exception as e:
+                failed[region] = str(e)
+                print(f"   ❌ {region}: {e}")
+        blocks, reserved = infoblox.result()
+    print(f"📋 Infoblox: {len(blocks)} federated blocks, {len(reserved)} reserved blocks")
+
+    ok = [inv for inv in inventories if inv.region not in failed]
+    findings = reconcile(ok, blocks, reserved, complete=not failed)
+    elapsed = time.monotonic() - start
+
+    report = {
+        "account": account,
+        "generated_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "regions": {inv.region: {"mode": inv.mode, "calls": inv.calls, "vpcs": len(inv.data["vpcs"])} for inv in ok},
+        "failed_regions": failed,
+        "complete": not failed,
+        "findings": findings,
+    }
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+
+    print(f"\n{'='*60}")
+    issues = sum(len(v) for k, v in findings.items() if k != "outside_federation")
+    print("🎉 AWS and Infoblox agree!" if not issues and not failed else "⚠️ Differences found")
+    print(f"   Unmanaged VPCs:          {len(findings['unmanaged_vpcs'])}")
+    print(f"   Outside federation:      {len(findings['outside_federation'])}")
+    if failed:
+        print(f"   Orphan reservations:     not checked ({len(failed)} regions failed)")
+    else:
+        print(f"   Orphan reservations:     {len(findings['orphan_reservations'])}")
+    print(f"   Overlaps:                {len(findings['overlaps'])}")
+    print(f"   IPAM without reservation:{len(findings['ipam_unreserved_allocations']):>3}")
+    if failed:
+        print("   Reservation without IPAM: not checked")
+    else:
+        print(f"   Reservation without IPAM:{len(findings['ipam_missing_allocations']):>3}")
+    for vpc in findings["unmanaged_vpcs"][:10]:
+        print(f"      ⚠️ {vpc['region']} {vpc['vpc']} {vpc['cidr']} ({vpc['name'] or 'unnamed'}) in {vpc['block']}")
+    for r in findings["orphan_reservations"][:10]:
+        print(f"      🗑️ reserved {r['cidr']} ({r['name'] or r['id']}) has no VPC")
+    print(f"   Regions:                 {len(ok)} ok, {len(failed)} failed ({elapsed:.1f}s)")
+    print(f"   Output:                  {args.output}")
+    print(f"{'='*60}")
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    profiling.install()
+    main()
@@ -4,13 +4,19 @@ Register AWS Cloud Provider with Infoblox for Discovery.
 Uses IAM Role assumption (not AWS access keys).
 """
 
+import agent_client
+agent_client.forward()
+
 import os
 import re
 import json
 import yaml
-import requests
 import time
 
+import csp_auth
+from http_session import ApiSession
+import profiling
+
 def load_config_with_env(file_path):
     with open(file_path, "r") as f:
         raw_yaml = f.read()
@@ -32,13 +38,21 @@ class AWSCloudProviderRegistrar:
         self.password = config['password']
         self.sandbox_id_file = config.get('sandbox_id_file')
         self.jwt = None
+        self.api_key = None
         self.headers = {}
+        self.session = ApiSession()
 
-    def authenticate(self):
+    def authenticate(self, allow_api_key=True):
         """Login and get JWT token"""
+        if allow_api_key:
+            self.api_key = csp_auth.load_api_key(self.sandbox_id_file)
+        if self.api_key:
+            self.headers = csp_auth.token_headers(self.api_key)
+            print("Using API key, skipping sign-in.")
+            return
         url = f"{self.base_url}/v2/session/users/sign_in"
         payload = {"email": self.email, "password": self.password}
-        r = requests.post(url, json=payload)
+        r = self.session.post(url, json=payload)
         r.raise_for_status()
         self.jwt = r.json()["jwt"]
         self.headers = {
@@ -49,6 +63,9 @@ class AWSCloudProviderRegistrar:
 
     def switch_account(self):
         """Switch to sandbox account"""
+        if self.api_key:
+            print("API key is scoped to the sandbox, skipping account switch.")
+            return
         if not self.sandbox_id_file or not os.path.exists(self.sandbox_id_file):
             print("No sandbox configured, using main account.")
             return
@@ -57,7 +74,7 @@ class AWSCloudProviderRegistrar:
             sandbox_id = f.read().strip()
         url = f"{self.base_url}/v2/session/account_switch"
         payload = {"id": f"identity/accounts/{sandbox_id}"}
-        r = requests.post(url, headers=self.headers, json=payload)
+        r = self.session.post(url, headers=self.headers, json=payload)
         r.raise_for_status()
         self.jwt = r.json()["jwt"]
         self.headers["Authorization"] = f"Bearer {self.jwt}"
@@ -199,7 +216,7 @@ class AWSCloudProviderRegistrar:
         print(f"Registering AWS cloud provider '{provider_name}'...")
         print(f"  Role ARN: {role_arn}")
 
-        r = requests.post(url, headers=self.headers, json=payload)
+        r = self.session.post(url, headers=self.headers, json=payload)
 
         if r.status_code == 201:
             print("AWS cloud provider registered successfully.")
@@ -214,6 +231,7 @@ class AWSCloudProviderRegistrar:
 
 
 if __name__ == "__main__":
+    profiling.install()
     import argparse
 
     parser = argparse.ArgumentParser(description="Register AWS Cloud Provider with Infoblox")
@@ -224,7 +242,7 @@ if __name__ == "__main__":
     args = parser.parse_args()
 
     registrar = AWSCloudProviderRegistrar(args.config)
-    registrar.authenticate()
+    registrar.authenticate(allow_api_key=args.sandbox)
 
     if args.sandbox:
         registrar.switch_account()
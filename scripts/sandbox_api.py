@@ -1,8 +1,9 @@
 import json
-import requests
 import logging
 from logging.handlers import RotatingFileHandler
 
+from http_session import ApiSession
+
 # Setup logging
 logger = logging.getLogger('SandboxAccountLogger')
 logger.setLevel(logging.DEBUG)
@@ -20,6 +21,7 @@ class SandboxAccountAPI:
     def __init__(self, base_url: str, token: str):
         self.base_url = base_url.rstrip("/")
         self.token = token
+        self.session = ApiSession()
 
     def _headers(self):
         headers = {
@@ -34,7 +36,7 @@ class SandboxAccountAPI:
         endpoint = f"{self.base_url}/sandbox/accounts"
         try:
             logger.debug(f"Creating sandbox at {endpoint} with payload: {sandbox_account_request}")
-            response = requests.post(url=endpoint, headers=self._headers(), data=json.dumps(sandbox_account_request))
+            response = self.session.post(url=endpoint, headers=self._headers(), data=json.dumps(sandbox_account_request))
             response.raise_for_status()
             result = response.json()
             logger.info(f"Sandbox created: {json.dumps(result, indent=2)}")
@@ -48,7 +50,7 @@ class SandboxAccountAPI:
         params = {"_filter": f'name=="{name}"'}
         try:
             logger.debug(f"Querying sandbox ID with filter: {params}")
-            response = requests.get(endpoint, headers=self._headers(), params=params)
+            response = self.session.get(endpoint, headers=self._headers(), params=params)
             response.raise_for_status()
             result = response.json()
             if result.get("results"):
@@ -62,12 +64,35 @@ class SandboxAccountAPI:
             logger.error(f"Error fetching sandbox ID: {e}")
             return None
 
+    def list_sandbox_accounts(self, _filter: str = None, _tfilter: str = None, page_size: int = 100):
+        """
+        Yields every sandbox account matching the filters, one page at a time.
+        `_filter` filters on fields (e.g. 'created_at<"2025-01-01T00:00:00Z"'),
+        `_tfilter` on tags (e.g. 'instruqt=="igor"').
+        """
+        endpoint = f"{self.base_url}/sandbox/accounts"
+        offset = 0
+        while True:
+            params = {"_limit": page_size, "_offset": offset}
+            if _filter:
+                params["_filter"] = _filter
+            if _tfilter:
+                params["_tfilter"] = _tfilter
+            logger.debug(f"Listing sandboxes with params: {params}")
+            response = self.session.get(endpoint, headers=self._headers(), params=params)
+            response.raise_for_status()
+            page = response.json().get("results", [])
+            yield from page
+            if len(page) < page_size:
+                return
+            offset += page_size
+
     def delete_sandbox_account(self, sandbox_id: str) -> bool:
         endpoint = f"{self.base_url}/sandbox/accounts/{sandbox_id}"
         try:
             logger.debug(f"Deleting sandbox ID: {sandbox_id} at {endpoint}")
-            response = requests.delete(endpoint, headers=self._headers())
-            if response.status_code == 204:
+            response = self.session.delete(endpoint, headers=self._headers())
+            if response.status_code in (200, 204):
                 logger.info(f"Sandbox ID {sandbox_id} deleted successfully.")
                 return True
             else:
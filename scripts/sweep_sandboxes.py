@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+"""
+Sweep orphaned sandbox accounts.
+
+Sandboxes created by create_sandbox_new.py are normally deleted by
+delete_sandbox_new.py, which needs the local sandbox_id.txt. When the lab
+VM dies that file is gone and the sandbox leaks. This script lists all
+sandbox accounts (paginated, filtered server-side on tag and creation
+time), treats those older than the TTL as orphans and, once the listing
+is complete, deletes them concurrently under a rate limit.
+
+Usage:
+  python3 sweep_sandboxes.py --dry-run                     # report only
+  python3 sweep_sandboxes.py --ttl-hours 12
+  python3 sweep_sandboxes.py --tag instruqt=igor --rate 2 --max-workers 4
+
+Environment Variables:
+  Infoblox_Token - Required. CSP API token with sandbox admin rights.
+
+Output Files:
+  sweep_report.json - Orphans found and the outcome for each
+"""
+
+import agent_client
+agent_client.forward()
+
+import os
+import sys
+import json
+import time
+import argparse
+import threading
+from datetime import datetime, timedelta, timezone
+from concurrent.futures import ThreadPoolExecutor
+
+from sandbox_api import SandboxAccountAPI
+import profiling
+
+BASE_URL = "https://csp.infoblox.com/v2"
+TOKEN = os.environ.get('Infoblox_Token')
+
+
+class RateLimiter:
+    """Spaces calls at least 1/rate seconds apart across all threads."""
+
+    def __init__(self, rate):
+        self.interval = 1.0 / rate if rate > 0 else 0
+        self._next = time.monotonic()
+        self._lock = threading.Lock()
+
+    def wait(self):
+        with self._lock:
+            now = time.monotonic()
+            delay = self._next - now
+            self._next = max(now, self._next) + self.interval
+        if delay > 0:
+            time.sleep(delay)
+
+
+def parse_time(value):
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(value.replace("Z", "+00:00"))
+    except ValueError:
+        return None
+
+
+def tag_filter(tag):
+    """'instruqt' -> instruqt exists; 'instruqt=igor' -> instruqt=="igor"."""
+    if "=" in tag:
+        key, value = tag.split("=", 1)
+        return f'{key}=="{value}"'
+    return tag
+
+
+def find_orphans(api, tag, cutoff, name_prefix=None):
+    """Stream sandbox accounts and yield those created before the cutoff."""
+    created_filter = f'created_at<"{cutoff.strftime("%Y-%m-%dT%H:%M:%SZ")}"'
+    key, _, value = tag.partition("=")
+    for account in api.list_sandbox_accounts(_filter=created_filter, _tfilter=tag_filter(tag)):
+        # Re-check client side in case the server ignores part of the filter
+        tags = account.get("tags") or {}
+        if key not in tags or (value and tags.get(key) != value):
+            continue
+        if name_prefix and not account.get("name", "").startswith(name_prefix):
+            continue
+        created = parse_time(account.get("created_at"))
+        if created is None or created >= cutoff:
+            continue
+        yield account
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Find and delete orphaned sandbox accounts")
+    parser.add_argument("--tag", default="instruqt", help="Tag key or key=value identifying lab sandboxes (default: instruqt)")
+    parser.add_argument("--ttl-hours", type=float, default=24, help="Sandboxes older than this are orphans (default: 24)")
+    parser.add_argument("--name-prefix", help="Only consider sandboxes whose name starts with this prefix")
+    parser.add_argument("--max-workers", type=int, default=4, help="Concurrent deletions (default: 4)")
+    parser.add_argument("--rate", type=float, default=2, help="Max deletions per second (default: 2)")
+    parser.add_argument("--report", default="sweep_report.json", help="Report file (default: sweep_report.json)")
+    parser.add_argument("--dry-run", action="store_true", help="Report orphans without deleting them")
+    args = parser.parse_args()
+
+    if not TOKEN:
+        print("❌ Infoblox_Token environment variable not set")
+        sys.exit(1)
+
+    api = SandboxAccountAPI(base_url=BASE_URL, token=TOKEN)
+    now = datetime.now(timezone.utc)
+    cutoff = now - timedelta(hours=args.ttl_hours)
+    limiter = RateLimiter(args.rate)
+
+    print(f"🔍 Sweeping sandboxes tagged '{args.tag}' created before {cutoff.isoformat(timespec='seconds')}", flush=True)
+
+    def delete(account):
+        sandbox_id = account["id"].split("/")[-1]
+        limiter.wait()
+        ok = api.delete_sandbox_account(sandbox_id)
+        print(f"   {'🗑️' if ok else '❌'} {account.get('name')} ({sandbox_id})", flush=True)
+        return ok
+
+    # List everything before deleting: the listing pages by _offset, and
+    # deleting while paging shifts later pages so accounts would be skipped
+    accounts = list(find_orphans(api, args.tag, cutoff, args.name_prefix))
+
+    orphans = []
+    futures = []
+    with ThreadPoolExecutor(max_workers=args.max_workers) as pool:
+        for account in accounts:
+            age_h = (now - parse_time(account["created_at"])).total_seconds() / 3600
+            orphans.append({
+                "id": account["id"],
+                "name": account.get("name"),
+                "created_at": account.get("created_at"),
+                "age_hours": round(age_h, 1),
+            })
+            if args.dry_run:
+                print(f"   🧟 {account.get('name')} ({account['id'].split('/')[-1]}) age {age_h:.1f}h", flush=True)
+            else:
+                futures.append(pool.submit(delete, account))
+
+    for orphan, future in zip(orphans, futures):
+        orphan["deleted"] = future.result()
+
+    with open(args.report, "w") as f:
+        json.dump({
+            "swept_at": now.isoformat(timespec="seconds"),
+            "cutoff": cutoff.isoformat(timespec="seconds"),
+            "tag": args.tag,
+            "dry_run": args.dry_run,
+            "orphans": orphans,
+        }, f, indent=2)
+
+    failed = [o for o in orphans if o.get("deleted") is False]
+    print(f"\n{'='*60}")
+    print("🔍 DRY RUN — nothing deleted" if args.dry_run else "🧹 Sweep Complete!")
+    print(f"   Orphans: {len(orphans)}")
+    if not args.dry_run:
+        print(f"   Deleted: {len(orphans) - len(failed)}")
+        print(f"   Failed:  {len(failed)}")
+    print(f"   Report:  {args.report}")
+    print(f"{'='*60}")
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    profiling.install()
+    main()
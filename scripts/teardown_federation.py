@@ -0,0 +1,281 @@
+#!/usr/bin/env python3
+"""
+Tear down a Federated Realm with its blocks, pools and reserved blocks.
+
+Reverse of deploy_ipam.py + create_federated_pool.py + assign_pool_to_block.py.
+Lists every object in the realm, computes the deletion order from
+parent/child containment and pool links, and deletes each tier
+concurrently (with retry on 429/5xx):
+
+  reserved blocks → leaf blocks → ... → top-level blocks → pools → realm
+
+Usage:
+  python3 teardown_federation.py
+  python3 teardown_federation.py --realm "ACME Corporation" --max-workers 32
+  python3 teardown_federation.py --keep-realm      # empty the realm, keep it
+  python3 teardown_federation.py --dry-run
+"""
+
+import agent_client
+agent_client.forward()
+
+import os
+import re
+import sys
+import time
+import random
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+
+import yaml
+import requests
+
+import csp_auth
+from http_session import ApiSession
+from federation_records import assign_parents
+import profiling
+
+FEDERATION_API = "/api/ddi/v1/federation"
+PAGE_SIZE = 1000
+
+
+def load_config_with_env(file_path):
+    with open(file_path, "r") as f:
+        raw_yaml = f.read()
+
+    def replace_env(match):
+        env_var = match.group(1)
+        return os.environ.get(env_var, f"<MISSING:{env_var}>")
+
+    interpolated_yaml = re.sub(r'\$\{(\w+)\}', replace_env, raw_yaml)
+    return yaml.safe_load(interpolated_yaml)
+
+
+class FederationTeardown:
+    def __init__(self, config_file="config.yaml", max_workers=16, max_retries=5):
+        config = load_config_with_env(config_file)
+
+        self.base_url = config['base_url']
+        self.email = config['email']
+        self.password = config['password']
+        self.sandbox_id_file = config['sandbox_id_file']
+        self.realm_name = config.get('realm', {}).get('name')
+        self.max_workers = max_workers
+        self.max_retries = max_retries
+        self.jwt = None
+        self.api_key = None
+        self.headers = {}
+        self.session = ApiSession()
+
+    def authenticate(self):
+        """Login and get JWT token"""
+        self.api_key = csp_auth.load_api_key(self.sandbox_id_file)
+        if self.api_key:
+            self.headers = csp_auth.token_headers(self.api_key)
+            print("✅ Using API key, skipping sign-in.")
+            return
+        url = f"{self.base_url}/v2/session/users/sign_in"
+        payload = {"email": self.email, "password": self.password}
+        r = self.session.post(url, json=payload)
+        r.raise_for_status()
+        self.jwt = r.json()["jwt"]
+        self.headers = {
+            "Authorization": f"Bearer {self.jwt}",
+            "Content-Type": "application/json"
+        }
+        print("✅ Logged in and JWT obtained.")
+
+    def switch_account(self):
+        """Switch to sandbox account"""
+        if self.api_key:
+            print("🔁 API key is scoped to the sandbox, skipping account switch.")
+            return
+        with open(self.sandbox_id_file, "r") as f:
+            sandbox_id = f.read().strip()
+        url = f"{self.base_url}/v2/session/account_switch"
+        payload = {"id": f"identity/accounts/{sandbox_id}"}
+        r = self.session.post(url, headers=self.headers, json=payload)
+        r.raise_for_status()
+        self.jwt = r.json()["jwt"]
+        self.headers["Authorization"] = f"Bearer {self.jwt}"
+        print(f"🔁 Switched to sandbox account {sandbox_id}")
+
+    # --- Inventory ---
+
+    def _list(self, kind, _filter=None):
+        """GET every object of a federation kind, following _offset pagination."""
+        url = f"{self.base_url}{FEDERATION_API}/{kind}"
+        results = []
+        offset = 0
+        while True:
+            params = {"_limit": PAGE_SIZE, "_offset": offset}
+            if _filter:
+                params["_filter"] = _filter
+            r = self.session.get(url, headers=self.headers, params=params)
+            r.raise_for_status()
+            page = r.json().get("results", [])
+            results.extend(page)
+            if len(page) < PAGE_SIZE:
+                return results
+            offset += PAGE_SIZE
+
+    def find_realm(self, name):
+        realms = self._list("federated_realm", _filter=f'name=="{name}"')
+        if not realms:
+            raise ValueError(f"❌ Realm '{name}' not found")
+        realm = realms[0]
+        print(f"📖 Found realm '{name}' (ID: {realm['id']})")
+        return realm
+
+    def inventory(self, realm_id):
+        realm_filter = f'federated_realm=="{realm_id}"'
+        inv = {
+            "reserved_block": self._list("reserved_block", _filter=realm_filter),
+            "federated_block": self._list("federated_block", _filter=realm_filter),
+            "federated_pool": self._list("federated_pool", _filter=realm_filter),
+        }
+        for kind, objs in inv.items():
+            print(f"📋 {kind}: {len(objs)}")
+        return inv
+
+    # --- Ordering ---
+
+    def plan(self, realm, inv, keep_realm=False):
+        """Return deletion tiers: lists of (kind, object) safe to delete concurrently.
+
+        An object must wait for everything that depends on it: a block for
+        its child blocks and reserved blocks, a pool for the blocks linked
+        to it, the realm for everything.
+        """
+        blocks = inv["federated_block"]
+        reserved = inv["reserved_block"]
+        pools = inv["federated_pool"]
+        block_ids = {b["id"] for b in blocks}
+
+        containment = assign_parents(blocks, reserved)
+        deps = {}
+        kinds = {}
+        for kind, objs in (("reserved_block", reserved), ("federated_block", blocks), ("federated_pool", pools)):
+            for obj in objs:
+                deps[obj["id"]] = set()
+                kinds[obj["id"]] = (kind, obj)
+
+        for obj in blocks + reserved:
+            parent = obj.get("parent") if obj.get("parent") in block_ids else containment.get(obj["id"])
+            if parent:
+                deps[parent].add(obj["id"])
+            pool_id = obj.get("federated_pool_id")
+            if pool_id in deps:
+                deps[pool_id].add(obj["id"])
+
+        if not keep_realm:
+            deps[realm["id"]] = set(deps)
+            kinds[realm["id"]] = ("federated_realm", realm)
+
+        tier = {}
+        remaining = dict(deps)
+        while remaining:
+            ready = [k for k, d in remaining.items() if all(x in tier for x in d)]
+            if not ready:
+                raise RuntimeError("❌ Dependency cycle in federation objects")
+            for k in ready:
+                tier[k] = max((tier[x] + 1 for x in remaining[k]), default=0)
+                del remaining[k]
+
+        tiers = {}
+        for obj_id, t in tier.items():
+            tiers.setdefault(t, []).append(kinds[obj_id])
+        return [tiers[t] for t in sorted(tiers)]
+
+    # --- Deletion ---
+
+    def delete_object(self, kind, obj):
+        """DELETE one object, retrying on throttling and transient errors. 404 counts as deleted."""
+        obj_uuid = obj["id"].split("/")[-1]
+        url = f"{self.base_url}{FEDERATION_API}/{kind}/{obj_uuid}"
+        label = obj.get("name") or f"{obj.get('address')}/{obj.get('cidr')}"
+        for attempt in range(self.max_retries):
+            try:
+                r = self.session.delete(url, headers=self.headers, timeout=30)
+                if r.status_code in (200, 204, 404):
+                    print(f"   🗑️ {kind} {label}", flush=True)
+                    return True
+                if r.status_code not in (409, 429, 500, 502, 503, 504):
+                    print(f"   ❌ {kind} {label}: {r.status_code} {r.text[:200]}", flush=True)
+                    return False
+                ra = r.headers.get("Retry-After")
+                sleep_s = int(ra) if (ra and ra.isdigit()) else min(30, 2 ** attempt + random.random())
+            except requests.RequestException as e:
+                print(f"   ⚠️ {kind} {label}: {e}", flush=True)
+                sleep_s = min(30, 2 ** attempt + random.random())
+            time.sleep(sleep_s)
+        print(f"   ❌ {kind} {label}: gave up after {self.max_retries} attempts", flush=True)
+        return False
+
+    def run(self, tiers):
+        failed = []
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            for i, tier in enumerate(tiers):
+                print(f"\n🧹 Tier {i}: deleting {len(tier)} objects...", flush=True)
+                start = time.monotonic()
+                results = list(pool.map(lambda item: self.delete_object(*item), tier))
+                failed.extend(item for item, ok in zip(tier, results) if not ok)
+                print(f"⏱️  Tier {i} finished in {time.monotonic() - start:.1f}s", flush=True)
+                if failed:
+                    # Parents of a failed object would only fail with 409
+                    print(f"❌ {len(failed)} deletions failed, stopping before tier {i + 1}")
+                    break
+        return failed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Tear down a federated realm, its blocks, pools and reserved blocks")
+    parser.add_argument("--config", default="config.yaml", help="Config file path")
+    parser.add_argument("--realm", help="Realm name (default: realm.name from config)")
+    parser.add_argument("--keep-realm", action="store_true", help="Delete the realm's contents but keep the realm")
+    parser.add_argument("--max-workers", type=int, default=16, help="Concurrent deletions per tier (default: 16)")
+    parser.add_argument("--dry-run", action="store_true", help="Show the deletion plan without deleting anything")
+    args = parser.parse_args()
+
+    teardown = FederationTeardown(args.config, max_workers=args.max_workers)
+    teardown.authenticate()
+    teardown.switch_account()
+
+    realm = teardown.find_realm(args.realm or teardown.realm_name)
+    inv = teardown.inventory(realm["id"])
+    tiers = teardown.plan(realm, inv, keep_realm=args.keep_realm)
+
+    if args.dry_run:
+        print(f"\n🔍 DRY RUN — {sum(len(t) for t in tiers)} deletions in {len(tiers)} tiers:")
+        for i, tier in enumerate(tiers):
+            counts = {}
+            for kind, _ in tier:
+                counts[kind] = counts.get(kind, 0) + 1
+            print(f"   Tier {i}: " + ", ".join(f"{n} {k}" for k, n in counts.items()))
+        return
+
+    start = time.monotonic()
+    failed = teardown.run(tiers)
+
+    if not failed and not args.keep_realm:
+        for filename in ["federation_output.json", "federated_pool_output.json"]:
+            try:
+                os.remove(filename)
+                print(f"🧹 Removed {filename}")
+            except OSError:
+                pass
+
+    print(f"\n{'='*60}")
+    print("🎉 Federation Teardown Complete!" if not failed else "⚠️ Federation teardown finished with errors")
+    print(f"   Realm:   {realm.get('name')} ({realm['id']})")
+    print(f"   Objects: {sum(len(t) for t in tiers)} in {len(tiers)} tiers")
+    print(f"   Failed:  {len(failed)}")
+    print(f"   Time:    {time.monotonic() - start:.1f}s")
+    print(f"{'='*60}")
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    profiling.install()
+    main()
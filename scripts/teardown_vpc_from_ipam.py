@@ -0,0 +1,276 @@
+#!/usr/bin/env python3
+"""
+Tear down AWS VPCs created by deploy_vpc_from_ipam.py.
+
+Reads one or many vpc_deployment_output.json files, builds the dependency
+graph between the recorded resources and deletes them level by level.
+Each level runs in parallel across ALL VPCs, so 200 VPCs take as long
+as one:
+
+  Level 0: Disassociate route table from subnet | Detach IGW from VPC
+  Level 1: Delete route table | Delete IGW | Delete subnet
+  Level 2: Delete VPC
+  Level 3: DELETE reserved_block in Infoblox (releases AWS IPAM custom-allocation)
+
+A failed task skips everything that depends on it; resources that are
+already gone (NotFound) count as deleted, so the script can be re-run.
+
+Usage:
+  python3 teardown_vpc_from_ipam.py
+  python3 teardown_vpc_from_ipam.py outputs/*.json --max-workers 32
+  python3 teardown_vpc_from_ipam.py --dry-run
+"""
+
+import agent_client
+agent_client.forward()
+
+import os
+import sys
+import json
+import time
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+
+import boto3
+from botocore.exceptions import ClientError
+
+from deploy_vpc_from_ipam import InfobloxVPCDeployer
+from rate_governor import govern_boto3_client
+import profiling
+
+
+class TeardownTask:
+    def __init__(self, key, description, action, deps=()):
+        self.key = key
+        self.description = description
+        self.action = action
+        self.deps = list(deps)
+        self.status = "pending"
+        self.error = None
+
+
+def _is_not_found(err):
+    return err.response.get("Error", {}).get("Code", "").endswith("NotFound")
+
+
+def _call_ec2(fn, retries=5, **kwargs):
+    """Call an EC2 API, treating NotFound as done and retrying DependencyViolation.
+
+    AWS releases dependencies (ENIs, associations) asynchronously, so a VPC
+    delete issued right after its subnet delete can briefly be rejected.
+    """
+    for attempt in range(retries):
+        try:
+            return fn(**kwargs)
+        except ClientError as e:
+            if _is_not_found(e):
+                return None
+            code = e.response.get("Error", {}).get("Code", "")
+            if code != "DependencyViolation" or attempt == retries - 1:
+                raise
+            time.sleep(2 ** attempt)
+
+
+class VPCTeardown:
+    def __init__(self, max_workers=16, dry_run=False):
+        self.max_workers = max_workers
+        self.dry_run = dry_run
+        self.tasks = {}
+        self.deployments = []
+        self._clients = {}
+        self.infoblox = None
+
+    # --- Inputs ---
+
+    def _ec2(self, region):
+        # boto3 clients are thread-safe; share one per region across workers
+        if region not in self._clients:
+            self._clients[region] = govern_boto3_client(boto3.client('ec2', region_name=region))
+        return self._clients[region]
+
+    def load_outputs(self, output_files):
+        for path in output_files:
+            with open(path, "r") as f:
+                data = json.load(f)
+            data["_file"] = path
+            self.deployments.append(data)
+            print(f"📖 Loaded {path}: {data.get('vpc', {}).get('id')} ({data.get('vpc', {}).get('cidr')})")
+        return self.deployments
+
+    # --- Graph ---
+
+    def _add(self, key, description, action, deps=()):
+        self.tasks[key] = TeardownTask(key, description, action, [d for d in deps if d in self.tasks])
+        return key
+
+    def build_graph(self):
+        for d in self.deployments:
+            region = d.get("region") or os.environ.get('AWS_DEFAULT_REGION', 'eu-west-1')
+            ec2 = self._ec2(region)
+            vpc_id = d.get("vpc", {}).get("id")
+            subnet_id = d.get("subnet", {}).get("id")
+            igw_id = d.get("igw", {}).get("id")
+            rt_id = d.get("route_table", {}).get("id")
+            reserved_id = d.get("infoblox", {}).get("reserved_block_id")
+
+            vpc_deps = []
+            if rt_id:
+                assoc = self._add(f"{rt_id}:disassociate", f"Disassociate {rt_id}",
+                                  lambda ec2=ec2, rt_id=rt_id: self._disassociate_route_table(ec2, rt_id))
+                vpc_deps.append(self._add(f"{rt_id}:delete", f"Delete route table {rt_id}",
+                                          lambda ec2=ec2, rt_id=rt_id: _call_ec2(ec2.delete_route_table, RouteTableId=rt_id),
+                                          deps=[assoc]))
+            if igw_id:
+                detach = self._add(f"{igw_id}:detach", f"Detach {igw_id} from {vpc_id}",
+                                   lambda ec2=ec2, igw_id=igw_id, vpc_id=vpc_id: _call_ec2(
+                                       ec2.detach_internet_gateway, InternetGatewayId=igw_id, VpcId=vpc_id))
+                vpc_deps.append(self._add(f"{igw_id}:delete", f"Delete IGW {igw_id}",
+                                          lambda ec2=ec2, igw_id=igw_id: _call_ec2(
+                                              ec2.delete_internet_gateway, InternetGatewayId=igw_id),
+                                          deps=[detach]))
+            if subnet_id:
+                vpc_deps.append(self._add(f"{subnet_id}:delete", f"Delete subnet {subnet_id}",
+                                          lambda ec2=ec2, subnet_id=subnet_id: _call_ec2(
+                                              ec2.delete_subnet, SubnetId=subnet_id),
+                                          deps=[f"{rt_id}:disassociate"]))
+            if vpc_id:
+                vpc_task = self._add(f"{vpc_id}:delete", f"Delete VPC {vpc_id}",
+                                     lambda ec2=ec2, vpc_id=vpc_id: _call_ec2(ec2.delete_vpc, VpcId=vpc_id),
+                                     deps=vpc_deps)
+                if reserved_id:
+                    self._add(f"{reserved_id}:release", f"Release reserved block {reserved_id.split('/')[-1]}",
+                              lambda reserved_id=reserved_id: self.infoblox.delete_reserved_block(reserved_id),
+                              deps=[vpc_task])
+        return self.tasks
+
+    def levels(self):
+        """Group tasks by depth in the dependency graph (Kahn's algorithm)."""
+        depth = {}
+        remaining = dict(self.tasks)
+        while remaining:
+            ready = [k for k, t in remaining.items() if all(d in depth for d in t.deps)]
+            if not ready:
+                raise RuntimeError(f"❌ Dependency cycle among: {', '.join(remaining)}")
+            for k in ready:
+                depth[k] = max((depth[d] + 1 for d in remaining[k].deps), default=0)
+                del remaining[k]
+        grouped = {}
+        for k, lvl in depth.items():
+            grouped.setdefault(lvl, []).append(self.tasks[k])
+        return [grouped[lvl] for lvl in sorted(grouped)]
+
+    # --- AWS ---
+
+    def _disassociate_route_table(self, ec2, rt_id):
+        resp = _call_ec2(ec2.describe_route_tables, RouteTableIds=[rt_id])
+        if not resp:
+            return
+        for rt in resp.get("RouteTables", []):
+            for assoc in rt.get("Associations", []):
+                if not assoc.get("Main"):
+                    _call_ec2(ec2.disassociate_route_table, AssociationId=assoc["RouteTableAssociationId"])
+
+    # --- Execution ---
+
+    def _run_task(self, task):
+        failed = [d for d in task.deps if self.tasks[d].status != "done"]
+        if failed:
+            task.status = "skipped"
+            task.error = f"dependency failed: {failed[0]}"
+            return task
+        start = time.monotonic()
+        try:
+            task.action()
+            task.status = "done"
+            print(f"   ✅ {task.description} ({time.monotonic() - start:.1f}s)", flush=True)
+        except Exception as e:
+            task.status = "failed"
+            task.error = str(e)
+            print(f"   ❌ {task.description}: {e}", flush=True)
+        return task
+
+    def run(self):
+        levels = self.levels()
+        if self.dry_run:
+            print(f"\n🔍 DRY RUN — {len(self.tasks)} tasks in {len(levels)} levels:")
+            for i, level in enumerate(levels):
+                print(f"   Level {i}:")
+                for task in level:
+                    print(f"     - {task.description}")
+            return True
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            for i, level in enumerate(levels):
+                print(f"\n🧹 Level {i}: {len(level)} tasks in parallel...", flush=True)
+                start = time.monotonic()
+                list(pool.map(self._run_task, level))
+                print(f"⏱️  Level {i} finished in {time.monotonic() - start:.1f}s", flush=True)
+
+        return all(t.status == "done" for t in self.tasks.values())
+
+    def completed_outputs(self):
+        """Output files whose every resource was torn down."""
+        done = []
+        for d in self.deployments:
+            keys = [k for k in self.tasks if any(
+                rid and k.startswith(f"{rid}:") for rid in (
+                    d.get("vpc", {}).get("id"), d.get("subnet", {}).get("id"),
+                    d.get("igw", {}).get("id"), d.get("route_table", {}).get("id"),
+                    d.get("infoblox", {}).get("reserved_block_id")))]
+            if all(self.tasks[k].status == "done" for k in keys):
+                done.append(d["_file"])
+        return done
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Tear down AWS VPCs deployed from Infoblox Federated IPAM")
+    parser.add_argument("outputs", nargs="*", default=["vpc_deployment_output.json"],
+                        help="vpc_deployment_output.json files (default: vpc_deployment_output.json)")
+    parser.add_argument("--max-workers", type=int, default=16, help="Parallel tasks per level (default: 16)")
+    parser.add_argument("--keep-infoblox", action="store_true", help="Do not release reserved blocks in Infoblox")
+    parser.add_argument("--keep-output", action="store_true", help="Keep output files after a successful teardown")
+    parser.add_argument("--dry-run", action="store_true", help="Show the teardown plan without deleting anything")
+    args = parser.parse_args()
+
+    teardown = VPCTeardown(max_workers=args.max_workers, dry_run=args.dry_run)
+    if args.keep_infoblox:
+        for d in teardown.load_outputs(args.outputs):
+            d.get("infoblox", {}).pop("reserved_block_id", None)
+    else:
+        teardown.load_outputs(args.outputs)
+        if not args.dry_run:
+            teardown.infoblox = InfobloxVPCDeployer()
+            teardown.infoblox.authenticate()
+            teardown.infoblox.switch_account()
+
+    teardown.build_graph()
+    ok = teardown.run()
+    if args.dry_run:
+        return
+
+    if not args.keep_output:
+        for path in teardown.completed_outputs():
+            os.remove(path)
+            print(f"🧹 Removed {path}")
+
+    counts = {}
+    for t in teardown.tasks.values():
+        counts[t.status] = counts.get(t.status, 0) + 1
+
+    print(f"\n{'='*60}")
+    print("🎉 Teardown Complete!" if ok else "⚠️ Teardown finished with errors")
+    print(f"   VPCs:    {len(teardown.deployments)}")
+    print(f"   Done:    {counts.get('done', 0)}")
+    print(f"   Failed:  {counts.get('failed', 0)}")
+    print(f"   Skipped: {counts.get('skipped', 0)}")
+    for t in teardown.tasks.values():
+        if t.status != "done":
+            print(f"   ❌ {t.description}: {t.error}")
+    print(f"{'='*60}")
+    if not ok:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    profiling.install()
+    main()
@@ -0,0 +1,82 @@
+"""
+Lookup cache invalidation tests for agent.WarmState.
+
+Run: python3 -m pytest -q test_agent.py
+"""
+
+import pytest
+
+from agent import WarmState
+
+BASE = "https://csp.example.com/api/ddi/v1/federation"
+
+
+class FakeResponse:
+    ok = True
+
+    def __init__(self, results):
+        self.results = results
+
+    def json(self):
+        return {"results": self.results}
+
+
+class FakeApi:
+    """send() stand-in: answers name lookups from a dict of realm names."""
+
+    def __init__(self):
+        self.realms = {"ACME": "federation/federated_realm/abc"}
+        self.calls = []
+
+    def send(self, session, method, url, *args, **kwargs):
+        self.calls.append((method, url))
+        if method == "GET":
+            name = kwargs["params"]["_filter"].split('"')[1]
+            return FakeResponse([{"id": self.realms[name]}] if name in self.realms else [])
+        if method == "DELETE":
+            self.realms = {k: v for k, v in self.realms.items() if not url.endswith(v.split("/")[-1])}
+        return FakeResponse([])
+
+
+def lookup(state, api, name="ACME"):
+    return state.request(api.send, None, "GET", f"{BASE}/federated_realm",
+                         params={"_filter": f'name=="{name}"'}).json()["results"]
+
+
+@pytest.mark.parametrize("url,kind", [
+    (f"{BASE}/federated_realm", "federated_realm"),
+    (f"{BASE}/federated_realm/", "federated_realm"),
+    (f"{BASE}/federated_realm/abc", "federated_realm"),
+    (f"{BASE}/federated_block/def", "federated_block"),
+    (f"{BASE}/federated_block/def/next_available_subnet", None),
+    (f"{BASE}/reserved_block/abc", None),
+    ("https://csp.example.com/api/ddi/v1/ipam/address_block", None),
+])
+def test_lookup_kind(url, kind):
+    assert WarmState()._lookup_kind(url) == kind
+
+
+def test_lookup_is_cached():
+    state, api = WarmState(), FakeApi()
+    assert lookup(state, api) == lookup(state, api)
+    assert len(api.calls) == 1
+
+
+@pytest.mark.parametrize("method", ["DELETE", "PATCH", "PUT"])
+def test_write_to_one_object_clears_its_kind(method):
+    state, api = WarmState(), FakeApi()
+    assert lookup(state, api)
+    state.request(api.send, None, method, f"{BASE}/federated_realm/abc")
+    if method == "DELETE":
+        assert lookup(state, api) == []
+    else:
+        lookup(state, api)
+        assert [m for m, _ in api.calls].count("GET") == 2
+
+
+def test_write_to_other_kind_keeps_cache():
+    state, api = WarmState(), FakeApi()
+    lookup(state, api)
+    state.request(api.send, None, "PATCH", f"{BASE}/federated_block/def")
+    lookup(state, api)
+    assert [m for m, _ in api.calls].count("GET") == 1
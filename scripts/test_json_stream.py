@@ -0,0 +1,60 @@
+"""
+Chunk-boundary tests for json_stream.iter_results / first_match.
+
+Run: python3 -m pytest -q test_json_stream.py
+"""
+
+import json
+
+import pytest
+
+from json_stream import iter_results, first_match
+
+
+class FakeResponse:
+    """Just enough of requests.Response: iter_content over a fixed body."""
+
+    def __init__(self, body, chunk_size):
+        self.body = body.encode("utf-8")
+        self.chunk_size = chunk_size
+        self.closed = False
+
+    def iter_content(self, chunk_size=None):
+        for i in range(0, len(self.body), self.chunk_size):
+            yield self.body[i:i + self.chunk_size]
+
+    def close(self):
+        self.closed = True
+
+
+DOCUMENTS = [
+    {"results": [123456789, -1.25e-3, 0, 7E+2, 3.5, -0.0, 1e10]},
+    {"total": 1.5e3, "count": -42, "results": [{"id": "a", "cidr": 24}, 99.99, "text", True, None]},
+    {"results": [{"address": "10.0.0.0", "cidr": 8, "tags": {"ünï": "cödé"}}, [1, 2, [3.25]]], "next": 12345},
+    {"results": []},
+    {"other": 1.0},
+]
+
+
+@pytest.mark.parametrize("chunk_size", [1, 2, 3, 5, 7, 64])
+@pytest.mark.parametrize("doc", DOCUMENTS)
+def test_chunked_results_match_json_loads(doc, chunk_size):
+    body = json.dumps(doc)
+    response = FakeResponse(body, chunk_size)
+    assert list(iter_results(response, chunk_size=chunk_size)) == doc.get("results", [])
+    assert response.closed
+
+
+@pytest.mark.parametrize("chunk_size", [1, 3])
+def test_top_level_list_of_numbers(chunk_size):
+    values = [1, -2.5, 3e-7, 40000000000, 0.125]
+    response = FakeResponse(json.dumps(values), chunk_size)
+    assert list(iter_results(response, chunk_size=chunk_size)) == values
+
+
+@pytest.mark.parametrize("chunk_size", [1, 3])
+def test_first_match_stops_and_closes(chunk_size):
+    body = json.dumps({"count": 2.75e2, "results": [{"name": "A"}, {"name": "APPS"}, {"name": "B"}]})
+    response = FakeResponse(body, chunk_size)
+    assert first_match(response, lambda p: p["name"] == "APPS", chunk_size=chunk_size) == {"name": "APPS"}
+    assert response.closed
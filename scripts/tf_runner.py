@@ -0,0 +1,350 @@
+#!/usr/bin/env python3
+"""
+Terraform runner for the lab configurations under terraform/.
+
+Running `terraform init && terraform apply -auto-approve` from scratch
+downloads every provider again, re-initializes configurations that have
+not changed, plans twice on retries and says nothing about where the
+time went. This runner:
+
+  - shares one provider plugin cache (TF_PLUGIN_CACHE_DIR) across all
+    configurations and runs, so bloxone/aws/azurerm are downloaded once
+  - skips `terraform init` when .terraform.lock.hcl, the provider and
+    module declarations (source/version/backend, including local modules
+    and *.tf.json) are unchanged since the last successful init
+  - passes -parallelism to plan/apply/destroy
+  - saves plans (plan -out) keyed by a hash of the configuration,
+    variables and local state, and reuses a saved plan that has changes
+    (for up to an hour) when none of those changed; a "no changes" result
+    is never reused, since changes made outside this directory (cloud
+    drift, remote state) are not in the key. Terraform itself refuses to
+    apply a saved plan whose state has moved on
+  - skips apply when a fresh plan has no changes
+  - reports wall time per phase (init / plan / apply) and configuration
+
+Variables are passed as TF_VAR_* environment variables rather than -var,
+so secrets such as the DDI API key do not show up in the process list.
+Saved plans contain variable values; they stay in each configuration's
+.terraform/ directory.
+
+Usage:
+  python3 tf_runner.py apply infoblox-onprem
+  python3 tf_runner.py plan ipam --parallelism 30
+  python3 tf_runner.py apply --all --var ddi_api_key=$TF_VAR_ddi_api_key
+  python3 tf_runner.py destroy challenge-04
+  python3 tf_runner.py init --all --force-init
+
+Environment Variables:
+  TF_PLUGIN_CACHE_DIR  - Provider cache (default: ~/.terraform.d/plugin-cache)
+  TERRAFORM_BIN        - Terraform executable (default: terraform)
+  TF_VAR_*             - Terraform variables (also part of the plan key)
+
+Output Files:
+  terraform/<config>/.terraform/tf_runner.init  - Fingerprint of the last init
+  terraform/<config>/.terraform/tf_runner.tfplan - Saved plan (+ .key)
+"""
+
+import agent_client
+agent_client.forward()
+
+import os
+import re
+import sys
+import json
+import glob
+import time
+import hashlib
+import argparse
+import subprocess
+
+import profiling
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+TERRAFORM_ROOT = os.path.normpath(os.path.join(SCRIPT_DIR, "..", "terraform"))
+
+# In dependency order: the IAM role and AWS IPAM come before what uses them
+CONFIGS = {
+    "iam-role": os.path.join(TERRAFORM_ROOT, "iam-role"),
+    "ipam": TERRAFORM_ROOT,
+    "ipam-vpcs": os.path.join(TERRAFORM_ROOT, "ipam-vpcs"),     # generated by generate_vpc_tf.py
+    "infoblox-onprem": os.path.join(TERRAFORM_ROOT, "infoblox-onprem"),
+    "challenge-04": os.path.join(TERRAFORM_ROOT, "challenge-04"),
+}
+
+DEFAULT_PARALLELISM = 20
+DEFAULT_PLUGIN_CACHE = os.path.expanduser("~/.terraform.d/plugin-cache")
+INIT_STAMP = "tf_runner.init"
+PLAN_FILE = "tf_runner.tfplan"
+PLAN_MAX_AGE = 3600     # cloud-side drift is not in the key; re-plan after this
+
+# Lines of HCL that decide what `terraform init` installs
+_INIT_LINE_RE = re.compile(r'^\s*((source|version|required_version)\s*=\s*"[^"]*"|backend\s+"[^"]*")', re.M)
+_LOCAL_SOURCE_RE = re.compile(r'^\s*source\s*=\s*"(\.\.?/[^"]*)"', re.M)
+
+
+def _config_files(directory):
+    return sorted(glob.glob(os.path.join(directory, "*.tf")) + glob.glob(os.path.join(directory, "*.tf.json")))
+
+
+def _local_module_sources(path):
+    """Relative module sources ("./modules/x") declared in one config file."""
+    with open(path, "r") as f:
+        text = f.read()
+    if not path.endswith(".json"):
+        return _LOCAL_SOURCE_RE.findall(text)
+    modules = json.loads(text).get("module", {})
+    if isinstance(modules, dict):
+        modules = [modules]
+    return [m.get("source", "") for block in modules for m in block.values()
+            if m.get("source", "").startswith(("./", "../"))]
+
+
+def config_dirs(directory):
+    """The configuration directory and every local module it uses, recursively."""
+    seen = []
+    pending = [os.path.normpath(directory)]
+    while pending:
+        d = pending.pop()
+        if d in seen or not os.path.isdir(d):
+            continue
+        seen.append(d)
+        for path in _config_files(d):
+            pending.extend(os.path.normpath(os.path.join(d, s)) for s in _local_module_sources(path))
+    return seen
+
+
+def _hash_file(h, path):
+    if os.path.exists(path):
+        with open(path, "rb") as f:
+            h.update(f.read())
+    h.update(b"\0")
+
+
+def _init_lines(path):
+    with open(path, "r") as f:
+        text = f.read()
+    if not path.endswith(".json"):
+        return [m.group(1) for m in _INIT_LINE_RE.finditer(text)]
+    data = json.loads(text)
+    modules = data.get("module", {})
+    if isinstance(modules, dict):
+        modules = [modules]
+    calls = {name: {k: m.get(k) for k in ("source", "version")} for block in modules for name, m in block.items()}
+    return [json.dumps(data.get("terraform"), sort_keys=True), json.dumps(calls, sort_keys=True)]
+
+
+class TerraformRunner:
+    def __init__(self, working_dir, parallelism=DEFAULT_PARALLELISM, variables=None, var_files=(),
+                 plugin_cache_dir=None, force_init=False, plan_cache=True, name=None):
+        self.working_dir = os.path.normpath(working_dir)
+        self.name = name or os.path.basename(self.working_dir)
+        self.parallelism = parallelism
+        self.var_files = [os.path.abspath(f) for f in var_files]
+        self.force_init = force_init
+        self.plan_cache = plan_cache
+        self.terraform = os.environ.get("TERRAFORM_BIN", "terraform")
+        self.plugin_cache_dir = plugin_cache_dir or os.environ.get("TF_PLUGIN_CACHE_DIR", DEFAULT_PLUGIN_CACHE)
+        os.makedirs(self.plugin_cache_dir, exist_ok=True)
+
+        self.env = dict(os.environ)
+        self.env.update({
+            "TF_PLUGIN_CACHE_DIR": self.plugin_cache_dir,
+            "TF_IN_AUTOMATION": "1",
+            "TF_INPUT": "0",
+        })
+        for key, value in (variables or {}).items():
+            self.env[f"TF_VAR_{key}"] = str(value)
+        self.timings = []    # (phase, seconds, note)
+        self._initialized = False
+
+    @property
+    def state_dir(self):
+        return os.path.join(self.working_dir, ".terraform")
+
+    def _run(self, phase, args, ok_codes=(0,)):
+        cmd = [self.terraform] + args
+        start = time.perf_counter()
+        # Copied through sys.stdout rather than inherited, so the output
+        # reaches the user when the script runs in agent.py too
+        proc = subprocess.Popen(cmd, cwd=self.working_dir, env=self.env, stdout=subprocess.PIPE,
+                                stderr=subprocess.STDOUT, text=True, errors="replace")
+        with proc.stdout:
+            for line in proc.stdout:
+                sys.stdout.write(line)
+                sys.stdout.flush()
+        proc.wait()
+        elapsed = time.perf_counter() - start
+        self.timings.append((phase, elapsed, ""))
+        print(f"   ⏱️ {self.name}: {phase} {elapsed:.1f}s", flush=True)
+        if proc.returncode not in ok_codes:
+            raise subprocess.CalledProcessError(proc.returncode, cmd)
+        return proc.returncode
+
+    def _skip(self, phase, note):
+        self.timings.append((phase, 0.0, note))
+        print(f"   ⏭️ {self.name}: {phase} skipped ({note})", flush=True)
+
+    def init_fingerprint(self):
+        """Hash of everything that decides what init installs."""
+        h = hashlib.sha256()
+        _hash_file(h, os.path.join(self.working_dir, ".terraform.lock.hcl"))
+        for d in config_dirs(self.working_dir):
+            for path in _config_files(d):
+                h.update(os.path.relpath(path, self.working_dir).encode())
+                h.update("\n".join(_init_lines(path)).encode())
+                h.update(b"\0")
+        return h.hexdigest()
+
+    def plan_fingerprint(self, destroy=False):
+        """Hash of the configuration, variables and local state a plan was made from."""
+        h = hashlib.sha256()
+        h.update(b"destroy" if destroy else b"apply")
+        for d in config_dirs(self.working_dir):
+            for path in _config_files(d):
+                h.update(os.path.relpath(path, self.working_dir).encode())
+                _hash_file(h, path)
+        for path in sorted(glob.glob(os.path.join(self.working_dir, "*.auto.tfvars*"))) + \
+                sorted(glob.glob(os.path.join(self.working_dir, "terraform.tfvars*"))) + self.var_files:
+            h.update(path.encode())
+            _hash_file(h, path)
+        for key in sorted(k for k in self.env if k.startswith("TF_VAR_")):
+            h.update(f"{key}={self.env[key]}\0".encode())
+        _hash_file(h, os.path.join(self.working_dir, "terraform.tfstate"))
+        _hash_file(h, os.path.join(self.working_dir, ".terraform.lock.hcl"))
+        return h.hexdigest()
+
+    def init(self):
+        stamp = os.path.join(self.state_dir, INIT_STAMP)
+        if self._initialized:
+            return
+        if not self.force_init and os.path.exists(stamp):
+            with open(stamp, "r") as f:
+                if f.read().strip() == self.init_fingerprint():
+                    self._skip("init", "lock file and modules unchanged")
+                    self._initialized = True
+                    return
+        self._run("init", ["init", "-input=false"])
+        with open(stamp, "w") as f:
+            f.write(self.init_fingerprint())
+        self._initialized = True
+
+    def plan(self, destroy=False):
+        """Saved plan for the current configuration. Returns (plan_path, has_changes)."""
+        self.init()
+        plan_path = os.path.join(self.state_dir, PLAN_FILE)
+        key_path = plan_path + ".key"
+        key = self.plan_fingerprint(destroy)
+        if self.plan_cache and os.path.exists(plan_path) and os.path.exists(key_path):
+            with open(key_path, "r") as f:
+                saved = json.load(f)
+            # Only plans with changes: "no changes" may be stale without the key noticing
+            if saved.get("changes") and saved.get("key") == key \
+                    and time.time() - saved.get("created_at", 0) < PLAN_MAX_AGE:
+                self._skip("plan", "saved plan is current")
+                return plan_path, saved["changes"]
+
+        args = ["plan", "-input=false", "-detailed-exitcode", f"-parallelism={self.parallelism}", f"-out={plan_path}"]
+        args += [f"-var-file={f}" for f in self.var_files]
+        if destroy:
+            args.append("-destroy")
+        code = self._run("plan" if not destroy else "plan (destroy)", args, ok_codes=(0, 2))
+        changes = code == 2
+        with open(key_path, "w") as f:
+            json.dump({"key": key, "changes": changes, "created_at": time.time()}, f)
+        return plan_path, changes
+
+    def _apply_plan(self, phase, plan_path, changes):
+        if not changes:
+            self._skip(phase, "no changes")
+            return False
+        try:
+            self._run(phase, ["apply", "-input=false", f"-parallelism={self.parallelism}", plan_path])
+        finally:
+            # An applied (or half-applied) plan is stale either way
+            for path in (plan_path, plan_path + ".key"):
+                if os.path.exists(path):
+                    os.remove(path)
+        return True
+
+    def apply(self):
+        plan_path, changes = self.plan()
+        return self._apply_plan("apply", plan_path, changes)
+
+    def destroy(self):
+        plan_path, changes = self.plan(destroy=True)
+        return self._apply_plan("destroy", plan_path, changes)
+
+    def total(self):
+        return sum(t for _, t, _ in self.timings)
+
+
+def print_timings(runners):
+    print(f"\n{'='*60}")
+    print("⏱️ Terraform wall time per phase")
+    for runner in runners:
+        print(f"   {runner.name}: {runner.total():.1f}s")
+        for phase, elapsed, note in runner.timings:
+            print(f"      {phase:<16} {elapsed:>8.1f}s" + (f"  ({note})" if note else ""))
+    print(f"   Total: {sum(r.total() for r in runners):.1f}s")
+    print(f"{'='*60}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run Terraform for the lab configurations")
+    parser.add_argument("command", choices=["init", "plan", "apply", "destroy"])
+    parser.add_argument("configs", nargs="*", help=f"Configurations: {', '.join(CONFIGS)} or a directory")
+    parser.add_argument("--all", action="store_true", help="All configurations (dependency order; reversed for destroy)")
+    parser.add_argument("--parallelism", type=int, default=DEFAULT_PARALLELISM,
+                        help=f"Concurrent operations in plan/apply (default: {DEFAULT_PARALLELISM})")
+    parser.add_argument("--var", action="append", default=[], metavar="KEY=VALUE", help="Terraform variable")
+    parser.add_argument("--var-file", action="append", default=[], help="Terraform variables file")
+    parser.add_argument("--plugin-cache-dir", help=f"Provider cache (default: {DEFAULT_PLUGIN_CACHE})")
+    parser.add_argument("--force-init", action="store_true", help="Run init even if nothing changed")
+    parser.add_argument("--no-plan-cache", action="store_true", help="Always plan, never reuse a saved plan")
+    parser.add_argument("--timings-file", help="Also write the per-phase timings as JSON")
+    args = parser.parse_args()
+
+    # Generated configurations (ipam-vpcs) only exist once generated
+    names = [n for n, d in CONFIGS.items() if os.path.isdir(d)] if args.all else args.configs
+    if not names:
+        parser.error("name at least one configuration or pass --all")
+    if args.command == "destroy" and args.all:
+        names.reverse()
+    variables = dict(v.split("=", 1) for v in args.var)
+
+    runners = []
+    try:
+        for name in names:
+            directory = CONFIGS.get(name, name)
+            if not os.path.isdir(directory):
+                print(f"❌ Unknown configuration: {name}")
+                sys.exit(1)
+            runner = TerraformRunner(directory, parallelism=args.parallelism, variables=variables,
+                                     var_files=args.var_file, plugin_cache_dir=args.plugin_cache_dir,
+                                     force_init=args.force_init, plan_cache=not args.no_plan_cache, name=name)
+            runners.append(runner)
+            print(f"🔧 {args.command} {runner.name}...")
+            if args.command == "init":
+                runner.init()
+            elif args.command == "plan":
+                _, changes = runner.plan()
+                print(f"   {'📝 Changes pending' if changes else '✅ No changes'}")
+            elif args.command == "apply":
+                runner.apply()
+            else:
+                runner.destroy()
+    except subprocess.CalledProcessError as e:
+        print(f"❌ {' '.join(e.cmd[:2])} failed with exit code {e.returncode}")
+        print_timings(runners)
+        sys.exit(1)
+
+    print_timings(runners)
+    if args.timings_file:
+        with open(args.timings_file, "w") as f:
+            json.dump({r.name: [{"phase": p, "seconds": round(t, 3), "note": n} for p, t, n in r.timings]
+                       for r in runners}, f, indent=2)
+
+
+if __name__ == "__main__":
+    profiling.install()
+    main()
@@ -12,9 +12,14 @@ Usage in Instruqt (setup-sandbox script, AFTER allocation):
   # Delete user (cleanup-sandbox script):
   python3 user_provision.py --delete
 
+  # Bulk onboarding of a whole cohort from a CSV manifest:
+  python3 user_provision.py --manifest participants.csv --max-workers 16
+
 Environment Variables:
   INFOBLOX_EMAIL    - Required. Admin email for CSP JWT auth.
   INFOBLOX_PASSWORD - Required. Admin password for CSP JWT auth.
+  INFOBLOX_API_KEY  - Optional. Sandbox API key; skips sign-in and account
+                      switch (also read from api_key.json, see deploy_api_key.py).
   CSP_URL           - CSP base URL (default: csp.infoblox.com)
   USER_DOMAIN       - Domain for user email (default: infoblox.lab)
 
@@ -28,14 +33,36 @@ Output Files:
   user_password.txt     - Generated password
   user_id.txt           - CSP user ID (for cleanup/deletion)
   user_credentials.sh   - Source-able credentials for bash
+
+Bulk mode (--manifest):
+  Manifest CSV with a header row. Columns:
+    participant_id  - Required. Used for the user name and email.
+    email           - Optional. Defaults to <participant_id>@<USER_DOMAIN>.
+    sandbox_id      - Optional. Defaults to sandbox_id.txt.
+  Signs in once, switches into each sandbox once, resolves groups once per
+  sandbox, then creates users concurrently and sets each password as soon
+  as its user comes back. All credentials are written in one pass to
+  bulk_credentials.csv.
 """
 
+import agent_client
+agent_client.forward()
+
 import os
 import sys
+import csv
 import time
 import random
 import string
 import requests
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+import csp_auth
+from http_session import ApiSession
+import profiling
+
+# Rate-governed, with per-endpoint timeouts, hedged GETs and circuit breaking
+session = ApiSession()
 
 
 def generate_password(length=16):
@@ -65,7 +92,7 @@ def read_file(filename):
 
 def authenticate(base_url, email, password):
     """Authenticate with CSP and return JWT headers."""
-    resp = requests.post(
+    resp = session.post(
         f"{base_url}/v2/session/users/sign_in",
         json={"email": email, "password": password}
     )
@@ -76,7 +103,7 @@ def authenticate(base_url, email, password):
 
 def switch_account(base_url, headers, account_id):
     """Switch to sandbox account and return new JWT headers."""
-    resp = requests.post(
+    resp = session.post(
         f"{base_url}/v2/session/account_switch",
         headers=headers,
         json={"id": f"identity/accounts/{account_id}"}
@@ -88,7 +115,7 @@ def switch_account(base_url, headers, account_id):
 
 def get_groups(base_url, headers):
     """Fetch user and admin group IDs."""
-    resp = requests.get(f"{base_url}/v2/groups", headers=headers)
+    resp = session.get(f"{base_url}/v2/groups", headers=headers)
     resp.raise_for_status()
     groups = resp.json().get("results", [])
     user_gid = next((g["id"] for g in groups if g.get("name") == "user"), None)
@@ -98,7 +125,7 @@ def get_groups(base_url, headers):
 
 def get_user_id_by_email(base_url, headers, email):
     """Look up existing user by email, return user_id or None."""
-    resp = requests.get(
+    resp = session.get(
         f"{base_url}/v2/users?_filter=email==\"{email}\"",
         headers=headers
     )
@@ -121,7 +148,7 @@ def create_user(base_url, headers, name, email, user_gid, admin_gid):
 
     for attempt in range(5):
         try:
-            resp = requests.post(f"{base_url}/v2/users", headers=headers, json=payload)
+            resp = session.post(f"{base_url}/v2/users", headers=headers, json=payload)
             if resp.status_code == 409:
                 print("  ⚠️ User already exists, looking up ID...", flush=True)
                 return get_user_id_by_email(base_url, headers, email)
@@ -137,7 +164,7 @@ def create_user(base_url, headers, name, email, user_gid, admin_gid):
 
 def set_password(base_url, headers, user_id, password):
     """Set user password. Returns True on success."""
-    resp = requests.post(
+    resp = session.post(
         f"{base_url}/v2/users/{user_id}/password",
         headers=headers,
         json={"new_password": password}
@@ -147,18 +174,122 @@ def set_password(base_url, headers, user_id, password):
 
 def delete_user(base_url, headers, user_id):
     """Delete user by ID. Returns True on success."""
-    resp = requests.delete(f"{base_url}/v2/users/{user_id}", headers=headers)
+    resp = session.delete(f"{base_url}/v2/users/{user_id}", headers=headers)
     return resp.status_code in (200, 204)
 
 
+def read_manifest(filename, user_domain, default_sandbox_id=None):
+    """Read the participant manifest CSV into a list of user dicts."""
+    users = []
+    with open(filename, "r", newline="") as f:
+        for row in csv.DictReader(f):
+            participant_id = (row.get("participant_id") or "").strip()
+            if not participant_id:
+                continue
+            sandbox_id = (row.get("sandbox_id") or "").strip() or default_sandbox_id
+            if not sandbox_id:
+                print(f"❌ No sandbox_id for {participant_id} and no sandbox_id.txt", flush=True)
+                sys.exit(1)
+            users.append({
+                "participant_id": participant_id,
+                "email": (row.get("email") or "").strip() or f"{participant_id}@{user_domain}",
+                "sandbox_id": sandbox_id,
+            })
+    return users
+
+
+def bulk_provision(base_url, admin_email, admin_password, users, max_workers=8,
+                   output_file="bulk_credentials.csv"):
+    """Create many users with one sign-in and one group lookup per sandbox.
+
+    Each set_password call is submitted as soon as its create_user call
+    returns, so password setting overlaps with the remaining creations.
+    Returns the list of provisioned users (failed ones have no user_id).
+    """
+    print("🔐 Authenticating with CSP...", flush=True)
+    admin_headers = authenticate(base_url, admin_email, admin_password)
+    print("✅ Authenticated", flush=True)
+
+    def prepare_sandbox(sandbox_id):
+        headers = switch_account(base_url, admin_headers, sandbox_id)
+        time.sleep(2)
+        return headers, get_groups(base_url, headers)
+
+    sandboxes = {}
+    sandbox_ids = sorted({u["sandbox_id"] for u in users})
+    print(f"🔁 Preparing {len(sandbox_ids)} sandbox(es)...", flush=True)
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        for sandbox_id, (headers, (user_gid, admin_gid)) in zip(sandbox_ids, pool.map(prepare_sandbox, sandbox_ids)):
+            if not user_gid or not admin_gid:
+                print(f"❌ Could not find required groups in sandbox {sandbox_id}", flush=True)
+                sys.exit(1)
+            sandboxes[sandbox_id] = (headers, user_gid, admin_gid)
+    print("✅ Sandboxes and groups resolved", flush=True)
+
+    # Errors are recorded on the user, so one failure does not stop the others
+    def create(user):
+        headers, user_gid, admin_gid = sandboxes[user["sandbox_id"]]
+        try:
+            user["user_id"] = create_user(base_url, headers, user["participant_id"], user["email"],
+                                          user_gid, admin_gid)
+        except Exception as e:
+            user["user_id"] = None
+            user["error"] = str(e)
+        return user
+
+    def set_pw(user):
+        headers = sandboxes[user["sandbox_id"]][0]
+        try:
+            user["password_set"] = set_password(base_url, headers, user["user_id"], user["password"])
+        except Exception as e:
+            user["password_set"] = False
+            user["error"] = str(e)
+        return user
+
+    for user in users:
+        user["password"] = generate_password()
+
+    print(f"👤 Creating {len(users)} users ({max_workers} concurrent)...", flush=True)
+    try:
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            pending = {pool.submit(create, u) for u in users}
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    user = future.result()
+                    error = f": {user['error']}" if user.get("error") else ""
+                    if "password_set" in user:
+                        status = "✅" if user["password_set"] else "❌ password set failed"
+                        print(f"  {status} {user['email']} (ID: {user['user_id']}){error}", flush=True)
+                    elif user["user_id"]:
+                        pending.add(pool.submit(set_pw, user))
+                    else:
+                        print(f"  ❌ {user['email']}: user creation failed{error}", flush=True)
+    finally:
+        # Written even if the run is interrupted: users already created are in it
+        with open(output_file, "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(["participant_id", "email", "password", "user_id", "sandbox_id", "status"])
+            for u in users:
+                ok = bool(u.get("user_id")) and u.get("password_set", False)
+                writer.writerow([u["participant_id"], u["email"], u["password"] if ok else "",
+                                 u.get("user_id") or "", u["sandbox_id"], "ok" if ok else "failed"])
+        print(f"📄 Credentials saved to {output_file}", flush=True)
+    return users
+
+
 # ==============================================================
 # Main
 # ==============================================================
 if __name__ == "__main__":
+    profiling.install()
     import argparse
 
     parser = argparse.ArgumentParser(description="Provision or delete a user on the allocated sandbox")
     parser.add_argument("--delete", action="store_true", help="Delete the user instead of creating")
+    parser.add_argument("--manifest", help="CSV of participants to provision in bulk")
+    parser.add_argument("--max-workers", type=int, default=8, help="Concurrent API calls in bulk mode (default: 8)")
+    parser.add_argument("--output", default="bulk_credentials.csv", help="Bulk mode credentials file")
     args = parser.parse_args()
 
     # --- Config ---
@@ -167,10 +298,33 @@ if __name__ == "__main__":
     INFOBLOX_PASSWORD = os.environ.get("INFOBLOX_PASSWORD")
     USER_DOMAIN = os.environ.get("USER_DOMAIN", "infoblox.lab")
 
-    if not INFOBLOX_EMAIL or not INFOBLOX_PASSWORD:
+    # Sandbox-scoped API key (single-sandbox mode only)
+    api_key = None if args.manifest else csp_auth.load_api_key()
+
+    if not api_key and (not INFOBLOX_EMAIL or not INFOBLOX_PASSWORD):
         print("❌ Set INFOBLOX_EMAIL and INFOBLOX_PASSWORD", flush=True)
         sys.exit(1)
 
+    # --- BULK mode ---
+    if args.manifest:
+        default_sandbox_id = None
+        if os.path.exists("sandbox_id.txt"):
+            default_sandbox_id = read_file("sandbox_id.txt")
+        users = read_manifest(args.manifest, USER_DOMAIN, default_sandbox_id)
+        start = time.monotonic()
+        users = bulk_provision(CSP_URL, INFOBLOX_EMAIL, INFOBLOX_PASSWORD, users,
+                               max_workers=args.max_workers, output_file=args.output)
+        failed = [u for u in users if not (u.get("user_id") and u.get("password_set"))]
+
+        print(f"\n{'='*60}", flush=True)
+        print("🎉 Bulk Provisioning Complete!" if not failed else "⚠️ Bulk provisioning finished with errors", flush=True)
+        print(f"   Users:       {len(users)}", flush=True)
+        print(f"   Failed:      {len(failed)}", flush=True)
+        print(f"   Time:        {time.monotonic() - start:.1f}s", flush=True)
+        print(f"   Credentials: {args.output}", flush=True)
+        print(f"{'='*60}", flush=True)
+        sys.exit(1 if failed else 0)
+
     # --- Read allocation files + env vars ---
     sandbox_id = read_file("sandbox_id.txt")
     sandbox_name = read_file("sandbox_name.txt")
@@ -190,16 +344,21 @@ if __name__ == "__main__":
     print(f"📋 User:     {user_email}", flush=True)
     print()
 
-    # --- Step 1: Authenticate ---
-    print("🔐 Authenticating with CSP...", flush=True)
-    headers = authenticate(CSP_URL, INFOBLOX_EMAIL, INFOBLOX_PASSWORD)
-    print("✅ Authenticated", flush=True)
-
-    # --- Step 2: Switch to sandbox account ---
-    print(f"🔁 Switching to sandbox {sandbox_id}...", flush=True)
-    headers = switch_account(CSP_URL, headers, sandbox_id)
-    print("✅ Switched", flush=True)
-    time.sleep(2)
+    if api_key:
+        # --- Steps 1+2: API key is already scoped to the sandbox ---
+        print("🔐 Using API key, skipping sign-in and account switch", flush=True)
+        headers = csp_auth.token_headers(api_key)
+    else:
+        # --- Step 1: Authenticate ---
+        print("🔐 Authenticating with CSP...", flush=True)
+        headers = authenticate(CSP_URL, INFOBLOX_EMAIL, INFOBLOX_PASSWORD)
+        print("✅ Authenticated", flush=True)
+
+        # --- Step 2: Switch to sandbox account ---
+        print(f"🔁 Switching to sandbox {sandbox_id}...", flush=True)
+        headers = switch_account(CSP_URL, headers, sandbox_id)
+        print("✅ Switched", flush=True)
+        time.sleep(2)
 
     # --- DELETE mode ---
     if args.delete:
@@ -0,0 +1,521 @@
+#!/usr/bin/env python3
+"""
+Export address utilization of federated blocks, pools and realms to Prometheus.
+
+deploy_ipam.py and create_federated_pool.py send `utilization: 0` and
+nothing computes it client-side. This exporter keeps an interval index of
+every federated block and reserved block: each object is attached to the
+smallest block containing it, and for each block the union of its direct
+children gives used / free addresses, the largest free run and
+fragmentation (1 - largest free run / free). Pools and realms sum their
+top-level blocks.
+
+After one full listing, each poll only asks for objects updated since the
+previous one and re-applies those: an object that moved or appeared
+re-links its parent (and any children it now contains), and only the
+blocks whose children changed are recomputed. Deletions do not show up
+in an updated_at filter, so every --full-every polls the whole listing is
+diffed against the index (again recomputing only what changed).
+
+Metrics are served as Prometheus text on --port /metrics, rendered once
+per poll, so a scrape costs nothing on large tenants:
+
+  ipam_{block,pool,realm}_{size,used,free}_addresses
+  ipam_{block,pool,realm}_fragmentation
+  ipam_block_largest_free_addresses
+  ipam_exporter_objects{kind}, ipam_exporter_poll_duration_seconds{mode},
+  ipam_exporter_changed_objects_total, ipam_exporter_last_poll_timestamp_seconds
+
+The exporter never returns, so unlike the lab steps it does not forward to
+agent.py (which runs one script at a time); it always runs as its own
+process.
+
+Usage:
+  python3 utilization_exporter.py                          # every 60s on :9187
+  python3 utilization_exporter.py --realm "ACME Corporation" --interval 30
+  python3 utilization_exporter.py --no-block-metrics       # pools/realms only
+  python3 utilization_exporter.py --once > ipam.prom       # one poll, metrics on stdout
+  python3 utilization_exporter.py --textfile /var/lib/node_exporter/ipam.prom
+"""
+
+import os
+import sys
+import time
+import contextlib
+import argparse
+import threading
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+from federation_records import BlockRecord
+from federation_snapshot import SnapshotTaker
+import profiling
+
+# Overlap between delta windows, for clock skew and in-flight writes
+DELTA_OVERLAP = timedelta(seconds=30)
+KINDS = ("federated_block", "reserved_block")
+
+
+def _bits(version):
+    return 32 if version == 4 else 128
+
+
+def _span(rec):
+    size = 1 << (_bits(rec.version) - rec.prefixlen)
+    return rec.address, rec.address + size - 1
+
+
+class BlockStats:
+    __slots__ = ("size", "used", "free", "largest_free")
+
+    def __init__(self, size, used, largest_free):
+        self.size = size
+        self.used = used
+        self.free = size - used
+        self.largest_free = largest_free
+
+    @property
+    def fragmentation(self):
+        return 1 - self.largest_free / self.free if self.free else 0.0
+
+
+def compute_stats(rec, children):
+    """BlockStats for a block from the (start, end) spans of its direct children."""
+    start, end = _span(rec)
+    used = 0
+    largest = 0
+    cursor = start
+    for c_start, c_end in sorted(children):
+        if c_start > cursor:
+            largest = max(largest, c_start - cursor)
+        if c_end >= cursor:
+            used += c_end - max(c_start, cursor) + 1
+            cursor = c_end + 1
+    largest = max(largest, end - cursor + 1)
+    return BlockStats(end - start + 1, used, largest)
+
+
+class UtilizationIndex:
+    """Blocks and reserved blocks linked to their smallest containing block."""
+
+    def __init__(self):
+        self.objects = {}       # id -> BlockRecord
+        self.kinds = {}         # id -> federated_block | reserved_block
+        self.parent = {}        # id -> parent block id or None
+        self.children = {}      # block id -> {child id: (start, end)}
+        self.roots = set()      # ids without a containing block
+        self.prefixes = {}      # (realm, version, prefixlen) -> {network bits: block id}
+        self.stats = {}         # block id -> BlockStats
+        self.pool_blocks = {}   # pool id -> {block id}
+        self.realm_blocks = {}  # realm id -> {block id}
+        self.pool_stats = {}
+        self.realm_stats = {}
+        self.dirty = set()
+        self.dirty_pools = set()
+        self.dirty_realms = set()
+
+    def _find_parent(self, rec, strict):
+        """Smallest block of the same realm containing rec (strictly larger
+        unless strict is False). Realms may reuse the same address space."""
+        bits = _bits(rec.version)
+        limit = rec.prefixlen - 1 if strict else rec.prefixlen
+        for prefixlen in range(limit, -1, -1):
+            table = self.prefixes.get((rec.realm, rec.version, prefixlen))
+            if table:
+                block_id = table.get(rec.address >> (bits - prefixlen))
+                if block_id is not None and block_id != rec.id:
+                    return block_id
+        return None
+
+    def _link(self, obj_id, parent_id):
+        self.parent[obj_id] = parent_id
+        if parent_id is None:
+            self.roots.add(obj_id)
+        else:
+            self.children[parent_id][obj_id] = _span(self.objects[obj_id])
+            self.dirty.add(parent_id)
+
+    def _unlink(self, obj_id):
+        self.roots.discard(obj_id)
+        parent_id = self.parent.pop(obj_id, None)
+        if parent_id is not None:
+            self.children[parent_id].pop(obj_id, None)
+            self.dirty.add(parent_id)
+
+    def _touch_groups(self, rec):
+        if rec.pool:
+            self.dirty_pools.add(rec.pool)
+        if rec.realm:
+            self.dirty_realms.add(rec.realm)
+
+    def add(self, kind, rec, adopt=True):
+        """Index one object. With adopt=False the caller guarantees that no
+        indexed object lies inside rec (objects added largest first)."""
+        self.objects[rec.id] = rec
+        self.kinds[rec.id] = kind
+        if kind == "reserved_block":
+            self._link(rec.id, self._find_parent(rec, strict=False))
+            return
+        parent_id = self._find_parent(rec, strict=True)
+        bits = _bits(rec.version)
+        self.prefixes.setdefault((rec.realm, rec.version, rec.prefixlen), {}).setdefault(
+            rec.address >> (bits - rec.prefixlen), rec.id)
+        self.children[rec.id] = {}
+        self._link(rec.id, parent_id)
+        self.dirty.add(rec.id)
+        if rec.pool:
+            self.pool_blocks.setdefault(rec.pool, set()).add(rec.id)
+        if rec.realm:
+            self.realm_blocks.setdefault(rec.realm, set()).add(rec.id)
+        self._touch_groups(rec)
+        if not adopt:
+            return
+        # Siblings that fall inside the new block become its children
+        start, end = _span(rec)
+        if parent_id is not None:
+            siblings = list(self.children[parent_id].items())
+        else:
+            siblings = [(i, _span(self.objects[i])) for i in self.roots
+                        if self.objects[i].version == rec.version and self.objects[i].realm == rec.realm]
+        for child_id, (c_start, c_end) in siblings:
+            child = self.objects[child_id]
+            if child_id != rec.id and start <= c_start and c_end <= end and (
+                    child.prefixlen > rec.prefixlen or self.kinds[child_id] == "reserved_block"):
+                self._unlink(child_id)
+                self._link(child_id, rec.id)
+
+    def remove(self, obj_id):
+        rec = self.objects.get(obj_id)
+        if rec is None:
+            return
+        parent_id = self.parent.get(obj_id)
+        self._unlink(obj_id)
+        if self.kinds[obj_id] == "federated_block":
+            bits = _bits(rec.version)
+            table = self.prefixes.get((rec.realm, rec.version, rec.prefixlen), {})
+            if table.get(rec.address >> (bits - rec.prefixlen)) == obj_id:
+                del table[rec.address >> (bits - rec.prefixlen)]
+            # Children go up to the removed block's parent
+            for child_id in list(self.children.pop(obj_id, {})):
+                self.parent.pop(child_id, None)
+                self._link(child_id, parent_id)
+            self.stats.pop(obj_id, None)
+            self.dirty.discard(obj_id)
+            self.pool_blocks.get(rec.pool, set()).discard(obj_id)
+            self.realm_blocks.get(rec.realm, set()).discard(obj_id)
+            self._touch_groups(rec)
+        del self.objects[obj_id]
+        del self.kinds[obj_id]
+
+    def upsert(self, kind, rec, adopt=True):
+        """Apply one created or updated object. Returns True if anything changed."""
+        old = self.objects.get(rec.id)
+        if old is not None:
+            if (old.version, old.address, old.prefixlen, old.pool, old.realm, old.name) == \
+                    (rec.version, rec.address, rec.prefixlen, rec.pool, rec.realm, rec.name):
+                return False
+            if (old.version, old.address, old.prefixlen, old.realm) == (rec.version, rec.address, rec.prefixlen, rec.realm) \
+                    and kind == self.kinds[rec.id]:
+                # Same span and realm: only the labels or the pool link changed
+                self.objects[rec.id] = rec
+                if kind == "federated_block":
+                    self.pool_blocks.get(old.pool, set()).discard(rec.id)
+                    if rec.pool:
+                        self.pool_blocks.setdefault(rec.pool, set()).add(rec.id)
+                    self._touch_groups(old)
+                    self._touch_groups(rec)
+                return True
+            self.remove(rec.id)
+        self.add(kind, rec, adopt)
+        return True
+
+    def refresh(self):
+        """Recompute stats for changed blocks and the pools/realms they belong to."""
+        for block_id in self.dirty:
+            rec = self.objects.get(block_id)
+            if rec is None or self.kinds[block_id] != "federated_block":
+                continue
+            self.stats[block_id] = compute_stats(rec, self.children[block_id].values())
+            self._touch_groups(rec)
+        recomputed = len(self.dirty)
+        self.dirty = set()
+
+        for pool_id in self.dirty_pools:
+            members = self.pool_blocks.get(pool_id, set())
+            # Nested blocks of the same pool are already inside their parent
+            tops = [b for b in members if self.parent.get(b) not in members]
+            self.pool_stats[pool_id] = self._sum(tops)
+        for realm_id in self.dirty_realms:
+            tops = [b for b in self.realm_blocks.get(realm_id, set()) if self.parent.get(b) is None]
+            self.realm_stats[realm_id] = self._sum(tops)
+        self.dirty_pools = set()
+        self.dirty_realms = set()
+        return recomputed
+
+    def _sum(self, block_ids):
+        size = used = largest = 0
+        for block_id in block_ids:
+            s = self.stats.get(block_id)
+            if s:
+                size += s.size
+                used += s.used
+                largest = max(largest, s.largest_free)
+        return BlockStats(size, used, largest)
+
+
+# --- Prometheus text ---
+
+def _label(value):
+    return str(value if value is not None else "").replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(**labels):
+    return "{" + ",".join(f'{k}="{_label(v)}"' for k, v in labels.items()) + "}"
+
+
+def render(index, names, counters, block_metrics=True):
+    lines = []
+
+    def family(name, help_text, kind="gauge"):
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+
+    def stats_families(prefix, what, series):
+        for metric, attr, help_text in (
+                ("size_addresses", "size", "Addresses in the"),
+                ("used_addresses", "used", "Addresses covered by child blocks and reserved blocks of the"),
+                ("free_addresses", "free", "Unallocated addresses in the"),
+                ("fragmentation", "fragmentation", "1 - largest free run / free addresses of the")):
+            family(f"ipam_{prefix}_{metric}", f"{help_text} {what}")
+            for labels, stats in series:
+                lines.append(f"ipam_{prefix}_{metric}{labels} {getattr(stats, attr)}")
+
+    if block_metrics:
+        series = []
+        for block_id, stats in index.stats.items():
+            rec = index.objects[block_id]
+            series.append((_labels(block=rec.name or str(rec.network), cidr=rec.network, id=rec.uuid,
+                                   realm=names.get(rec.realm, rec.realm), pool=names.get(rec.pool, rec.pool or "")),
+                           stats))
+        stats_families("block", "federated block", series)
+        family("ipam_block_largest_free_addresses", "Largest contiguous free run in the federated block")
+        for labels, stats in series:
+            lines.append(f"ipam_block_largest_free_addresses{labels} {stats.largest_free}")
+
+    stats_families("pool", "federated pool (top-level blocks linked to it)",
+                   [(_labels(pool=names.get(p, p), id=p.split("/")[-1]), s) for p, s in index.pool_stats.items()])
+    stats_families("realm", "federated realm (top-level blocks)",
+                   [(_labels(realm=names.get(r, r), id=r.split("/")[-1]), s) for r, s in index.realm_stats.items()])
+
+    family("ipam_exporter_objects", "Objects in the interval index")
+    for kind in KINDS:
+        lines.append(f"ipam_exporter_objects{_labels(kind=kind)} {sum(1 for k in index.kinds.values() if k == kind)}")
+    family("ipam_exporter_poll_duration_seconds", "Duration of the last poll")
+    for mode in ("full", "delta"):
+        if mode in counters["duration"]:
+            lines.append(f"ipam_exporter_poll_duration_seconds{_labels(mode=mode)} {counters['duration'][mode]:.3f}")
+    family("ipam_exporter_changed_objects_total", "Objects created, changed or removed since start", "counter")
+    lines.append(f"ipam_exporter_changed_objects_total {counters['changed']}")
+    family("ipam_exporter_last_poll_timestamp_seconds", "Unix time of the last successful poll")
+    lines.append(f"ipam_exporter_last_poll_timestamp_seconds {counters['last_poll']:.0f}")
+    return "\n".join(lines) + "\n"
+
+
+# --- Polling ---
+
+class UtilizationExporter:
+    def __init__(self, config_file="config.yaml", realm=None, full_every=30, block_metrics=True):
+        self.taker = SnapshotTaker(config_file)
+        self.client = self.taker.client
+        self.realm_name = realm
+        self.realm_filter = None
+        self.full_every = full_every
+        self.block_metrics = block_metrics
+        self.index = UtilizationIndex()
+        self.names = {}         # realm / pool id -> name, for labels
+        self.since = None       # newest updated_at seen
+        self.polls = 0
+        self.counters = {"changed": 0, "duration": {}, "last_poll": 0.0}
+        self.lock = threading.Lock()
+        self.text = ""
+
+    def _list(self, kind, updated_after=None):
+        filters = [f for f in (self.realm_filter,) if f]
+        if updated_after:
+            filters.append(f'updated_at>"{updated_after}"')
+        return self.taker.iter_kind(kind, _filter=" and ".join(filters) or None)
+
+    def _track(self, obj):
+        updated = obj.get("updated_at")
+        if updated and (self.since is None or updated > self.since):
+            self.since = updated
+
+    def _record(self, obj):
+        """BlockRecord for an API object, or None (with a warning) if it has no address/cidr."""
+        try:
+            return BlockRecord.from_api(obj)
+        except ValueError as e:
+            print(f"⚠️ Skipping {e}", flush=True)
+            return None
+
+    def _load_names(self):
+        realm_filter = f'name=="{self.realm_name}"' if self.realm_name else None
+        for realm in self.taker.iter_kind("federated_realm", _filter=realm_filter):
+            self.names[realm["id"]] = realm.get("name")
+            if self.realm_name:
+                self.realm_filter = f'federated_realm=="{realm["id"]}"'
+        if self.realm_name and not self.realm_filter:
+            raise ValueError(f"❌ Realm '{self.realm_name}' not found")
+        for pool in self._list("federated_pool"):
+            self.names[pool["id"]] = pool.get("name")
+
+    def poll_full(self):
+        """List everything; apply differences and drop objects that are gone."""
+        self._load_names()
+        initial = not self.index.objects
+        listed = []
+        for kind in KINDS:
+            for obj in self._list(kind):
+                self._track(obj)
+                rec = self._record(obj)
+                if rec:
+                    listed.append((kind, rec))
+        # Containers before their contents (blocks before reserved blocks of
+        # the same size), so nothing has to be re-parented on the first load
+        listed.sort(key=lambda item: (item[1].version, item[1].prefixlen, item[0] != "federated_block"))
+        seen = set()
+        changed = 0
+        for kind, rec in listed:
+            seen.add(rec.id)
+            changed += self.index.upsert(kind, rec, adopt=not initial)
+        del listed
+        for obj_id in [i for i in self.index.objects if i not in seen]:
+            self.index.remove(obj_id)
+            changed += 1
+        return changed
+
+    def poll_delta(self):
+        if self.since is None:
+            return self.poll_full(), "full"
+        since = datetime.fromisoformat(self.since.replace("Z", "+00:00")) - DELTA_OVERLAP
+        after = since.strftime("%Y-%m-%dT%H:%M:%SZ")
+        changed = 0
+        for kind in KINDS:
+            for obj in self._list(kind, updated_after=after):
+                self._track(obj)
+                rec = self._record(obj)
+                if rec:
+                    changed += self.index.upsert(kind, rec)
+        if changed:
+            for pool in self._list("federated_pool", updated_after=after):
+                self.names[pool["id"]] = pool.get("name")
+        return changed, "delta"
+
+    def poll(self):
+        start = time.monotonic()
+        try:
+            changed, mode = self._poll()
+        except requests.HTTPError as e:
+            if e.response is None or e.response.status_code != 401:
+                raise
+            print("🔄 Token expired, signing in again...", flush=True)
+            self.client.authenticate()
+            self.client.switch_account()
+            changed, mode = self._poll()
+        recomputed = self.index.refresh()
+        elapsed = time.monotonic() - start
+        self.polls += 1
+        self.counters["changed"] += changed
+        self.counters["duration"][mode] = elapsed
+        self.counters["last_poll"] = time.time()
+        text = render(self.index, self.names, self.counters, self.block_metrics)
+        with self.lock:
+            self.text = text
+        print(f"📊 {mode} poll: {changed} changed, {recomputed} blocks recomputed, "
+              f"{len(self.index.objects)} objects ({elapsed:.1f}s)", flush=True)
+
+    def _poll(self):
+        if self.polls % self.full_every == 0:
+            return self.poll_full(), "full"
+        return self.poll_delta()
+
+    def metrics(self):
+        with self.lock:
+            return self.text
+
+
+def serve(exporter, port):
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = exporter.metrics().encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("", port), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def write_textfile(path, text):
+    tmp = f"{path}.tmp"
+    with open(tmp, "w") as f:
+        f.write(text)
+    os.replace(tmp, path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Prometheus exporter for federated IPAM utilization")
+    parser.add_argument("--config", default="config.yaml", help="Config file path")
+    parser.add_argument("--realm", help="Only this realm (default: every realm in the tenant)")
+    parser.add_argument("--port", type=int, default=9187, help="Metrics port (default: 9187)")
+    parser.add_argument("--interval", type=float, default=60, help="Seconds between polls (default: 60)")
+    parser.add_argument("--full-every", type=int, default=30, help="Full resync every N polls, to catch deletions (default: 30)")
+    parser.add_argument("--no-block-metrics", action="store_true", help="Only export pool and realm series")
+    parser.add_argument("--textfile", help="Also write the metrics to this file after every poll")
+    parser.add_argument("--once", action="store_true", help="Poll once, print (or --textfile) the metrics and exit")
+    args = parser.parse_args()
+
+    exporter = UtilizationExporter(args.config, args.realm, max(1, args.full_every), not args.no_block_metrics)
+    if args.once:
+        # Progress goes to stderr so stdout is valid exposition text
+        with contextlib.redirect_stdout(sys.stderr):
+            exporter.client.authenticate()
+            exporter.client.switch_account()
+            exporter.poll()
+        if args.textfile:
+            write_textfile(args.textfile, exporter.metrics())
+        else:
+            sys.stdout.write(exporter.metrics())
+        return
+
+    exporter.client.authenticate()
+    exporter.client.switch_account()
+
+    serve(exporter, args.port)
+    print(f"🚀 Serving metrics on :{args.port}/metrics, polling every {args.interval:.0f}s", flush=True)
+    while True:
+        started = time.monotonic()
+        try:
+            exporter.poll()
+            if args.textfile:
+                write_textfile(args.textfile, exporter.metrics())
+        except requests.RequestException as e:
+            # Keep serving the last numbers; the timestamp metric shows they are stale
+            print(f"⚠️ Poll failed: {e}", flush=True)
+        time.sleep(max(0.0, args.interval - (time.monotonic() - started)))
+
+
+if __name__ == "__main__":
+    profiling.install()
+    main()
@@ -0,0 +1,287 @@
+#!/usr/bin/env python3
+"""
+Measure how long discovery takes to bring deployed VPCs into Infoblox IPAM.
+
+deploy_vpc_from_ipam.py ends with "After discovery sync (~15 min), VPC
+appears in Infoblox IPAM". This watcher takes one or many
+vpc_deployment_output.json files (e.g. every participant's work
+directory), polls IPAM until each VPC (address block) and subnet shows up,
+and records the latency per object, so the provider's sync_interval
+(register_aws_cloud_provider.py) can be tuned from real data.
+
+Polling is kept cheap: per sandbox and object kind, one request per round
+asks for all still-missing CIDRs at once (OR-ed _filter, _fields trimmed to
+what is needed), repeats it with If-None-Match when CSP sent an ETag (a 304
+costs no body), and stops asking for objects once they are found. One admin
+sign-in covers every sandbox (see fanout.py).
+
+Latency is measured from the AWS creation time recorded by
+deploy_vpc_from_ipam.py (or the output file's mtime for older files) to the
+IPAM object's created_at, falling back to when this watcher first saw it.
+An object created before the VPC (left over from an earlier VPC with the
+same CIDR) does not count; the watcher keeps waiting for the new one.
+Results are merged into --output across runs, so watchers for different
+participants or labs build one histogram.
+
+The watcher runs for up to --timeout, so it does not forward to agent.py
+(which runs one script at a time) and always runs as its own process;
+Ctrl-C stops it and still saves what was measured.
+
+Usage:
+  python3 watch_discovery_sync.py
+  python3 watch_discovery_sync.py work/*/vpc_deployment_output.json --interval 20
+  python3 watch_discovery_sync.py --report          # histogram of saved results only
+
+Output Files:
+  discovery_latency.json - Per-object latencies, merged across runs
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from fanout import FanOutExecutor, percentile
+import profiling
+
+# Where discovered objects land, by what deploy_vpc_from_ipam.py created
+OBJECT_ENDPOINTS = {
+    "vpc": "/api/ddi/v1/ipam/address_block",
+    "subnet": "/api/ddi/v1/ipam/subnet",
+}
+HISTOGRAM_BUCKETS = [60, 120, 300, 600, 900, 1200, 1800, 2700, 3600]
+FILTER_CHUNK = 50
+
+
+def _parse_time(value):
+    try:
+        return datetime.fromisoformat(value.replace("Z", "+00:00")).timestamp()
+    except (AttributeError, ValueError):
+        return None
+
+
+class WatchedObject:
+    __slots__ = ("sandbox_id", "kind", "aws_id", "address", "cidr", "source", "created_at",
+                 "seen_at", "ipam_created_at", "ipam_id")
+
+    def __init__(self, sandbox_id, kind, aws_id, cidr, source, created_at):
+        self.sandbox_id = sandbox_id
+        self.kind = kind
+        self.aws_id = aws_id
+        self.address, self.cidr = cidr.split("/")
+        self.source = source
+        self.created_at = created_at
+        self.seen_at = None
+        self.ipam_created_at = None
+        self.ipam_id = None
+
+    @property
+    def key(self):
+        return f"{self.sandbox_id}/{self.aws_id}"
+
+    @property
+    def latency(self):
+        if self.seen_at is None:
+            return None
+        return (self.ipam_created_at or self.seen_at) - self.created_at
+
+    def as_dict(self):
+        return {
+            "sandbox_id": self.sandbox_id, "kind": self.kind, "aws_id": self.aws_id,
+            "cidr": f"{self.address}/{self.cidr}", "source": self.source,
+            "created_at": self.created_at, "seen_at": self.seen_at, "ipam_created_at": self.ipam_created_at,
+            "ipam_id": self.ipam_id, "latency_s": round(self.latency, 1) if self.latency is not None else None,
+        }
+
+
+def load_deployments(paths, default_sandbox_file):
+    """WatchedObjects for the VPC and subnet in each output file."""
+    objects = []
+    for path in paths:
+        with open(path, "r") as f:
+            data = json.load(f)
+        sandbox_file = os.path.join(os.path.dirname(os.path.abspath(path)), "sandbox_id.txt")
+        if not os.path.exists(sandbox_file):
+            sandbox_file = default_sandbox_file
+        with open(sandbox_file, "r") as f:
+            sandbox_id = f.read().strip()
+        for kind in ("vpc", "subnet"):
+            obj = data.get(kind) or {}
+            if obj.get("id") and obj.get("cidr"):
+                objects.append(WatchedObject(sandbox_id, kind, obj["id"], obj["cidr"], path,
+                                             obj.get("created_at") or os.path.getmtime(path)))
+    return objects
+
+
+class SyncWatcher:
+    def __init__(self, executor, objects):
+        self.executor = executor
+        self.objects = objects
+        self.etags = {}         # (sandbox, kind, filter) -> ETag
+        self.requests = 0
+        self.not_modified = 0
+
+    def _query(self, sandbox_id, kind, pending):
+        """Ask once for all pending objects of a kind in one sandbox."""
+        url = f"{self.executor.base_url}{OBJECT_ENDPOINTS[kind]}"
+        found = []
+        for i in range(0, len(pending), FILTER_CHUNK):
+            chunk = pending[i:i + FILTER_CHUNK]
+            _filter = " or ".join(f'(address=="{o.address}" and cidr=={o.cidr})' for o in chunk)
+            etag_key = (sandbox_id, kind, _filter)
+            headers = dict(self.executor.sandbox_headers(sandbox_id))
+            if etag_key in self.etags:
+                headers["If-None-Match"] = self.etags[etag_key]
+            r = self.executor.session.get(url, headers=headers, params={
+                "_filter": _filter, "_fields": "id,address,cidr,created_at"})
+            self.requests += 1
+            if r.status_code == 401:
+                headers.update(self.executor.sandbox_headers(sandbox_id, refresh=True))
+                r = self.executor.session.get(url, headers=headers, params={
+                    "_filter": _filter, "_fields": "id,address,cidr,created_at"})
+                self.requests += 1
+            if r.status_code == 304:
+                self.not_modified += 1
+                continue
+            r.raise_for_status()
+            if r.headers.get("ETag"):
+                self.etags[etag_key] = r.headers["ETag"]
+            by_cidr = {f"{o['address']}/{o['cidr']}": o for o in r.json().get("results", [])}
+            now = time.time()
+            for o in chunk:
+                hit = by_cidr.get(f"{o.address}/{o.cidr}")
+                if not hit:
+                    continue
+                ipam_created_at = _parse_time(hit.get("created_at"))
+                if ipam_created_at and ipam_created_at < o.created_at:
+                    continue  # left over from an earlier VPC with this CIDR; keep waiting
+                o.seen_at = now
+                o.ipam_created_at = ipam_created_at
+                o.ipam_id = hit.get("id")
+                found.append(o)
+        return found
+
+    def poll(self, max_workers):
+        groups = {}
+        for o in self.objects:
+            if o.seen_at is None:
+                groups.setdefault((o.sandbox_id, o.kind), []).append(o)
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            futures = {key: pool.submit(self._query, key[0], key[1], pending) for key, pending in groups.items()}
+            for (sandbox_id, kind), future in futures.items():
+                try:
+                    for o in future.result():
+                        print(f"   ✅ {o.kind} {o.aws_id} {o.address}/{o.cidr} in IPAM after "
+                              f"{o.latency / 60:.1f} min ({sandbox_id})", flush=True)
+                except requests.RequestException as e:
+                    print(f"   ⚠️ {sandbox_id} {kind}: {e}", flush=True)
+
+    def pending(self):
+        return [o for o in self.objects if o.seen_at is None]
+
+
+def merge_results(path, objects):
+    """Saved results plus this run's, keyed by sandbox/AWS id (this run wins)."""
+    results = {}
+    if os.path.exists(path):
+        with open(path, "r") as f:
+            results = {r["sandbox_id"] + "/" + r["aws_id"]: r for r in json.load(f).get("objects", [])}
+    for o in objects:
+        if o.seen_at is not None or o.key not in results:
+            results[o.key] = o.as_dict()
+    return list(results.values())
+
+
+def print_histogram(results):
+    for kind in ("vpc", "subnet"):
+        latencies = sorted(r["latency_s"] for r in results if r["kind"] == kind and r["latency_s"] is not None)
+        missing = sum(1 for r in results if r["kind"] == kind and r["latency_s"] is None)
+        if not latencies:
+            print(f"   {kind}: no measurements ({missing} not seen)")
+            continue
+        print(f"   {kind}: n={len(latencies)}, p50 {percentile(latencies, 0.5) / 60:.1f} min, "
+              f"p90 {percentile(latencies, 0.9) / 60:.1f} min, "
+              f"max {latencies[-1] / 60:.1f} min" + (f", {missing} not seen" if missing else ""))
+        counts = []
+        lower = 0
+        for bound in HISTOGRAM_BUCKETS + [float("inf")]:
+            counts.append((lower, bound, sum(1 for v in latencies if lower <= v < bound)))
+            lower = bound
+        peak = max(c for _, _, c in counts) or 1
+        for lower, bound, count in counts:
+            if count or bound != float("inf"):
+                label = f"≥ {lower // 60:.0f} min" if bound == float("inf") else f"< {bound // 60:.0f} min"
+                print(f"      {label:>9} {'█' * round(30 * count / peak):<30} {count}")
+    vpcs = [r["latency_s"] for r in results if r["kind"] == "vpc" and r["latency_s"] is not None]
+    if vpcs:
+        # Discovery runs every sync_interval minutes, so the best case is about one interval
+        print(f"   💡 VPC p50 is {percentile(vpcs, 0.5) / 60:.1f} min; "
+              f"compare with sync_interval in register_aws_cloud_provider.py")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure discovery sync latency of deployed VPCs")
+    parser.add_argument("outputs", nargs="*", default=["vpc_deployment_output.json"],
+                        help="vpc_deployment_output.json files (default: ./vpc_deployment_output.json)")
+    parser.add_argument("--config", default="config.yaml", help="Config file path")
+    parser.add_argument("--sandbox-id-file", default="sandbox_id.txt",
+                        help="Sandbox of outputs without a sandbox_id.txt next to them")
+    parser.add_argument("--interval", type=float, default=15, help="Seconds between polls (default: 15)")
+    parser.add_argument("--timeout", type=float, default=3600, help="Give up after this many seconds (default: 3600)")
+    parser.add_argument("--max-workers", type=int, default=16, help="Sandboxes polled in parallel (default: 16)")
+    parser.add_argument("--output", default="discovery_latency.json", help="Results file (merged across runs)")
+    parser.add_argument("--report", action="store_true", help="Only print the histogram of saved results")
+    args = parser.parse_args()
+
+    if args.report:
+        results = merge_results(args.output, [])
+        print(f"📊 {len(results)} objects in {args.output}")
+        print_histogram(results)
+        return
+
+    objects = load_deployments(args.outputs, args.sandbox_id_file)
+    sandboxes = {o.sandbox_id for o in objects}
+    print(f"👀 Watching {len(objects)} objects from {len(args.outputs)} deployments in {len(sandboxes)} sandboxes")
+
+    executor = FanOutExecutor(args.config, max_workers=args.max_workers)
+    executor.authenticate()
+    watcher = SyncWatcher(executor, objects)
+
+    start = time.monotonic()
+    try:
+        while watcher.pending() and time.monotonic() - start < args.timeout:
+            round_start = time.monotonic()
+            watcher.poll(args.max_workers)
+            left = watcher.pending()
+            if left:
+                oldest = max(time.time() - o.created_at for o in left)
+                print(f"🕐 {len(left)} pending (oldest {oldest / 60:.1f} min), {watcher.requests} requests, "
+                      f"{watcher.not_modified} not modified", flush=True)
+                time.sleep(max(0.0, args.interval - (time.monotonic() - round_start)))
+    except KeyboardInterrupt:
+        print("\n⏹️ Interrupted; saving what was measured")
+
+    results = merge_results(args.output, objects)
+    with open(args.output, "w") as f:
+        json.dump({"updated_at": time.time(), "objects": results}, f, indent=2)
+
+    left = watcher.pending()
+    print(f"\n{'='*60}")
+    print("🎉 All objects synced!" if not left else f"⚠️ {len(left)} objects not seen in IPAM")
+    print(f"   This run:  {len(objects) - len(left)}/{len(objects)} seen, {watcher.requests} requests "
+          f"({watcher.not_modified} not modified), {time.monotonic() - start:.0f}s")
+    print(f"   Histogram over {len(results)} objects in {args.output}:")
+    print_histogram(results)
+    print(f"{'='*60}")
+    if left:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    profiling.install()
+    main()
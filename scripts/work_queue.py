@@ -0,0 +1,487 @@
+#!/usr/bin/env python3
+"""
+Durable provisioning work queue with lease-based workers.
+
+Instead of one process per step per participant started by the lab
+platform, each participant's setup is enqueued as a chain of tasks built
+from the existing scripts:
+
+  allocate → provision_user → deploy_ipam → create_pool → register_provider → deploy_vpc
+
+Workers on any number of runner nodes lease the next runnable task, run
+the step's script in the participant's working directory, and heartbeat
+the lease while it runs. A worker that dies simply lets its lease expire
+and another worker picks the task up. Failed tasks are retried with
+exponential backoff; after max attempts they are dead-lettered and the
+rest of that participant's chain is cancelled.
+
+Backends are pluggable: SQLite ships here (one file per host, or on a
+filesystem with working POSIX locks); register another QueueBackend
+subclass in BACKENDS for a shared database.
+
+Usage:
+  python3 work_queue.py enqueue --participant p-123 [--env BROKER_API_TOKEN=...]
+  python3 work_queue.py enqueue --manifest participants.csv
+  python3 work_queue.py work --concurrency 8
+  python3 work_queue.py stats [--json]
+  python3 work_queue.py dead
+  python3 work_queue.py retry-dead
+
+Environment Variables:
+  WORK_QUEUE_URL  - Backend URL (default: sqlite:///provisioning_queue.db)
+  WORK_QUEUE_DIR  - Root of per-participant working directories (default: work)
+"""
+
+import os
+import sys
+import csv
+import json
+import time
+import uuid
+import shutil
+import socket
+import random
+import sqlite3
+import argparse
+import threading
+import subprocess
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+
+import profiling
+
+SCRIPTS_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# (step, script argv) — run in order, each step waits for the previous one
+PIPELINE = [
+    ("allocate", ["allocation_subtenant.py"]),
+    ("provision_user", ["user_provision.py"]),
+    ("deploy_ipam", ["deploy_ipam.py"]),
+    ("create_pool", ["create_federated_pool.py"]),
+    ("register_provider", ["register_aws_cloud_provider.py", "--sandbox"]),
+    ("deploy_vpc", ["deploy_vpc_from_ipam.py"]),
+]
+STEPS = dict(PIPELINE)
+
+DEFAULT_URL = "sqlite:///provisioning_queue.db"
+LEASE_SECONDS = 120
+HEARTBEAT_SECONDS = 30
+MAX_ATTEMPTS = 4
+STEP_TIMEOUT = 1800
+THROUGHPUT_WINDOW = 300
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS tasks (
+    id            TEXT PRIMARY KEY,
+    participant   TEXT NOT NULL,
+    step          TEXT NOT NULL,
+    seq           INTEGER NOT NULL,
+    depends_on    TEXT,
+    workdir       TEXT NOT NULL,
+    env           TEXT NOT NULL DEFAULT '{}',
+    status        TEXT NOT NULL DEFAULT 'queued',
+    attempts      INTEGER NOT NULL DEFAULT 0,
+    max_attempts  INTEGER NOT NULL,
+    available_at  REAL NOT NULL,
+    lease_owner   TEXT,
+    lease_expires REAL,
+    created_at    REAL NOT NULL,
+    started_at    REAL,
+    finished_at   REAL,
+    last_error    TEXT
+);
+CREATE INDEX IF NOT EXISTS tasks_runnable ON tasks (status, available_at);
+CREATE INDEX IF NOT EXISTS tasks_participant ON tasks (participant, seq);
+"""
+
+
+class QueueBackend(ABC):
+    """Interface every queue backend implements."""
+
+    @abstractmethod
+    def enqueue_chain(self, participant, workdir, env, steps, max_attempts=MAX_ATTEMPTS):
+        """Insert one task per step, each depending on the previous. Returns the task ids."""
+
+    @abstractmethod
+    def lease(self, worker_id, lease_seconds=LEASE_SECONDS):
+        """Claim the next runnable task, or return None."""
+
+    @abstractmethod
+    def heartbeat(self, task_id, worker_id, lease_seconds=LEASE_SECONDS):
+        """Extend a lease. Returns False if the lease was lost."""
+
+    @abstractmethod
+    def complete(self, task_id, worker_id):
+        """Mark a leased task done."""
+
+    @abstractmethod
+    def fail(self, task_id, worker_id, error):
+        """Record a failed attempt; retry later or dead-letter. Returns the new status."""
+
+    @abstractmethod
+    def stats(self, window=THROUGHPUT_WINDOW):
+        """Queue depth, per-step counts and recent throughput."""
+
+    @abstractmethod
+    def dead_letters(self):
+        """Dead-lettered tasks, oldest first."""
+
+    @abstractmethod
+    def retry_dead(self):
+        """Requeue dead tasks and what they cancelled. Returns how many chains."""
+
+
+class SQLiteBackend(QueueBackend):
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        with self._connect() as db:
+            db.executescript(SCHEMA)
+
+    def _connect(self):
+        # One connection per thread; WAL lets readers run alongside a writer
+        db = getattr(self._local, "db", None)
+        if db is None:
+            db = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            db.row_factory = sqlite3.Row
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA busy_timeout=30000")
+            self._local.db = db
+        return db
+
+    def _write(self, fn):
+        """Run fn(db) in one IMMEDIATE transaction (takes the write lock up front)."""
+        db = self._connect()
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            result = fn(db)
+            db.execute("COMMIT")
+            return result
+        except Exception:
+            db.execute("ROLLBACK")
+            raise
+
+    @staticmethod
+    def _dead_letter(db, row, error, now):
+        db.execute("UPDATE tasks SET status='dead', finished_at=?, lease_owner=NULL, last_error=? WHERE id=?",
+                   (now, error, row["id"]))
+        # Nothing later in this participant's chain can run now
+        db.execute("UPDATE tasks SET status='cancelled', finished_at=? "
+                   "WHERE participant=? AND seq>? AND status='queued'",
+                   (now, row["participant"], row["seq"]))
+
+    def enqueue_chain(self, participant, workdir, env, steps, max_attempts=MAX_ATTEMPTS):
+        now = time.time()
+
+        def insert(db):
+            ids = []
+            previous = None
+            for seq, step in enumerate(steps):
+                task_id = uuid.uuid4().hex
+                db.execute(
+                    "INSERT INTO tasks (id, participant, step, seq, depends_on, workdir, env, max_attempts,"
+                    " available_at, created_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (task_id, participant, step, seq, previous, workdir, json.dumps(env), max_attempts, now, now))
+                ids.append(task_id)
+                previous = task_id
+            return ids
+
+        return self._write(insert)
+
+    def lease(self, worker_id, lease_seconds=LEASE_SECONDS):
+        def claim(db):
+            now = time.time()
+            # Expired leases go back to the queue (the worker died or hung),
+            # unless the task has used up its attempts: a step that keeps
+            # hanging or killing workers is dead-lettered like any failure
+            expired = db.execute("SELECT * FROM tasks WHERE status='leased' AND lease_expires < ?", (now,)).fetchall()
+            for row in expired:
+                if row["attempts"] >= row["max_attempts"]:
+                    self._dead_letter(db, row, f"lease expired on attempt {row['attempts']} (worker died or hung)", now)
+                else:
+                    db.execute("UPDATE tasks SET status='queued', lease_owner=NULL WHERE id=?", (row["id"],))
+            row = db.execute(
+                "SELECT t.* FROM tasks t LEFT JOIN tasks d ON d.id = t.depends_on "
+                "WHERE t.status='queued' AND t.available_at <= ? AND (t.depends_on IS NULL OR d.status='done') "
+                "ORDER BY t.available_at, t.seq LIMIT 1", (now,)).fetchone()
+            if row is None:
+                return None
+            db.execute("UPDATE tasks SET status='leased', lease_owner=?, lease_expires=?, attempts=attempts+1,"
+                       " started_at=COALESCE(started_at, ?) WHERE id=?",
+                       (worker_id, now + lease_seconds, now, row["id"]))
+            task = dict(row)
+            task["attempts"] += 1
+            task["env"] = json.loads(task["env"])
+            return task
+
+        return self._write(claim)
+
+    def heartbeat(self, task_id, worker_id, lease_seconds=LEASE_SECONDS):
+        cur = self._connect().execute(
+            "UPDATE tasks SET lease_expires=? WHERE id=? AND lease_owner=? AND status='leased'",
+            (time.time() + lease_seconds, task_id, worker_id))
+        return cur.rowcount == 1
+
+    def complete(self, task_id, worker_id):
+        self._connect().execute(
+            "UPDATE tasks SET status='done', finished_at=?, lease_owner=NULL, last_error=NULL "
+            "WHERE id=? AND lease_owner=?", (time.time(), task_id, worker_id))
+
+    def fail(self, task_id, worker_id, error):
+        def record(db):
+            row = db.execute("SELECT * FROM tasks WHERE id=? AND lease_owner=?", (task_id, worker_id)).fetchone()
+            if row is None:
+                return "lost"
+            now = time.time()
+            if row["attempts"] >= row["max_attempts"]:
+                self._dead_letter(db, row, error, now)
+                return "dead"
+            backoff = min(300, 10 * 2 ** (row["attempts"] - 1)) + random.uniform(0, 5)
+            db.execute("UPDATE tasks SET status='queued', available_at=?, lease_owner=NULL, last_error=? WHERE id=?",
+                       (now + backoff, error, task_id))
+            return "queued"
+
+        return self._write(record)
+
+    def stats(self, window=THROUGHPUT_WINDOW):
+        db = self._connect()
+        now = time.time()
+        by_status = {r["status"]: r["n"] for r in db.execute(
+            "SELECT status, COUNT(*) AS n FROM tasks GROUP BY status")}
+        by_step = {}
+        for r in db.execute("SELECT step, status, COUNT(*) AS n FROM tasks GROUP BY step, status"):
+            by_step.setdefault(r["step"], {})[r["status"]] = r["n"]
+        recent = db.execute(
+            "SELECT COUNT(*) AS n, AVG(finished_at - started_at) AS avg_s FROM tasks "
+            "WHERE status='done' AND finished_at >= ?", (now - window,)).fetchone()
+        oldest = db.execute("SELECT MIN(created_at) AS t FROM tasks WHERE status='queued'").fetchone()["t"]
+        return {
+            "depth": by_status.get("queued", 0),
+            "leased": by_status.get("leased", 0),
+            "done": by_status.get("done", 0),
+            "dead": by_status.get("dead", 0),
+            "cancelled": by_status.get("cancelled", 0),
+            "by_step": by_step,
+            "throughput_per_min": round(recent["n"] * 60 / window, 2),
+            "avg_task_s": round(recent["avg_s"], 1) if recent["avg_s"] is not None else None,
+            "oldest_queued_age_s": round(now - oldest, 1) if oldest else None,
+        }
+
+    def dead_letters(self):
+        rows = self._connect().execute(
+            "SELECT id, participant, step, attempts, last_error FROM tasks WHERE status='dead' ORDER BY finished_at")
+        return [dict(r) for r in rows]
+
+    def retry_dead(self):
+        def requeue(db):
+            now = time.time()
+            dead = db.execute("SELECT participant, seq FROM tasks WHERE status='dead'").fetchall()
+            for row in dead:
+                db.execute("UPDATE tasks SET status='queued', attempts=0, available_at=?, finished_at=NULL "
+                           "WHERE participant=? AND seq>=? AND status IN ('dead', 'cancelled')",
+                           (now, row["participant"], row["seq"]))
+            return len(dead)
+
+        return self._write(requeue)
+
+
+BACKENDS = {
+    "sqlite": lambda rest: SQLiteBackend(rest),
+}
+
+
+def open_backend(url=None):
+    """Open a backend from a URL like sqlite:///path/to/queue.db."""
+    url = url or os.environ.get("WORK_QUEUE_URL", DEFAULT_URL)
+    scheme, _, rest = url.partition("://")
+    if scheme not in BACKENDS:
+        raise ValueError(f"❌ Unknown work queue backend '{scheme}' (known: {', '.join(BACKENDS)})")
+    return BACKENDS[scheme](rest[1:] if rest.startswith("/") else rest)
+
+
+# --- Enqueue ---
+
+def prepare_workdir(participant, root=None):
+    """Per-participant working directory holding config.yaml and the step outputs."""
+    workdir = os.path.abspath(os.path.join(root or os.environ.get("WORK_QUEUE_DIR", "work"), participant))
+    os.makedirs(workdir, exist_ok=True)
+    config = os.path.join(workdir, "config.yaml")
+    if not os.path.exists(config):
+        shutil.copy(os.path.join(SCRIPTS_DIR, "config.yaml"), config)
+    return workdir
+
+
+def enqueue_participant(backend, participant, env=None, steps=None, max_attempts=MAX_ATTEMPTS):
+    env = {**(env or {}), "INSTRUQT_PARTICIPANT_ID": participant}
+    return backend.enqueue_chain(participant, prepare_workdir(participant), env,
+                                 steps or [step for step, _ in PIPELINE], max_attempts=max_attempts)
+
+
+# --- Workers ---
+
+class Worker:
+    def __init__(self, backend, worker_id=None, poll_interval=2.0, step_timeout=STEP_TIMEOUT):
+        self.backend = backend
+        self.worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+        self.poll_interval = poll_interval
+        self.step_timeout = step_timeout
+        self.stopping = threading.Event()
+
+    def _heartbeat(self, task, proc, done, lost):
+        while not done.wait(HEARTBEAT_SECONDS):
+            if not self.backend.heartbeat(task["id"], self.worker_id):
+                # Another worker may lease the task now; stop this copy of the step
+                print(f"⚠️ Lost lease on {task['participant']}/{task['step']}, stopping it", flush=True)
+                lost.set()
+                if proc.poll() is None:
+                    proc.kill()
+                return
+
+    def run_task(self, task):
+        argv = STEPS[task["step"]]
+        log_path = os.path.join(task["workdir"], f"{task['step']}.log")
+        # Steps must run in this child, not forward to agent.py: kill() on a
+        # timeout or lost lease would only stop the thin client, and every
+        # worker's steps would queue behind the agent's one-at-a-time lock
+        env = {**os.environ, **task["env"], "IPAM_AGENT": "0"}
+        print(f"▶️  {task['participant']}/{task['step']} (attempt {task['attempts']}) on {self.worker_id}", flush=True)
+
+        done = threading.Event()
+        lost = threading.Event()
+        start = time.monotonic()
+        try:
+            with open(log_path, "a") as log:
+                proc = subprocess.Popen([sys.executable, os.path.join(SCRIPTS_DIR, argv[0])] + argv[1:],
+                                        cwd=task["workdir"], env=env, stdout=log, stderr=subprocess.STDOUT)
+                threading.Thread(target=self._heartbeat, args=(task, proc, done, lost), daemon=True).start()
+                try:
+                    returncode = proc.wait(timeout=self.step_timeout)
+                except subprocess.TimeoutExpired:
+                    proc.kill()
+                    proc.wait()
+                    raise
+            error = None if returncode == 0 else f"exit code {returncode} (see {log_path})"
+        except subprocess.TimeoutExpired:
+            error = f"timed out after {self.step_timeout}s"
+        except Exception as e:
+            error = f"could not run step: {e}"
+        finally:
+            done.set()
+
+        elapsed = time.monotonic() - start
+        if lost.is_set():
+            print(f"🛑 {task['participant']}/{task['step']} stopped after {elapsed:.1f}s (lease lost)", flush=True)
+        elif error is None:
+            self.backend.complete(task["id"], self.worker_id)
+            print(f"✅ {task['participant']}/{task['step']} ({elapsed:.1f}s)", flush=True)
+        else:
+            status = self.backend.fail(task["id"], self.worker_id, error)
+            icon = "💀" if status == "dead" else "⚠️"
+            print(f"{icon} {task['participant']}/{task['step']}: {error} → {status}", flush=True)
+
+    def loop(self, drain=False):
+        """Lease and run tasks until stopped (or, with drain, until nothing is runnable)."""
+        while not self.stopping.is_set():
+            task = self.backend.lease(self.worker_id)
+            if task is None:
+                if drain:
+                    stats = self.backend.stats()
+                    if not stats["depth"] and not stats["leased"]:
+                        return
+                self.stopping.wait(self.poll_interval)
+                continue
+            try:
+                self.run_task(task)
+            except Exception as e:
+                # e.g. the backend was briefly unavailable; the lease expires
+                # and the task is retried, this worker keeps going
+                print(f"❌ {task['participant']}/{task['step']}: {e}", flush=True)
+
+
+def run_workers(backend, concurrency, drain=False):
+    workers = [Worker(backend) for _ in range(concurrency)]
+    print(f"👷 Starting {concurrency} workers on {socket.gethostname()}", flush=True)
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        futures = [pool.submit(w.loop, drain) for w in workers]
+        try:
+            for f in futures:
+                f.result()
+        except KeyboardInterrupt:
+            print("🛑 Stopping workers after their current task...", flush=True)
+            for w in workers:
+                w.stopping.set()
+
+
+def print_stats(stats):
+    print(f"\n{'='*60}")
+    print("📊 Provisioning Queue")
+    print(f"   Depth:       {stats['depth']}")
+    print(f"   Leased:      {stats['leased']}")
+    print(f"   Done:        {stats['done']}")
+    print(f"   Dead:        {stats['dead']} (+{stats['cancelled']} cancelled)")
+    print(f"   Throughput:  {stats['throughput_per_min']}/min (avg {stats['avg_task_s']}s per task)")
+    if stats["oldest_queued_age_s"] is not None:
+        print(f"   Oldest wait: {stats['oldest_queued_age_s']}s")
+    for step, _ in PIPELINE:
+        counts = stats["by_step"].get(step)
+        if counts:
+            print(f"   {step:18s} " + ", ".join(f"{k}={v}" for k, v in sorted(counts.items())))
+    print(f"{'='*60}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Durable provisioning work queue")
+    parser.add_argument("--url", help=f"Backend URL (default: $WORK_QUEUE_URL or {DEFAULT_URL})")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    enq = sub.add_parser("enqueue", help="Enqueue the provisioning chain for participants")
+    enq.add_argument("--participant", action="append", default=[], help="Participant ID (repeatable)")
+    enq.add_argument("--manifest", help="CSV with a participant_id column")
+    enq.add_argument("--steps", nargs="+", choices=list(STEPS), help="Subset of steps (default: all, in order)")
+    enq.add_argument("--env", action="append", default=[], help="KEY=VALUE passed to every step (repeatable)")
+    enq.add_argument("--max-attempts", type=int, default=MAX_ATTEMPTS, help=f"Attempts before dead-lettering (default: {MAX_ATTEMPTS})")
+
+    work = sub.add_parser("work", help="Run lease-based workers")
+    work.add_argument("--concurrency", type=int, default=4, help="Workers in this process (default: 4)")
+    work.add_argument("--drain", action="store_true", help="Exit once nothing is runnable or leased")
+
+    st = sub.add_parser("stats", help="Queue depth and throughput")
+    st.add_argument("--json", action="store_true", help="Print stats as JSON")
+    sub.add_parser("dead", help="List dead-lettered tasks")
+    sub.add_parser("retry-dead", help="Requeue dead-lettered tasks and their cancelled successors")
+    args = parser.parse_args()
+
+    backend = open_backend(args.url)
+
+    if args.command == "enqueue":
+        participants = list(args.participant)
+        if args.manifest:
+            with open(args.manifest, newline="") as f:
+                participants.extend(row["participant_id"].strip() for row in csv.DictReader(f)
+                                    if row.get("participant_id", "").strip())
+        if not participants:
+            parser.error("enqueue needs --participant or --manifest")
+        env = dict(item.split("=", 1) for item in args.env)
+        steps = [s for s, _ in PIPELINE if s in args.steps] if args.steps else None
+        for participant in participants:
+            enqueue_participant(backend, participant, env=env, steps=steps, max_attempts=args.max_attempts)
+        print(f"✅ Enqueued {len(participants)} participants ({len(steps or PIPELINE)} steps each)")
+    elif args.command == "work":
+        run_workers(backend, args.concurrency, drain=args.drain)
+        print_stats(backend.stats())
+    elif args.command == "stats":
+        stats = backend.stats()
+        if args.json:
+            print(json.dumps(stats, indent=2))
+        else:
+            print_stats(stats)
+    elif args.command == "dead":
+        for task in backend.dead_letters():
+            print(f"💀 {task['participant']}/{task['step']} after {task['attempts']} attempts: {task['last_error']}")
+    elif args.command == "retry-dead":
+        print(f"♻️ Requeued {backend.retry_dead()} dead-lettered tasks")
+
+
+if __name__ == "__main__":
+    profiling.install()
+    main()